@@ -4,37 +4,23 @@ try:
     from playsound import playsound
 except ImportError:
     playsound = None
-try:
-    import requests
-except ImportError:
-    requests = None
 
-import json
 import shutil
 import os
-import hashlib
-import secrets
+import threading
 from datetime import datetime
-try:
-    from PIL import Image, ImageTk
-except ImportError:
-    Image = None
-    ImageTk = None
-
-DB_FILE = "users.json"
-
-def load_users():
-    if not os.path.exists(DB_FILE):
-        return {}
-    try:
-        with open(DB_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return {}
-
-def save_users(users_data):
-    with open(DB_FILE, "w", encoding="utf-8") as f:
-        json.dump(users_data, f, indent=4, ensure_ascii=False)
+from storage import user_change
+from ledger import BankLedger, LedgerError, open_store
+from bulk_import import import_csv
+from records import CREDIT_TYPES, from_minor
+from statements import describe_transaction, generate_all
+from audit import audit, report_lines
+from fx_rates import ER_API_URL, RateProvider, rate_source
+from thumbnails import Image, ImageTk, PhotoCache, make_thumbnail
+
+FX_CACHE_FILE = "fx_rates.json"
+# Point at a local stub server or a JSON file to run without the public API.
+FX_SOURCE = os.environ.get("ATM_FX_SOURCE", ER_API_URL)
 
 class AnimatedButton(ttk.Button):
     def __init__(self, master=None, **kwargs):
@@ -54,6 +40,32 @@ class AnimatedButton(ttk.Button):
             return
         self.configure(padding=(10, 10))
 
+class ScreenManager:
+    # Each screen is built once and then swapped in and out with pack; the
+    # refresh callback pushes whatever changed into the retained widgets.
+    def __init__(self, root):
+        self.root = root
+        self.frames = {}
+        self.current = None
+
+    def show(self, name, build, refresh=None):
+        frame = self.frames.get(name)
+        if frame is None:
+            frame = self.frames[name] = build()
+        if self.current != name:
+            if self.current is not None:
+                self.frames[self.current].pack_forget()
+            frame.pack(expand=True, fill="both")
+            self.current = name
+        if refresh:
+            refresh()
+
+    def reset(self):
+        for frame in self.frames.values():
+            frame.destroy()
+        self.frames.clear()
+        self.current = None
+
 class ATM_App:
     def __init__(self, root_window):
         self.root = root_window
@@ -97,8 +109,15 @@ class ATM_App:
         else:
             self.click_sound_path = None
 
-        self.users = load_users()
+        self.store = open_store()
+        self.ledger = BankLedger(self.store)
+        self.photo_cache = PhotoCache()
+        self.fx_rates = RateProvider(rate_source(FX_SOURCE), cache_path=FX_CACHE_FILE, defaults={("USD", "GEL"): 2.80})
+        if self.fx_rates.is_stale():
+            self.fx_rates.refresh_async()
         self.current_user = None
+        self.screens = ScreenManager(self.root)
+        self.balance_job = None
         self.create_main_screen()
 
     def apply_theme(self):
@@ -167,10 +186,6 @@ class ATM_App:
         self.apply_theme()
         self.last_screen_func()
 
-    def clear_frame(self):
-        for widget in self.root.winfo_children():
-            widget.destroy()
-
     def play_click_sound(self):
         if playsound and self.click_sound_path:
             try:
@@ -185,12 +200,12 @@ class ATM_App:
         return wrapper
 
     def create_main_screen(self):
-        self.clear_frame()
         self.last_screen_func = self.create_main_screen
         self.current_user = None
+        self.screens.show("main", self.build_main_screen, self.refresh_main_screen)
 
+    def build_main_screen(self):
         frame = ttk.Frame(self.root, padding=40)
-        frame.pack(expand=True, fill="both")
 
         ttk.Label(frame, text="🏦", font=("Segoe UI Emoji", 48)).pack(pady=(0, 10))
         ttk.Label(frame, text="Welcome to Bank", style="Header.TLabel").pack(pady=(0, 5))
@@ -201,14 +216,19 @@ class ATM_App:
         ttk.Separator(frame, orient='horizontal').pack(pady=25, fill='x')
         AnimatedButton(frame, text="Exit Application", command=self.with_sound(self.root.quit), cursor="hand2").pack(pady=10, fill='x')
         
+        self.main_theme_btn = AnimatedButton(frame, style="Link.TButton", command=self.with_sound(self.toggle_theme), cursor="hand2")
+        self.main_theme_btn.pack(pady=5)
+        return frame
+
+    def refresh_main_screen(self):
         theme_text = "🌙 Dark Mode" if self.current_theme == "light" else "☀️ Light Mode"
-        AnimatedButton(frame, text=theme_text, style="Link.TButton", command=self.with_sound(self.toggle_theme), cursor="hand2").pack(pady=5)
+        self.main_theme_btn.config(text=theme_text)
 
     def register_screen(self):
-        self.clear_frame()
+        self.screens.show("register", self.build_register_screen, self.refresh_register_screen)
 
+    def build_register_screen(self):
         frame = ttk.Frame(self.root, padding=30)
-        frame.pack(expand=True, fill="both")
 
         ttk.Label(frame, text="Create Your Account", style="Header.TLabel").pack(pady=(20, 30))
 
@@ -222,6 +242,11 @@ class ATM_App:
 
         AnimatedButton(frame, text="Register", command=self.with_sound(self.handle_register), cursor="hand2").pack(fill='x', pady=10)
         AnimatedButton(frame, text="Back to Main Menu", command=self.with_sound(self.create_main_screen), cursor="hand2").pack(fill='x', pady=10)
+        return frame
+
+    def refresh_register_screen(self):
+        self.reg_username_entry.delete(0, "end")
+        self.reg_password_entry.delete(0, "end")
 
     def handle_register(self):
         username = self.reg_username_entry.get()
@@ -231,30 +256,19 @@ class ATM_App:
             messagebox.showerror("Error", "Please fill in all fields.")
             return
 
-        if username in self.users:
-            messagebox.showerror("Error", "A user with this name already exists.")
+        try:
+            self.ledger.register(username, password)
+        except LedgerError as e:
+            self.show_ledger_error(e)
             return
-
-        salt = secrets.token_hex(16)
-        hashed_password = hashlib.sha256((password + salt).encode('utf-8')).hexdigest()
-
-        self.users[username] = {
-            "auth": {
-                "salt": salt,
-                "hash": hashed_password
-            },
-            "balance": 0,
-            "transactions": []
-        }
-        save_users(self.users)
         messagebox.showinfo("Success", "Registration successful. You can now log in.")
         self.login_screen()
 
     def login_screen(self):
-        self.clear_frame()
+        self.screens.show("login", self.build_login_screen, self.refresh_login_screen)
 
+    def build_login_screen(self):
         frame = ttk.Frame(self.root, padding=30)
-        frame.pack(expand=True, fill="both")
 
         ttk.Label(frame, text="Welcome Back", style="Header.TLabel").pack(pady=(20, 30))
 
@@ -271,38 +285,17 @@ class ATM_App:
 
         forgot_password_btn = AnimatedButton(frame, text="Forgot Password?", style="Link.TButton", command=self.with_sound(self.forgot_password_screen), cursor="hand2")
         forgot_password_btn.pack(pady=(20, 0))
+        return frame
+
+    def refresh_login_screen(self):
+        self.login_username_entry.delete(0, "end")
+        self.login_password_entry.delete(0, "end")
 
     def handle_login(self):
         username = self.login_username_entry.get()
         password = self.login_password_entry.get()
 
-        user_data = self.users.get(username)
-
-        if not user_data:
-            messagebox.showerror("Error", "Incorrect username or password.")
-            return
-
-        is_login_successful = False
-        if "auth" in user_data:
-            salt = user_data["auth"]["salt"]
-            stored_hash = user_data["auth"]["hash"]
-            entered_hash = hashlib.sha256((password + salt).encode('utf-8')).hexdigest()
-            if entered_hash == stored_hash:
-                is_login_successful = True
-        elif "password" in user_data and user_data["password"] == password:
-            is_login_successful = True
-            
-            salt = secrets.token_hex(16)
-            hashed_password = hashlib.sha256((password + salt).encode('utf-8')).hexdigest()
-            
-            user_data["auth"] = {
-                "salt": salt,
-                "hash": hashed_password
-            }
-            del user_data["password"]
-            save_users(self.users)
-
-        if is_login_successful:
+        if self.ledger.authenticate(username, password):
             self.current_user = username
             self.account_screen()
         else:
@@ -314,7 +307,7 @@ class ATM_App:
         if not username:
             return
 
-        if username not in self.users:
+        if not self.store.has_user(username):
             messagebox.showerror("Error", "User not found.")
             return
 
@@ -332,47 +325,31 @@ class ATM_App:
             messagebox.showerror("Error", "Passwords do not match. Please try again.")
             return
 
-        salt = secrets.token_hex(16)
-        hashed_password = hashlib.sha256((new_password + salt).encode('utf-8')).hexdigest()
-
-        self.users[username]["auth"] = {
-            "salt": salt,
-            "hash": hashed_password
-        }
-
-        if "password" in self.users[username]:
-            del self.users[username]["password"]
-
-        save_users(self.users)
+        try:
+            self.ledger.set_password(username, new_password)
+        except LedgerError as e:
+            self.show_ledger_error(e)
+            return
         messagebox.showinfo("Success", "Your password has been successfully updated. You can now log in with your new password.")
         self.login_screen()
 
     def account_screen(self):
-        self.clear_frame()
         self.last_screen_func = self.account_screen
+        self.screens.show("account", self.build_account_screen, self.refresh_account_screen)
 
+    def build_account_screen(self):
         frame = ttk.Frame(self.root, padding=(30, 20))
-        frame.pack(expand=True, fill="both")
 
         if Image and ImageTk:
-            pic_path = self.users[self.current_user].get("profile_pic")
-            if pic_path and os.path.exists(pic_path):
-                img = Image.open(pic_path)
-            else:
-                img = Image.new('RGB', (100, 100), color=self.colors['light_text'])
-            
-            img = img.resize((100, 100), Image.Resampling.LANCZOS)
-            self.profile_photo = ImageTk.PhotoImage(img)
-            ttk.Label(frame, image=self.profile_photo).pack(pady=(0, 10))
+            self.profile_label = ttk.Label(frame)
+            self.profile_label.pack(pady=(0, 10))
             AnimatedButton(frame, text="📷 Upload Photo", style="Link.TButton", command=self.with_sound(self.upload_profile_pic), cursor="hand2").pack(pady=(0, 10))
 
-        balance = self.users[self.current_user]["balance"]
-        ttk.Label(frame, text=f"Welcome, {self.current_user}!", font=("Segoe UI", 18, "bold"), foreground=self.colors["text"]).pack(pady=(5, 2))
+        self.welcome_var = tk.StringVar()
+        self.balance_var = tk.StringVar()
+        ttk.Label(frame, textvariable=self.welcome_var, font=("Segoe UI", 18, "bold")).pack(pady=(5, 2))
         ttk.Label(frame, text="Available Balance", style="Subheader.TLabel").pack()
-        self.balance_label = ttk.Label(frame, text=f"{balance:,.2f} GEL", style="Balance.TLabel")
-        self.balance_label.pack(pady=(5, 20))
-
-        self.auto_update_balance()
+        ttk.Label(frame, textvariable=self.balance_var, style="Balance.TLabel").pack(pady=(5, 20))
         
         buttons_frame = ttk.Frame(frame)
         buttons_frame.pack(fill='x', pady=10)
@@ -388,27 +365,83 @@ class ATM_App:
         AnimatedButton(buttons_frame, text="Converter", command=self.with_sound(self.currency_converter), cursor="hand2").grid(row=2, column=0, padx=5, pady=5, sticky="nsew")
         AnimatedButton(buttons_frame, text="Password", command=self.with_sound(self.change_password), cursor="hand2").grid(row=2, column=1, padx=5, pady=5, sticky="nsew")
         
-        if self.current_user == "admin":
-            AnimatedButton(frame, text="👑 Admin Panel", command=self.with_sound(self.admin_panel_screen), cursor="hand2").pack(pady=5, fill='x')
+        self.admin_btn = AnimatedButton(frame, text="👑 Admin Panel", command=self.with_sound(self.admin_panel_screen), cursor="hand2")
         
-        AnimatedButton(frame, text="Logout", command=self.with_sound(self.create_main_screen), cursor="hand2").pack(pady=20, fill='x')
+        self.logout_btn = AnimatedButton(frame, text="Logout", command=self.with_sound(self.create_main_screen), cursor="hand2")
+        self.logout_btn.pack(pady=20, fill='x')
         
-        theme_text = "🌙" if self.current_theme == "light" else "☀️"
-        AnimatedButton(frame, text=theme_text, style="Link.TButton", command=self.with_sound(self.toggle_theme), cursor="hand2").place(relx=0.9, rely=0.02, anchor="ne")
+        self.account_theme_btn = AnimatedButton(frame, style="Link.TButton", command=self.with_sound(self.toggle_theme), cursor="hand2")
+        self.account_theme_btn.place(relx=0.9, rely=0.02, anchor="ne")
+        return frame
+
+    def refresh_account_screen(self):
+        if Image and ImageTk:
+            thumb_path = self.profile_thumbnail()
+            if thumb_path:
+                self.profile_photo = self.photo_cache.thumbnail(self.current_user, thumb_path)
+            else:
+                self.profile_photo = self.photo_cache.placeholder(self.colors['light_text'])
+            self.profile_label.config(image=self.profile_photo)
+
+        balance = self.store.get_user(self.current_user)["balance"]
+        self.welcome_var.set(f"Welcome, {self.current_user}!")
+        self.balance_var.set(f"{balance:,.2f} GEL")
+
+        if self.current_user == "admin":
+            self.admin_btn.pack(pady=5, fill='x', before=self.logout_btn)
+        else:
+            self.admin_btn.pack_forget()
+
+        self.account_theme_btn.config(text="🌙" if self.current_theme == "light" else "☀️")
+
+        if self.balance_job is None:
+            self.auto_update_balance()
 
     def auto_update_balance(self):
+        self.balance_job = None
+        if self.screens.current != "account" or not self.current_user:
+            return
         try:
-            if not hasattr(self, 'balance_label') or not self.balance_label.winfo_exists():
-                return
-            
-            self.users = load_users()
-            if self.current_user in self.users:
-                balance = self.users[self.current_user]["balance"]
-                self.balance_label.config(text=f"{balance:,.2f} GEL")
-            
-            self.root.after(5000, self.auto_update_balance)
-        except Exception:
-            pass
+            changed = self.store.poll_changes(blocking=False)
+            if changed is None or self.current_user in changed:
+                user_data = self.store.get_user(self.current_user)
+                if user_data:
+                    balance = user_data["balance"]
+                    self.balance_var.set(f"{balance:,.2f} GEL")
+        except Exception as e:
+            print(f"Warning: Could not refresh balance. {e}")
+        self.balance_job = self.root.after(1000, self.auto_update_balance)
+
+    def profile_pics_dir(self):
+        save_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profile_pics")
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir)
+        return save_dir
+
+    def create_thumbnail(self, pic_path):
+        thumbs_dir = os.path.join(self.profile_pics_dir(), "thumbs")
+        if not os.path.exists(thumbs_dir):
+            os.makedirs(thumbs_dir)
+        thumb_name = os.path.splitext(os.path.basename(pic_path))[0] + ".png"
+        return make_thumbnail(pic_path, os.path.join(thumbs_dir, thumb_name))
+
+    def profile_thumbnail(self):
+        user_data = self.store.get_user(self.current_user)
+        thumb_path = user_data.get("profile_thumb")
+        if thumb_path and os.path.exists(thumb_path):
+            return thumb_path
+
+        # Pictures uploaded before thumbnails existed get one on first view.
+        pic_path = user_data.get("profile_pic")
+        if not pic_path or not os.path.exists(pic_path):
+            return None
+        try:
+            thumb_path = self.create_thumbnail(pic_path)
+        except Exception as e:
+            print(f"Warning: Could not create thumbnail. {e}")
+            return None
+        self.store.commit([user_change(self.current_user, fields={"profile_thumb": thumb_path})])
+        return thumb_path
 
     def upload_profile_pic(self):
         if not Image:
@@ -419,9 +452,7 @@ class ATM_App:
         if not file_path:
             return
             
-        save_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profile_pics")
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir)
+        save_dir = self.profile_pics_dir()
             
         ext = os.path.splitext(file_path)[1]
         new_filename = f"{self.current_user}_{int(datetime.now().timestamp())}{ext}"
@@ -429,29 +460,14 @@ class ATM_App:
         
         try:
             shutil.copy(file_path, dest_path)
-            self.users[self.current_user]["profile_pic"] = dest_path
-            save_users(self.users)
+            thumb_path = self.create_thumbnail(dest_path)
+            self.store.commit([user_change(self.current_user, fields={"profile_pic": dest_path, "profile_thumb": thumb_path})])
             self.account_screen()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to upload: {e}")
 
     def get_usd_to_gel_rate(self):
-        default_rate = 2.80
-        if not requests:
-            return default_rate
-        try:
-            url = "https://open.er-api.com/v6/latest/USD"
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()  
-            data = response.json()
-            rate = data.get("rates", {}).get("GEL")
-            if rate:
-                return float(rate)
-        except requests.exceptions.RequestException as e:
-            print(f"Warning: Could not fetch currency rate from API: {e}. Using default rate.")
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}. Using default rate.")
-        return default_rate
+        return self.fx_rates.rate("USD", "GEL")
 
     def currency_converter(self):
         rate = self.get_usd_to_gel_rate()
@@ -460,64 +476,40 @@ class ATM_App:
             amount_gel = amount_usd * rate
             messagebox.showinfo("Conversion Result", f"{amount_usd:.2f} USD is approximately {amount_gel:.2f} GEL.")
 
+    def show_ledger_error(self, error):
+        messagebox.showerror(error.title, str(error))
+
     def deposit(self):
         amount = simpledialog.askfloat("Deposit", "Enter amount:", parent=self.root, minvalue=0.01)
         if amount is not None:
-            self.users[self.current_user]["balance"] += amount
-            transaction = {
-                "timestamp": datetime.now().isoformat(),
-                "type": "deposit",
-                "amount": amount
-            }
-            self.users[self.current_user]["transactions"].append(transaction)
-            save_users(self.users)
+            try:
+                self.ledger.deposit(self.current_user, amount)
+            except LedgerError as e:
+                self.show_ledger_error(e)
+                return
             messagebox.showinfo("Success", f"{amount:.2f} GEL has been deposited.")
             self.account_screen()
 
     def withdraw(self):
         amount = simpledialog.askfloat("Withdraw", "Enter amount:", parent=self.root, minvalue=0.01)
-        if amount is not None:
-            current_balance = self.users[self.current_user]["balance"]
-            min_balance = 10.00
-            if current_balance - amount < min_balance:
-                messagebox.showerror("Error", f"Insufficient funds. You must maintain a minimum balance of {min_balance:.2f} GEL.")
-                return
+        if amount is None:
+            return
 
-            daily_limit = 1000.00
-            today_str = datetime.now().strftime('%Y-%m-%d')
-            withdrawn_today = 0.0
-            
-            for tx in self.users[self.current_user]["transactions"]:
-                if isinstance(tx, dict) and tx.get("type") == "withdrawal":
-                    tx_date = datetime.fromisoformat(tx["timestamp"]).strftime('%Y-%m-%d')
-                    if tx_date == today_str:
-                        withdrawn_today += tx.get("amount", 0)
-            
-            if withdrawn_today + amount > daily_limit:
-                remaining_limit = max(0, daily_limit - withdrawn_today)
-                messagebox.showerror("Limit Exceeded", f"Daily withdrawal limit is {daily_limit:.2f} GEL.\nYou have withdrawn {withdrawn_today:.2f} GEL today.\nRemaining limit: {remaining_limit:.2f} GEL.")
-                return
+        try:
+            self.ledger.withdraw(self.current_user, amount)
+        except LedgerError as e:
+            self.show_ledger_error(e)
+            return
 
-            if amount <= current_balance:
-                self.users[self.current_user]["balance"] -= amount
-                transaction = {
-                    "timestamp": datetime.now().isoformat(),
-                    "type": "withdrawal",
-                    "amount": amount
-                }
-                self.users[self.current_user]["transactions"].append(transaction)
-                save_users(self.users)
-                messagebox.showinfo("Success", f"{amount:.2f} GEL has been withdrawn.")
-                self.account_screen()
-            else:
-                messagebox.showerror("Error", "Insufficient funds on your balance.")
+        messagebox.showinfo("Success", f"{amount:.2f} GEL has been withdrawn.")
+        self.account_screen()
 
     def transfer(self):
         recipient_name = simpledialog.askstring("Transfer", "Enter recipient username:", parent=self.root)
         if not recipient_name:
             return
         
-        if recipient_name not in self.users:
+        if not self.store.has_user(recipient_name):
             messagebox.showerror("Error", "Recipient not found.")
             return
             
@@ -526,39 +518,24 @@ class ATM_App:
             return
 
         amount = simpledialog.askfloat("Transfer", "Enter amount:", parent=self.root, minvalue=0.01)
-        if amount is not None:
-            current_balance = self.users[self.current_user]["balance"]
-            if amount <= current_balance:
-                self.users[self.current_user]["balance"] -= amount
-                self.users[self.current_user]["transactions"].append({"timestamp": datetime.now().isoformat(), "type": "transfer_out", "amount": amount, "to": recipient_name})
+        if amount is None:
+            return
 
-                self.users[recipient_name]["balance"] += amount
-                self.users[recipient_name]["transactions"].append({"timestamp": datetime.now().isoformat(), "type": "transfer_in", "amount": amount, "from": self.current_user})
+        try:
+            self.ledger.transfer(self.current_user, recipient_name, amount)
+        except LedgerError as e:
+            self.show_ledger_error(e)
+            return
 
-                save_users(self.users)
-                messagebox.showinfo("Success", f"{amount:.2f} GEL transferred to {recipient_name}.")
-                self.account_screen()
-            else:
-                messagebox.showerror("Error", "Insufficient funds.")
+        messagebox.showinfo("Success", f"{amount:.2f} GEL transferred to {recipient_name}.")
+        self.account_screen()
 
     def change_password(self):
         current_password = simpledialog.askstring("Change Password", "Enter current password:", parent=self.root, show='*')
         if not current_password:
             return
 
-        user_data = self.users[self.current_user]
-        is_valid = False
-        
-        if "auth" in user_data:
-            salt = user_data["auth"]["salt"]
-            stored_hash = user_data["auth"]["hash"]
-            entered_hash = hashlib.sha256((current_password + salt).encode('utf-8')).hexdigest()
-            if entered_hash == stored_hash:
-                is_valid = True
-        elif "password" in user_data and user_data["password"] == current_password:
-            is_valid = True
-
-        if not is_valid:
+        if not self.ledger.check_password(self.current_user, current_password):
             messagebox.showerror("Error", "Incorrect current password.")
             return
 
@@ -574,89 +551,127 @@ class ATM_App:
             messagebox.showerror("Error", "Passwords do not match.")
             return
 
-        salt = secrets.token_hex(16)
-        hashed_password = hashlib.sha256((new_password + salt).encode('utf-8')).hexdigest()
-
-        self.users[self.current_user]["auth"] = {
-            "salt": salt,
-            "hash": hashed_password
-        }
-        
-        if "password" in self.users[self.current_user]:
-            del self.users[self.current_user]["password"]
-
-        save_users(self.users)
+        self.ledger.set_password(self.current_user, new_password)
         messagebox.showinfo("Success", "Password changed successfully.")
 
+    def format_history_row(self, tx):
+        if isinstance(tx, str):
+            return ("", "", "", tx), "black"
+        ts, tx_type, amount, details = describe_transaction(tx)
+        tag = "green" if tx.get('type') in CREDIT_TYPES else "red"
+        return (ts, tx_type, f"{from_minor(amount):+.2f} GEL", details), tag
+
     def show_history(self):
-        history = self.users[self.current_user]["transactions"]
-        if not history:
+        if not self.store.transaction_count(self.current_user):
             messagebox.showinfo("History", "No transactions found.")
             return
 
         history_window = tk.Toplevel(self.root)
         history_window.title("Transaction History")
-        history_window.geometry("500x500")
+        history_window.geometry("600x500")
         history_window.configure(bg=self.colors["bg"])
 
         ttk.Label(history_window, text="Transaction History", style="Header.TLabel").pack(pady=20)
 
-        text_frame = ttk.Frame(history_window, padding=10)
-        text_frame.pack(fill="both", expand=True)
-        
-        history_text_widget = tk.Text(text_frame, height=15, width=50, font=("Consolas", 11), 
-                                    bg=self.colors["entry_bg"], 
-                                    fg=self.colors["text"],
-                                    relief="solid", borderwidth=1, padx=10, pady=10)
-        history_text_widget.pack(side="left", fill="both", expand=True)
-        
-        scrollbar = ttk.Scrollbar(text_frame, orient="vertical", command=history_text_widget.yview)
+        filter_frame = ttk.Frame(history_window, padding=(10, 0))
+        filter_frame.pack(fill="x")
+
+        categories = {"All": None, "Deposit": "deposit", "Withdrawal": "withdrawal", "Transfer": "transfer", "Other": "other"}
+        category_var = tk.StringVar(value="All")
+        ttk.Combobox(filter_frame, textvariable=category_var, values=list(categories), state="readonly", width=11).pack(side="left", padx=(0, 5))
+        ttk.Label(filter_frame, text="From").pack(side="left")
+        since_entry = ttk.Entry(filter_frame, width=11)
+        since_entry.pack(side="left", padx=5)
+        ttk.Label(filter_frame, text="To").pack(side="left")
+        until_entry = ttk.Entry(filter_frame, width=11)
+        until_entry.pack(side="left", padx=5)
+
+        tree_frame = ttk.Frame(history_window, padding=10)
+        tree_frame.pack(fill="both", expand=True)
+
+        columns = ("date", "type", "amount", "details")
+        tree = ttk.Treeview(tree_frame, columns=columns, show="headings")
+        tree.heading("date", text="Date")
+        tree.heading("type", text="Type")
+        tree.heading("amount", text="Amount")
+        tree.heading("details", text="Details")
+        tree.column("date", width=150)
+        tree.column("type", width=90)
+        tree.column("amount", width=120, anchor="e")
+        tree.column("details", width=160)
+
+        tree.tag_configure("green", foreground=self.colors["success"])
+        tree.tag_configure("red", foreground="#f5365c")
+        tree.tag_configure("black", foreground=self.colors["light_text"])
+
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
         scrollbar.pack(side="right", fill="y")
-        history_text_widget.config(yscrollcommand=scrollbar.set)
-        
-        history_text_widget.tag_config("green", foreground=self.colors["success"])
-        history_text_widget.tag_config("red", foreground="#f5365c")
-        history_text_widget.tag_config("black", foreground=self.colors["light_text"])
+        tree.pack(side="left", fill="both", expand=True)
 
-        for tx in reversed(history):
-            if isinstance(tx, dict):
-                try:
-                    ts = datetime.fromisoformat(tx['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
-                    
-                    raw_type = tx.get('type', 'unknown')
-                    if raw_type == 'transfer_out':
-                        tx_type = "Transfer"
-                    elif raw_type == 'transfer_in':
-                        tx_type = "Transfer"
-                    else:
-                        tx_type = raw_type.capitalize()
-                    
-                    amount = tx.get('amount', 0.0)
-                    
-                    if raw_type in ["deposit", "transfer_in"]:
-                        sign = "+"
-                        tag = "green"
-                    else:
-                        sign = "-"
-                        tag = "red"
-                    
-                    details = ""
-                    if "to" in tx:
-                        details = f" (To: {tx['to']})"
-                    elif "from" in tx:
-                        details = f" (From: {tx['from']})"
-                    
-                    line = f"{ts} | {tx_type}: {sign}{amount:.2f} GEL{details}\n"
-                    history_text_widget.insert("end", line, tag)
-                except Exception as e:
-                    print(f"Skipping invalid transaction: {e}")
-            elif isinstance(tx, str):
-                history_text_widget.insert("end", tx + "\n", "black")
-
-        history_text_widget.config(state="disabled")
+        # Rows are fetched a page at a time through the store's history index
+        # and only formatted when their page is inserted.
+        page_size = 100
+        state = {"filters": {}, "cursor": None, "done": True}
+
+        def load_page():
+            if state["done"]:
+                return
+            rows, state["cursor"] = self.store.history_page(self.current_user, before=state["cursor"], limit=page_size, **state["filters"])
+            state["done"] = state["cursor"] is None
+            for tx in rows:
+                values, tag = self.format_history_row(tx)
+                tree.insert("", "end", values=values, tags=(tag,))
+
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            if float(last) > 0.9:
+                history_window.after_idle(load_page)
+
+        def apply_filters():
+            since = since_entry.get().strip() or None
+            until = until_entry.get().strip() or None
+            for value in (since, until):
+                if value:
+                    try:
+                        datetime.strptime(value, '%Y-%m-%d')
+                    except ValueError:
+                        messagebox.showerror("Error", "Dates must be in YYYY-MM-DD format.", parent=history_window)
+                        return
+            state["filters"] = {"category": categories[category_var.get()], "since": since, "until": until}
+            state["cursor"] = None
+            state["done"] = False
+            tree.delete(*tree.get_children())
+            load_page()
+
+        tree.config(yscrollcommand=on_scroll)
+        AnimatedButton(filter_frame, text="Filter", command=self.with_sound(apply_filters), cursor="hand2").pack(side="left", padx=5)
+        apply_filters()
 
         AnimatedButton(history_window, text="Close", command=self.with_sound(history_window.destroy), cursor="hand2").pack(pady=15)
 
+    def run_in_background(self, work, done, failure):
+        # Runs work() off the Tk thread and polls for its outcome, so the
+        # window stays responsive; done(result) is called on the Tk thread.
+        result = {}
+
+        def run():
+            try:
+                result["value"] = work()
+            except Exception as e:
+                result["error"] = e
+
+        def check():
+            if worker.is_alive():
+                self.root.after(200, check)
+            elif "error" in result:
+                messagebox.showerror("Error", f"{failure}\n{result['error']}")
+            else:
+                done(result["value"])
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        check()
+
     def admin_panel_screen(self):
         if self.current_user != "admin":
             messagebox.showerror("Access Denied", "You do not have permission to access this panel.")
@@ -664,41 +679,156 @@ class ATM_App:
 
         admin_window = tk.Toplevel(self.root)
         admin_window.title("Administrator Panel")
-        admin_window.geometry("600x400")
+        admin_window.geometry("650x450")
         admin_window.configure(bg=self.colors["bg"])
         admin_window.transient(self.root)
         admin_window.grab_set()
 
-        tk.Label(admin_window, text="User Management", font=("Segoe UI", 16, "bold"), bg=self.colors["bg"], fg=self.colors["primary"]).pack(pady=20)
+        tk.Label(admin_window, text="User Management", font=("Segoe UI", 16, "bold"), bg=self.colors["bg"], fg=self.colors["primary"]).pack(pady=(20, 10))
+
+        search_frame = ttk.Frame(admin_window, padding=(20, 0))
+        search_frame.pack(fill="x")
+        ttk.Label(search_frame, text="Search").pack(side="left")
+        search_var = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=search_var).pack(side="left", fill="x", expand=True, padx=(10, 0))
 
         tree_frame = ttk.Frame(admin_window)
         tree_frame.pack(pady=10, padx=20, fill="both", expand=True)
 
-        columns = ("username", "balance", "transactions")
+        columns = ("username", "balance", "transactions", "last_activity")
         tree = ttk.Treeview(tree_frame, columns=columns, show="headings")
         
-        tree.heading("username", text="Username")
-        tree.heading("balance", text="Balance (GEL)")
-        tree.heading("transactions", text="Transactions")
-        
         tree.column("username", width=150)
-        tree.column("balance", width=150, anchor="e")
+        tree.column("balance", width=130, anchor="e")
         tree.column("transactions", width=100, anchor="center")
+        tree.column("last_activity", width=150, anchor="center")
 
         scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
         scrollbar.pack(side="right", fill="y")
         tree.pack(side="left", fill="both", expand=True)
 
-        all_users = load_users()
-        for username, data in all_users.items():
-            balance = data.get("balance", 0)
-            num_transactions = len(data.get("transactions", []))
-            tree.insert("", "end", values=(username, f"{balance:,.2f}", num_transactions))
+        # Rows stream from the store's sorted summaries in chunks, and the
+        # next chunk is only pulled once the view scrolls near the bottom.
+        chunk_size = 200
+        state = {"rows": iter(()), "order": "username", "descending": False, "done": True}
+
+        def load_chunk():
+            if state["done"]:
+                return
+            for _ in range(chunk_size):
+                row = next(state["rows"], None)
+                if row is None:
+                    state["done"] = True
+                    break
+                username, balance, num_transactions, last_activity = row
+                tree.insert("", "end", values=(username, f"{balance:,.2f}", num_transactions, last_activity[:16].replace('T', ' ')))
+
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            if float(last) > 0.9:
+                admin_window.after_idle(load_chunk)
+
+        def reload():
+            state["rows"] = self.store.account_summaries(state["order"], state["descending"], search_var.get().strip())
+            state["done"] = False
+            tree.delete(*tree.get_children())
+            load_chunk()
+
+        def sort_by(column):
+            if state["order"] == column:
+                state["descending"] = not state["descending"]
+            else:
+                state["order"] = column
+                state["descending"] = False
+            reload()
+
+        headings = {"username": "Username", "balance": "Balance (GEL)", "transactions": "Transactions", "last_activity": "Last Activity"}
+        for column, text in headings.items():
+            tree.heading(column, text=text, command=lambda c=column: sort_by(c))
+
+        def import_deposits():
+            csv_path = filedialog.askopenfilename(parent=admin_window, title="Import deposits",
+                                                  filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+            if not csv_path:
+                return
+
+            def work():
+                # Like the audit, on a store of its own.
+                store = open_store()
+                try:
+                    return import_csv(BankLedger(store), csv_path)
+                finally:
+                    store.close()
+
+            def show(result):
+                applied, total, rejected, reject_path = result
+                message = f"Credited {applied} rows totalling {total:.2f} GEL."
+                if rejected:
+                    message += f"\n{rejected} rows were rejected and written to:\n{reject_path}"
+                self.store.poll_changes()
+                if admin_window.winfo_exists():
+                    messagebox.showinfo("Import Complete", message, parent=admin_window)
+                    reload()
+                else:
+                    messagebox.showinfo("Import Complete", message)
+
+            self.run_in_background(work, show, "The import failed. Nothing was imported.")
+
+        def generate_statements():
+            period = []
+            for prompt in ("First day (YYYY-MM-DD), empty for the whole history:", "Last day (YYYY-MM-DD), empty for today:"):
+                value = simpledialog.askstring("Statements", prompt, parent=admin_window)
+                if value is None:
+                    return
+                value = value.strip() or None
+                if value:
+                    try:
+                        datetime.strptime(value, '%Y-%m-%d')
+                    except ValueError:
+                        messagebox.showerror("Error", "Dates must be in YYYY-MM-DD format.", parent=admin_window)
+                        return
+                period.append(value)
+            out_dir = filedialog.askdirectory(parent=admin_window, title="Save statements to")
+            if not out_dir:
+                return
+
+            usernames = self.store.usernames()
+            self.run_in_background(
+                lambda: generate_all(usernames, out_dir, *period, formats=("csv", "text")),
+                lambda count: messagebox.showinfo("Statements", f"Wrote statements for {count} accounts to:\n{out_dir}"),
+                "Statement generation failed."
+            )
+
+        def run_audit():
+            def work():
+                # The audit thread needs a store of its own; SQLite connections
+                # cannot be shared across threads.
+                store = open_store()
+                try:
+                    return audit(store)
+                finally:
+                    store.close()
+
+            def show(report):
+                problems = report["discrepancies"] or report["unmatched_transfers"]
+                show_message = messagebox.showwarning if problems else messagebox.showinfo
+                show_message("Audit", "\n".join(report_lines(report, limit=10)))
+
+            self.run_in_background(work, show, "The audit failed.")
+
+        tree.configure(yscrollcommand=on_scroll)
+        search_var.trace_add("write", lambda *args: reload())
+        reload()
 
-        AnimatedButton(admin_window, text="Close", command=admin_window.destroy, cursor="hand2").pack(pady=15)
+        buttons_frame = ttk.Frame(admin_window)
+        buttons_frame.pack(pady=15)
+        AnimatedButton(buttons_frame, text="Import Deposits (CSV)", command=import_deposits, cursor="hand2").pack(side="left", padx=5)
+        AnimatedButton(buttons_frame, text="Statements", command=generate_statements, cursor="hand2").pack(side="left", padx=5)
+        AnimatedButton(buttons_frame, text="Audit", command=run_audit, cursor="hand2").pack(side="left", padx=5)
+        AnimatedButton(buttons_frame, text="Close", command=admin_window.destroy, cursor="hand2").pack(side="left", padx=5)
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = ATM_App(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    app.store.close()
\ No newline at end of file
@@ -0,0 +1,149 @@
+import argparse
+import json
+import threading
+from collections import Counter
+
+from ledger import DB_FILE, SQLITE_FILE, open_store
+from records import from_minor, to_minor
+from storage import account_version, atomic_write_json
+
+CHECKPOINT_FORMAT = 1
+
+
+def checkpoint_path(store):
+    return f"{store.path}.audit.json"
+
+
+def load_checkpoints(store):
+    # accounts maps username -> [end, replayed, version]: how far its history
+    # has been replayed, the net of that history in minor units, and the
+    # account version it was last checked at. unmatched holds transfer
+    # halves still waiting for their other side.
+    fresh = {"format": CHECKPOINT_FORMAT, "store": type(store).__name__, "accounts": {}, "unmatched": []}
+    try:
+        with open(checkpoint_path(store), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return fresh
+    # History positions and row ids mean different things, so checkpoints
+    # from the other ledger type are useless.
+    if data.get("format") != CHECKPOINT_FORMAT or data.get("store") != fresh["store"]:
+        return fresh
+    return data
+
+
+def audit(store, checkpoints=None):
+    # Checks every balance against its replayed history, replaying only what
+    # was added since the account's checkpoint; accounts whose version has
+    # not moved are not read at all. Every transfer_out must be matched by a
+    # transfer_in of the same amount on the other side.
+    if checkpoints is None:
+        checkpoints = load_checkpoints(store)
+    store.poll_changes()
+    accounts = checkpoints["accounts"]
+    unmatched = Counter({(sender, recipient, amount): count for sender, recipient, amount, count in checkpoints["unmatched"]})
+    report = {"accounts": 0, "replayed": 0, "total_balance": 0, "discrepancies": [], "unmatched_transfers": []}
+    total = 0
+    with store.snapshot():
+        for username in store.usernames():
+            user_data = store.get_user(username)
+            version = account_version(user_data)
+            entry = accounts.get(username)
+            if entry is None or entry[2] != version:
+                start, replayed = entry[:2] if entry else (0, 0)
+                end, count, net, transfers = store.audit_tail(username, start)
+                report["replayed"] += count
+                for tx_type, counterparty, amount, pairs in transfers:
+                    if tx_type == "transfer_out":
+                        unmatched[(username, counterparty, amount)] += pairs
+                    else:
+                        unmatched[(counterparty, username, amount)] -= pairs
+                entry = accounts[username] = [end, replayed + net, version]
+            balance = to_minor(user_data["balance"])
+            if balance != entry[1]:
+                report["discrepancies"].append({"user": username, "balance": from_minor(balance), "replayed": from_minor(entry[1])})
+            total += balance
+            report["accounts"] += 1
+    checkpoints["unmatched"] = [[*key, count] for key, count in unmatched.items() if count]
+    # A positive count is money that left one account and never arrived,
+    # a negative one money that arrived from nowhere.
+    report["unmatched_transfers"] = [
+        {"from": sender, "to": recipient, "amount": from_minor(amount), "count": count}
+        for sender, recipient, amount, count in checkpoints["unmatched"]
+    ]
+    report["total_balance"] = from_minor(total)
+    atomic_write_json(checkpoint_path(store), checkpoints)
+    return report
+
+
+class BackgroundAuditor:
+    # Audits every `interval` seconds on a store of its own, so it never
+    # shares a connection or in-memory state with the UI thread. on_report
+    # is called from the auditor thread.
+    def __init__(self, open_store, interval=60, on_report=None):
+        self.open_store = open_store
+        self.interval = interval
+        self.on_report = on_report
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        store = self.open_store()
+        try:
+            checkpoints = load_checkpoints(store)
+            while True:
+                report = audit(store, checkpoints)
+                if self.on_report:
+                    self.on_report(report)
+                if self.stopped.wait(self.interval):
+                    return
+        finally:
+            store.close()
+
+
+def report_lines(report, limit=20):
+    lines = [f"Audited {report['accounts']} accounts, replayed {report['replayed']} new transactions; "
+             f"total balance {report['total_balance']:,.2f} GEL."]
+    for item in report["discrepancies"][:limit]:
+        lines.append(f"  {item['user']}: balance {item['balance']:,.2f} but history adds up to {item['replayed']:,.2f}")
+    for item in report["unmatched_transfers"][:limit]:
+        side = "sent but never received" if item["count"] > 0 else "received but never sent"
+        lines.append(f"  {abs(item['count'])} x {item['amount']:,.2f} GEL from {item['from']} to {item['to']} {side}")
+    hidden = max(0, len(report["discrepancies"]) - limit) + max(0, len(report["unmatched_transfers"]) - limit)
+    if hidden:
+        lines.append(f"  ... and {hidden} more")
+    if not report["discrepancies"] and not report["unmatched_transfers"]:
+        lines.append("  Every balance matches its history and all transfers are paired.")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check ATM balances against their transaction history.")
+    parser.add_argument("--watch", type=float, metavar="SECONDS", help="keep auditing at this interval")
+    parser.add_argument("--report", help="also write the full report as JSON to this file")
+    parser.add_argument("--json", default=DB_FILE, help=f"JSON ledger (default: {DB_FILE})")
+    parser.add_argument("--db", default=SQLITE_FILE, help=f"SQLite ledger, used when it exists (default: {SQLITE_FILE})")
+    args = parser.parse_args()
+
+    def on_report(report):
+        print("\n".join(report_lines(report)))
+        if args.report:
+            atomic_write_json(args.report, report)
+
+    auditor = BackgroundAuditor(lambda: open_store(args.json, args.db), args.watch or 0, on_report)
+    if args.watch:
+        auditor.start()
+        try:
+            auditor.thread.join()
+        except KeyboardInterrupt:
+            auditor.stop()
+    else:
+        auditor.stopped.set()
+        auditor.run()
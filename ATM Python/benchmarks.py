@@ -0,0 +1,450 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from audit import audit
+from bulk_import import import_csv
+from ledger import BankLedger
+from records import DAY, TYPE_CODES, TransactionLog, day_number, from_minor
+from sqlite_store import SqliteStore
+from storage import ConflictError, JournalStore, SNAPSHOT_FORMAT, account_version, atomic_write_json, user_change
+
+
+def synthetic_history(count, now):
+    # One withdrawal per minute going back in time, so the newest day holds
+    # at most a handful of entries and the rest is old history.
+    start = now - timedelta(minutes=count)
+    return [
+        {"timestamp": (start + timedelta(minutes=i)).isoformat(), "type": "withdrawal", "amount": 0.01}
+        for i in range(count)
+    ]
+
+
+def legacy_withdrawn_today(transactions, today_str):
+    withdrawn_today = 0.0
+    for tx in transactions:
+        if isinstance(tx, dict) and tx.get("type") == "withdrawal":
+            tx_date = datetime.fromisoformat(tx["timestamp"]).strftime('%Y-%m-%d')
+            if tx_date == today_str:
+                withdrawn_today += tx.get("amount", 0)
+    return withdrawn_today
+
+
+def time_per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench_withdraw(sizes):
+    print(f"{'history':>10} | {'legacy scan (us)':>16} | {'index check (us)':>16} | {'withdraw (us)':>13}")
+    print("-" * 66)
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "users.json")
+            now = datetime.now()
+            users = {"bench": {"balance": 1e9, "transactions": synthetic_history(size, now)}}
+            atomic_write_json(path, {"format": SNAPSHOT_FORMAT, "seq": 0, "users": users})
+            del users
+            store = JournalStore(path)
+            today_str = now.strftime('%Y-%m-%d')
+            history = store.transactions("bench")
+
+            legacy_us = time_per_call(lambda: legacy_withdrawn_today(history, today_str), 1 if size > 10000 else 20)
+            check_us = time_per_call(lambda: store.withdrawn_on("bench", today_str), 10000)
+
+            def withdraw():
+                if store.withdrawn_on("bench", today_str) + 0.01 > 1000:
+                    return
+                balance = store.get_user("bench")["balance"]
+                tx = {"timestamp": datetime.now().isoformat(), "type": "withdrawal", "amount": 0.01}
+                store.commit([user_change("bench", fields={"balance": balance - 0.01}, append=[tx])])
+            withdraw_us = time_per_call(withdraw, 50)
+            store.close()
+        print(f"{size:>10,} | {legacy_us:>16,.1f} | {check_us:>16,.2f} | {withdraw_us:>13,.1f}")
+
+
+def bench_screens(transitions):
+    # Needs a display. "rebuild" tears every screen down before showing it,
+    # which is what each navigation cost before screens were retained.
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        rates_path = os.path.join(tmp, "rates.json")
+        with open(rates_path, "w", encoding="utf-8") as f:
+            json.dump({"base_code": "USD", "rates": {"GEL": 2.7}}, f)
+        os.environ["ATM_FX_SOURCE"] = rates_path
+
+        import tkinter as tk
+        from ATM import ATM_App
+
+        root = tk.Tk()
+        app = ATM_App(root)
+        app.store.commit([user_change("bench", fields={"balance": 100})])
+        app.current_user = "bench"
+
+        print(f"{'mode':>8} | {'mean (ms)':>9} | {'median (ms)':>11} | {'max (ms)':>8}")
+        print("-" * 46)
+        for mode in ("rebuild", "retained"):
+            samples = []
+            for i in range(transitions):
+                show = app.account_screen if i % 2 == 0 else app.login_screen
+                start = time.perf_counter()
+                if mode == "rebuild":
+                    app.screens.reset()
+                show()
+                root.update_idletasks()
+                samples.append((time.perf_counter() - start) * 1000)
+            print(f"{mode:>8} | {statistics.mean(samples):>9.2f} | {statistics.median(samples):>11.2f} | {max(samples):>8.2f}")
+        app.store.close()
+        root.destroy()
+
+
+def open_bench_store(backend, path):
+    if backend == "sqlite":
+        return SqliteStore(path)
+    # A small compaction threshold makes the terminals compact under load too.
+    return JournalStore(path, compact_bytes=256 * 1024)
+
+
+def commit_with_retry(store, build):
+    conflicts = 0
+    while True:
+        try:
+            store.commit(build())
+            return conflicts
+        except ConflictError:
+            conflicts += 1
+
+
+def stress_worker(backend, path, accounts, operations, seed):
+    store = open_bench_store(backend, path)
+    rng = random.Random(seed)
+    deposited = 0
+    conflicts = 0
+    for _ in range(operations):
+        payer, payee = rng.sample(range(accounts), 2)
+        payer, payee = f"user{payer}", f"user{payee}"
+        if rng.random() < 0.5:
+            def build():
+                data = store.get_user(payee)
+                tx = {"timestamp": datetime.now().isoformat(), "type": "deposit", "amount": 1.0}
+                return [user_change(payee, fields={"balance": data["balance"] + 1}, append=[tx], expect=account_version(data))]
+            deposited += 1
+        else:
+            def build():
+                payer_data = store.get_user(payer)
+                payee_data = store.get_user(payee)
+                now = datetime.now().isoformat()
+                return [
+                    user_change(payer, fields={"balance": payer_data["balance"] - 1}, expect=account_version(payer_data),
+                                append=[{"timestamp": now, "type": "transfer_out", "amount": 1.0, "to": payee}]),
+                    user_change(payee, fields={"balance": payee_data["balance"] + 1}, expect=account_version(payee_data),
+                                append=[{"timestamp": now, "type": "transfer_in", "amount": 1.0, "from": payer}]),
+                ]
+        conflicts += commit_with_retry(store, build)
+    store.close()
+    return deposited, conflicts
+
+
+def bench_stress(backend, process_counts, operations, accounts):
+    # Every terminal hammers the same few accounts; afterwards each balance
+    # must equal its replayed history and no deposit may be lost.
+    print(f"{'processes':>9} | {'ops/s':>8} | {'conflicts':>9} | check")
+    print("-" * 42)
+    for processes in process_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "users.db" if backend == "sqlite" else "users.json")
+            store = open_bench_store(backend, path)
+            start_balance = 1000000.0
+            store.commit([user_change(f"user{i}", fields={"balance": start_balance}) for i in range(accounts)])
+            store.close()
+
+            start = time.perf_counter()
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.starmap(stress_worker, [(backend, path, accounts, operations, seed) for seed in range(processes)])
+            elapsed = time.perf_counter() - start
+
+            store = open_bench_store(backend, path)
+            deposited = sum(result[0] for result in results)
+            conflicts = sum(result[1] for result in results)
+            problems = []
+            total = 0.0
+            for i in range(accounts):
+                username = f"user{i}"
+                balance = store.get_user(username)["balance"]
+                total += balance
+                replayed = start_balance
+                for tx in store.transactions(username):
+                    replayed += tx["amount"] if tx["type"] in ("deposit", "transfer_in") else -tx["amount"]
+                if replayed != balance:
+                    problems.append(username)
+            if total != start_balance * accounts + deposited:
+                problems.append("total")
+            store.close()
+        check = "ok" if not problems else "MISMATCH: " + ", ".join(problems)
+        print(f"{processes:>9} | {processes * operations / elapsed:>8,.0f} | {conflicts:>9,} | {check}")
+
+
+def synthetic_bank(backend, path, users):
+    if backend == "json":
+        # Writing the snapshot directly is much quicker than 100k commits.
+        accounts = {f"user{i}": {"balance": 500.0, "transactions": [], "version": 1} for i in range(users)}
+        atomic_write_json(path, {"format": SNAPSHOT_FORMAT, "seq": 0, "users": accounts})
+        del accounts
+    else:
+        store = SqliteStore(path)
+        store.commit([user_change(f"user{i}", fields={"balance": 500.0}) for i in range(users)])
+        store.close()
+    return open_bench_store(backend, path)
+
+
+def random_operation(rng, users):
+    pick = rng.random()
+    payer = f"user{rng.randrange(users)}"
+    if pick < 0.5:
+        return ("deposit", payer, float(rng.randint(1, 100)))
+    if pick < 0.7:
+        return ("withdraw", payer, float(rng.randint(1, 50)))
+    return ("transfer", payer, f"user{rng.randrange(users)}", float(rng.randint(1, 50)))
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench_load(backend, users, operations, batch_sizes, seed):
+    print(f"{'batch':>6} | {'ops':>8} | {'ops/s':>9} | {'p50 (ms)':>9} | {'p99 (ms)':>9} | {'rejected':>8}")
+    print("-" * 63)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.db" if backend == "sqlite" else "users.json")
+        store = synthetic_bank(backend, path, users)
+        ledger = BankLedger(store)
+        rng = random.Random(seed)
+        for batch_size in batch_sizes:
+            # With a batch size of 1 every operation is its own durable
+            # commit, which is what the ATM screens do. Latency is per call.
+            samples = []
+            rejected = 0
+            start = time.perf_counter()
+            for _ in range(max(1, operations // batch_size)):
+                batch = [random_operation(rng, users) for _ in range(batch_size)]
+                call_start = time.perf_counter()
+                rejected += len(ledger.apply_batch(batch))
+                samples.append((time.perf_counter() - call_start) * 1000)
+            elapsed = time.perf_counter() - start
+            done = len(samples) * batch_size
+            print(f"{batch_size:>6} | {done:>8,} | {done / elapsed:>9,.0f} | {percentile(samples, 0.5):>9.2f} | "
+                  f"{percentile(samples, 0.99):>9.2f} | {rejected:>8,}")
+        store.close()
+
+
+def bench_import(backend, rows, users):
+    # Peak RSS is sampled before and after the import; on the SQLite ledger
+    # the import itself should add little beyond the CSV read buffer.
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.db" if backend == "sqlite" else "users.json")
+        store = synthetic_bank(backend, path, users)
+        csv_path = os.path.join(tmp, "payroll.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write("username,amount,memo\n")
+            for i in range(rows):
+                # Every 1000th row names an account that does not exist.
+                username = f"ghost{i}" if i % 1000 == 999 else f"user{i % users}"
+                f.write(f"{username},{(i % 5000) / 100 + 1:.2f},payroll {i}\n")
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        start = time.perf_counter()
+        applied, total, rejected, _ = import_csv(BankLedger(store), csv_path)
+        elapsed = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        store.close()
+    print(f"imported {applied:,} rows ({total:,.2f} GEL), rejected {rejected:,} in {elapsed:.1f}s "
+          f"= {rows / elapsed:,.0f} rows/s; peak RSS {rss_before:,.0f} -> {rss_after:,.0f} MiB")
+
+
+def mixed_history(count, now):
+    start = now - timedelta(minutes=count)
+    kinds = [("deposit", None), ("withdrawal", None), ("transfer_out", "to"), ("transfer_in", "from")]
+    history = []
+    for i in range(count):
+        tx_type, key = kinds[i % 4]
+        tx = {"timestamp": (start + timedelta(minutes=i)).isoformat(), "type": tx_type, "amount": round((i % 997) / 10 + 0.1, 2)}
+        if key:
+            tx[key] = f"user{i % 50}"
+        history.append(tx)
+    return history
+
+
+def dict_replay(history):
+    balance = 0.0
+    for tx in history:
+        balance += tx["amount"] if tx["type"] in ("deposit", "transfer_in") else -tx["amount"]
+    return balance
+
+
+def log_withdrawn_on(log, day):
+    lo = bisect_left(log.timestamps, day_number(day) * DAY)
+    hi = bisect_left(log.timestamps, (day_number(day) + 1) * DAY)
+    withdrawal = TYPE_CODES["withdrawal"]
+    return from_minor(sum(amount for code, amount in zip(log.types[lo:hi], log.amounts[lo:hi]) if code == withdrawal))
+
+
+def log_replay(log):
+    credits = {TYPE_CODES["deposit"], TYPE_CODES["transfer_in"]}
+    return from_minor(sum(amount if code in credits else -amount for code, amount in zip(log.types, log.amounts)))
+
+
+def bench_records(count):
+    # Both representations are built from the same JSON text, as on load.
+    now = datetime.now()
+    text = json.dumps(mixed_history(count, now))
+    day = (now - timedelta(minutes=count // 2)).strftime('%Y-%m-%d')
+
+    history = json.loads(text)
+    start = time.perf_counter()
+    TransactionLog(history)
+    convert_s = time.perf_counter() - start
+    del history
+
+    tracemalloc.start()
+    history = json.loads(text)
+    dict_mib = tracemalloc.get_traced_memory()[0] / 2 ** 20
+    log = TransactionLog(history)
+    del history
+    tracemalloc.reset_peak()
+    log_mib = tracemalloc.get_traced_memory()[0] / 2 ** 20
+    tracemalloc.stop()
+    history = json.loads(text)
+
+    print(f"{count:,} transactions, converted on load in {convert_s:.2f}s")
+    print(f"{'representation':>14} | {'memory (MiB)':>12} | {'day total (ms)':>14} | {'replay (ms)':>11} | replayed balance")
+    print("-" * 80)
+    for name, mib, withdrawn_on, replay, data in (
+        ("dicts", dict_mib, legacy_withdrawn_today, dict_replay, history),
+        ("columns", log_mib, log_withdrawn_on, log_replay, log),
+    ):
+        day_ms = time_per_call(lambda: withdrawn_on(data, day), 3) / 1000
+        start = time.perf_counter()
+        balance = replay(data)
+        replay_ms = (time.perf_counter() - start) * 1000
+        print(f"{name:>14} | {mib:>12,.1f} | {day_ms:>14,.2f} | {replay_ms:>11,.1f} | {balance!r}")
+
+
+def audit_history(username, previous, following, repeats, start):
+    # Every transfer_out here has its transfer_in on the following account.
+    history = []
+    for i in range(repeats):
+        timestamp = (start + timedelta(seconds=i)).isoformat()
+        history.append({"timestamp": timestamp, "type": "deposit", "amount": 10.0})
+        history.append({"timestamp": timestamp, "type": "transfer_out", "amount": 2.5, "to": following})
+        history.append({"timestamp": timestamp, "type": "transfer_in", "amount": 2.5, "from": previous})
+        history.append({"timestamp": timestamp, "type": "withdrawal", "amount": 1.25})
+    return history
+
+
+def audit_bank(backend, path, users, transactions):
+    repeats = max(1, transactions // (4 * users))
+    start = datetime.now() - timedelta(days=30)
+    names = [f"user{i}" for i in range(users)]
+    accounts = (
+        (names[i], {"balance": repeats * 8.75, "transactions": audit_history(names[i], names[i - 1], names[(i + 1) % users], repeats, start), "version": 1})
+        for i in range(users)
+    )
+    if backend == "json":
+        # Streamed account by account; the whole bank as dicts would not fit.
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f'{{"format": {SNAPSHOT_FORMAT}, "seq": 0, "users": {{')
+            for i, (username, data) in enumerate(accounts):
+                f.write(f'{", " if i else ""}{json.dumps(username)}: {json.dumps(data)}')
+            f.write("}}")
+    else:
+        store = SqliteStore(path)
+        chunk = []
+        for username, data in accounts:
+            chunk.append(user_change(username, fields={"balance": data["balance"]}, append=data["transactions"]))
+            if len(chunk) == 100:
+                store.commit(chunk)
+                chunk = []
+        store.commit(chunk)
+        store.close()
+    return open_bench_store(backend, path), users * repeats * 4
+
+
+def bench_audit(backend, users, transactions):
+    # A full audit from no checkpoints, then one after 1% of the accounts
+    # took a deposit, which should only replay those.
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.db" if backend == "sqlite" else "users.json")
+        start = time.perf_counter()
+        store, count = audit_bank(backend, path, users, transactions)
+        print(f"{count:,} transactions over {users:,} accounts, built and loaded in {time.perf_counter() - start:.1f}s")
+        start = time.perf_counter()
+        report = audit(store)
+        full_s = time.perf_counter() - start
+        ledger = BankLedger(store)
+        for i in range(0, users, 100):
+            ledger.deposit(f"user{i}", 1)
+        start = time.perf_counter()
+        incremental = audit(store)
+        incremental_s = time.perf_counter() - start
+        store.close()
+    problems = len(report["discrepancies"]) + len(report["unmatched_transfers"])
+    print(f"full audit:        {full_s:6.2f}s ({full_s / count * 1e6:.2f} us/transaction, "
+          f"~{full_s / count * 1e7:.0f}s per 10M); {problems} problems")
+    print(f"incremental audit: {incremental_s:6.2f}s, replayed {incremental['replayed']:,} transactions; "
+          f"total {incremental['total_balance']:,.2f} GEL")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ATM ledger micro-benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    withdraw_parser = commands.add_parser("withdraw", help="daily-limit check and withdraw latency vs. history size")
+    withdraw_parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000, 1000000])
+    screens_parser = commands.add_parser("screens", help="per-transition time, rebuilt vs. retained screens (needs a display)")
+    screens_parser.add_argument("--transitions", type=int, default=200)
+    stress_parser = commands.add_parser("stress", help="N terminals depositing and transferring on one ledger")
+    stress_parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    stress_parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    stress_parser.add_argument("--operations", type=int, default=500, help="operations per process")
+    stress_parser.add_argument("--accounts", type=int, default=20)
+    load_parser = commands.add_parser("load", help="ledger throughput and latency on a synthetic bank")
+    load_parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    load_parser.add_argument("--users", type=int, default=100000)
+    load_parser.add_argument("--operations", type=int, default=20000)
+    load_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 10000])
+    load_parser.add_argument("--seed", type=int, default=1)
+    import_parser = commands.add_parser("import", help="bulk CSV deposit import: rows/s and peak memory")
+    import_parser.add_argument("--backend", choices=["json", "sqlite"], default="sqlite")
+    import_parser.add_argument("--rows", type=int, default=1000000)
+    import_parser.add_argument("--users", type=int, default=10000)
+    records_parser = commands.add_parser("records", help="memory and scan time, transaction dicts vs. packed columns")
+    records_parser.add_argument("--count", type=int, default=1000000)
+    audit_parser = commands.add_parser("audit", help="full and incremental balance audit time on a large ledger")
+    audit_parser.add_argument("--backend", choices=["json", "sqlite"], default="sqlite")
+    audit_parser.add_argument("--users", type=int, default=10000)
+    audit_parser.add_argument("--transactions", type=int, default=2000000)
+    args = parser.parse_args()
+    if args.command == "withdraw":
+        bench_withdraw(args.sizes)
+    elif args.command == "screens":
+        bench_screens(args.transitions)
+    elif args.command == "stress":
+        bench_stress(args.backend, args.processes, args.operations, args.accounts)
+    elif args.command == "load":
+        bench_load(args.backend, args.users, args.operations, args.batch_sizes, args.seed)
+    elif args.command == "import":
+        bench_import(args.backend, args.rows, args.users)
+    elif args.command == "records":
+        bench_records(args.count)
+    elif args.command == "audit":
+        bench_audit(args.backend, args.users, args.transactions)
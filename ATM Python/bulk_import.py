@@ -0,0 +1,80 @@
+import argparse
+import csv
+import re
+from decimal import Decimal
+
+from ledger import DB_FILE, SQLITE_FILE, BankLedger, open_store
+
+REJECT_HEADER = ["line", "username", "amount", "memo", "reason"]
+AMOUNT_PATTERN = re.compile(r"[-+]?[0-9]+(\.[0-9]{1,2})?")
+
+
+def reject_path_for(csv_path):
+    base = csv_path[:-4] if csv_path.lower().endswith(".csv") else csv_path
+    return f"{base}.rejects.csv"
+
+
+def parse_amount(text):
+    # Plain decimals only, so "1e3", "nan" or "12.345" are refused instead
+    # of being read as something else or silently rounded into the balance.
+    text = text.strip()
+    if not AMOUNT_PATTERN.fullmatch(text):
+        return None
+    return float(Decimal(text))
+
+
+def import_csv(ledger, csv_path, reject_path=None):
+    # Streams (username, amount, memo) rows into one ledger commit. Rows that
+    # do not parse or do not pass the ledger's checks are written to the
+    # reject file with their line number, so the file can be fixed and re-run.
+    reject_path = reject_path or reject_path_for(csv_path)
+    rejected = 0
+    line = 0
+    raw = None
+    with open(csv_path, "r", newline="", encoding="utf-8-sig") as source, \
+            open(reject_path, "w", newline="", encoding="utf-8") as rejects:
+        writer = csv.writer(rejects)
+        writer.writerow(REJECT_HEADER)
+
+        def reject(row, reason):
+            nonlocal rejected
+            rejected += 1
+            writer.writerow([line, *row, reason])
+
+        def rows():
+            nonlocal line, raw
+            for line, row in enumerate(csv.reader(source), 1):
+                if line == 1 and row and row[0].strip().lower() == "username":
+                    continue
+                if not row or not any(cell.strip() for cell in row):
+                    continue
+                if len(row) not in (2, 3):
+                    reject((row + ["", "", ""])[:3], "Expected username, amount and an optional memo.")
+                    continue
+                raw = (row + [""])[:3]
+                username, amount_text, memo = raw
+                amount = parse_amount(amount_text)
+                if amount is None:
+                    reject(raw, "Amount is not a number with at most two decimals.")
+                    continue
+                yield username.strip(), amount, memo.strip()
+
+        applied, total = ledger.import_deposits(rows(), lambda row, error: reject(raw, str(error)))
+    return applied, total, rejected, reject_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Credit many ATM accounts from a CSV of username,amount,memo rows.")
+    parser.add_argument("csv", help="file to import")
+    parser.add_argument("--rejects", help="where to write rejected rows (default: <csv>.rejects.csv)")
+    parser.add_argument("--json", default=DB_FILE, help=f"JSON ledger (default: {DB_FILE})")
+    parser.add_argument("--db", default=SQLITE_FILE, help=f"SQLite ledger, used when it exists (default: {SQLITE_FILE})")
+    args = parser.parse_args()
+    store = open_store(args.json, args.db)
+    try:
+        applied, total, rejected, reject_path = import_csv(BankLedger(store), args.csv, args.rejects)
+    finally:
+        store.close()
+    print(f"Credited {applied} rows totalling {total:.2f} GEL.")
+    if rejected:
+        print(f"Rejected {rejected} rows, see {reject_path}.")
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+from storage import atomic_write_json
+
+ER_API_URL = "https://open.er-api.com/v6/latest/USD"
+DEFAULT_TTL = 60 * 60
+RETRY_INTERVAL = 60
+
+
+class HttpRateSource:
+    def __init__(self, url=ER_API_URL, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self):
+        if not requests:
+            raise RuntimeError("requests library not installed")
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        return data.get("base_code", "USD"), data["rates"]
+
+
+class FileRateSource:
+    # Reads the same {"base_code": ..., "rates": {...}} shape the API returns.
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data.get("base_code", "USD"), data["rates"]
+
+
+def rate_source(spec):
+    if urlparse(spec).scheme in ("http", "https"):
+        return HttpRateSource(spec)
+    return FileRateSource(spec)
+
+
+class RateProvider:
+    # Answers from the in-memory/on-disk cache straight away; once the cache
+    # is older than `ttl` the stale value is still served while a background
+    # thread fetches a fresh set of rates.
+    def __init__(self, source, cache_path=None, ttl=DEFAULT_TTL, defaults=None):
+        self.source = source
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.defaults = defaults or {}
+        self.lock = threading.Lock()
+        self.refresher = None
+        self.base = None
+        self.rates = {}
+        self.fetched_at = 0
+        self.last_attempt = 0
+        self.load_cache()
+
+    def load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.base, self.rates, self.fetched_at = data["base"], data["rates"], data["fetched_at"]
+        except (ValueError, KeyError) as e:
+            print(f"Warning: Ignoring unreadable rate cache. {e}")
+
+    def is_stale(self):
+        return time.time() - self.fetched_at > self.ttl
+
+    def refresh(self):
+        self.last_attempt = time.time()
+        try:
+            base, rates = self.source.fetch()
+        except Exception as e:
+            print(f"Warning: Could not fetch currency rates: {e}. Using cached or default rates.")
+            return False
+        with self.lock:
+            self.base, self.rates, self.fetched_at = base, rates, time.time()
+            snapshot = {"base": base, "rates": rates, "fetched_at": self.fetched_at}
+        if self.cache_path:
+            atomic_write_json(self.cache_path, snapshot)
+        return True
+
+    def refresh_async(self):
+        with self.lock:
+            if self.refresher and self.refresher.is_alive():
+                return
+            self.refresher = threading.Thread(target=self.refresh, daemon=True)
+            self.refresher.start()
+
+    def rate(self, from_currency, to_currency):
+        if self.is_stale() and time.time() - self.last_attempt > RETRY_INTERVAL:
+            self.refresh_async()
+        with self.lock:
+            rates = self.rates
+            if from_currency == self.base:
+                from_rate = 1.0
+            else:
+                from_rate = rates.get(from_currency)
+            to_rate = 1.0 if to_currency == self.base else rates.get(to_currency)
+        if from_rate and to_rate:
+            return float(to_rate) / float(from_rate)
+        return self.defaults.get((from_currency, to_currency))
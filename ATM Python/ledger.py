@@ -0,0 +1,273 @@
+import hashlib
+import os
+import secrets
+from datetime import datetime
+
+from records import from_minor, to_minor
+from sqlite_store import SqliteStore
+from storage import ConflictError, JournalStore, account_version, user_change
+
+DB_FILE = "users.json"
+SQLITE_FILE = "users.db"
+MIN_BALANCE = 10.00
+DAILY_LIMIT = 1000.00
+# Other terminals may update the same account between our read and our
+# commit; such commits are rejected and retried against the fresh state.
+COMMIT_RETRIES = 5
+
+
+class LedgerError(Exception):
+    title = "Error"
+
+
+class InvalidAmount(LedgerError):
+    def __init__(self, message="Amount must be greater than zero."):
+        super().__init__(message)
+
+
+class UnknownUser(LedgerError):
+    def __init__(self, message="User not found."):
+        super().__init__(message)
+
+
+class UserExists(LedgerError):
+    def __init__(self, message="A user with this name already exists."):
+        super().__init__(message)
+
+
+class InsufficientFunds(LedgerError):
+    def __init__(self, message="Insufficient funds."):
+        super().__init__(message)
+
+
+class SelfTransfer(LedgerError):
+    def __init__(self, message="You cannot transfer money to yourself."):
+        super().__init__(message)
+
+
+class DailyLimitExceeded(LedgerError):
+    title = "Limit Exceeded"
+
+    def __init__(self, withdrawn_today, limit=DAILY_LIMIT):
+        self.withdrawn_today = withdrawn_today
+        self.remaining = max(0, limit - withdrawn_today)
+        super().__init__(f"Daily withdrawal limit is {limit:.2f} GEL.\n"
+                         f"You have withdrawn {withdrawn_today:.2f} GEL today.\n"
+                         f"Remaining limit: {self.remaining:.2f} GEL.")
+
+
+class AccountBusy(LedgerError):
+    def __init__(self, message="The account is busy in another terminal. Please try again."):
+        super().__init__(message)
+
+
+def open_store(json_path=DB_FILE, db_path=SQLITE_FILE):
+    # Once users.json has been migrated with `python sqlite_store.py`,
+    # the SQLite database takes over as the ledger.
+    if os.path.exists(db_path):
+        return SqliteStore(db_path)
+    return JournalStore(json_path)
+
+
+def positive_minor(amount):
+    minor = to_minor(amount)
+    if minor <= 0:
+        raise InvalidAmount()
+    return minor
+
+
+def hash_password(password):
+    salt = secrets.token_hex(16)
+    return {
+        "salt": salt,
+        "hash": hashlib.sha256((password + salt).encode('utf-8')).hexdigest()
+    }
+
+
+def password_matches(user_data, password):
+    if "auth" in user_data:
+        salt = user_data["auth"]["salt"]
+        return hashlib.sha256((password + salt).encode('utf-8')).hexdigest() == user_data["auth"]["hash"]
+    return "password" in user_data and user_data["password"] == password
+
+
+class Batch:
+    # Working copy of the accounts touched by one commit. Every operation is
+    # checked against the balances and daily totals left by the ones before
+    # it, and each account ends up as a single change in the journal.
+    # Arithmetic is done in minor units so balances never drift.
+    def __init__(self, store):
+        self.store = store
+        self.accounts = {}
+
+    def account(self, username, missing=UnknownUser):
+        account = self.accounts.get(username)
+        if account is None:
+            user_data = self.store.get_user(username)
+            if user_data is None:
+                raise missing()
+            account = self.accounts[username] = {
+                "balance": to_minor(user_data["balance"]),
+                "expect": account_version(user_data),
+                "append": [],
+                "withdrawn": {}
+            }
+        return account
+
+    def withdrawn_on(self, username, account, day):
+        if day not in account["withdrawn"]:
+            account["withdrawn"][day] = to_minor(self.store.withdrawn_on(username, day))
+        return account["withdrawn"][day]
+
+    def deposit(self, username, amount):
+        minor = positive_minor(amount)
+        account = self.account(username)
+        account["balance"] += minor
+        account["append"].append({"timestamp": datetime.now().isoformat(), "type": "deposit", "amount": from_minor(minor)})
+
+    def withdraw(self, username, amount):
+        minor = positive_minor(amount)
+        account = self.account(username)
+        if account["balance"] - minor < to_minor(MIN_BALANCE):
+            raise InsufficientFunds(f"Insufficient funds. You must maintain a minimum balance of {MIN_BALANCE:.2f} GEL.")
+        now = datetime.now()
+        day = now.strftime('%Y-%m-%d')
+        withdrawn_today = self.withdrawn_on(username, account, day)
+        if withdrawn_today + minor > to_minor(DAILY_LIMIT):
+            raise DailyLimitExceeded(from_minor(withdrawn_today))
+        account["balance"] -= minor
+        account["withdrawn"][day] = withdrawn_today + minor
+        account["append"].append({"timestamp": now.isoformat(), "type": "withdrawal", "amount": from_minor(minor)})
+
+    def transfer(self, sender, recipient, amount):
+        minor = positive_minor(amount)
+        if sender == recipient:
+            raise SelfTransfer()
+        sender_account = self.account(sender)
+        recipient_account = self.account(recipient, lambda: UnknownUser("Recipient not found."))
+        if minor > sender_account["balance"]:
+            raise InsufficientFunds()
+        now = datetime.now().isoformat()
+        sender_account["balance"] -= minor
+        sender_account["append"].append({"timestamp": now, "type": "transfer_out", "amount": from_minor(minor), "to": recipient})
+        recipient_account["balance"] += minor
+        recipient_account["append"].append({"timestamp": now, "type": "transfer_in", "amount": from_minor(minor), "from": sender})
+
+    def changes(self):
+        return [
+            user_change(username, fields={"balance": from_minor(account["balance"])}, append=account["append"], expect=account["expect"])
+            for username, account in self.accounts.items() if account["append"]
+        ]
+
+
+class BankLedger:
+    # The banking rules without any UI. The ATM screens call these methods
+    # and turn LedgerError into message boxes; scripts and benchmarks drive
+    # them directly.
+    def __init__(self, store, retries=COMMIT_RETRIES):
+        self.store = store
+        self.retries = retries
+
+    def run(self, operation):
+        for attempt in range(self.retries):
+            batch = Batch(self.store)
+            result = operation(batch)
+            changes = batch.changes()
+            if not changes:
+                return result
+            try:
+                self.store.commit(changes)
+                return result
+            except ConflictError:
+                continue
+        raise AccountBusy()
+
+    def balance(self, username):
+        user_data = self.store.get_user(username)
+        if user_data is None:
+            raise UnknownUser()
+        return user_data["balance"]
+
+    def deposit(self, username, amount):
+        self.run(lambda batch: batch.deposit(username, amount))
+
+    def withdraw(self, username, amount):
+        self.run(lambda batch: batch.withdraw(username, amount))
+
+    def transfer(self, sender, recipient, amount):
+        self.run(lambda batch: batch.transfer(sender, recipient, amount))
+
+    def apply_batch(self, operations):
+        # operations are ("deposit", user, amount), ("withdraw", user, amount)
+        # or ("transfer", sender, recipient, amount). Valid ones are written
+        # in one commit; the rest come back as (index, operation, error).
+        operations = list(operations)
+
+        def apply(batch):
+            rejected = []
+            for index, operation in enumerate(operations):
+                kind = operation[0]
+                if kind not in ("deposit", "withdraw", "transfer"):
+                    rejected.append((index, operation, LedgerError(f"Unknown operation: {kind}")))
+                    continue
+                try:
+                    getattr(batch, kind)(*operation[1:])
+                except LedgerError as e:
+                    rejected.append((index, operation, e))
+            return rejected
+
+        return self.run(apply)
+
+    def import_deposits(self, rows, reject):
+        # rows yield (username, amount, memo). Invalid ones are handed to
+        # reject(row, error); all others are credited in one streamed commit,
+        # so even a very large import is never held in memory as a list.
+        totals = {"applied": 0, "amount": 0}
+
+        def changes():
+            for row in rows:
+                username, amount, memo = row
+                try:
+                    minor = positive_minor(amount)
+                    user_data = self.store.get_user(username)
+                    if user_data is None:
+                        raise UnknownUser()
+                except LedgerError as e:
+                    reject(row, e)
+                    continue
+                tx = {"timestamp": datetime.now().isoformat(), "type": "deposit", "amount": from_minor(minor)}
+                if memo:
+                    tx["memo"] = memo
+                totals["applied"] += 1
+                totals["amount"] += minor
+                balance = to_minor(user_data["balance"]) + minor
+                yield user_change(username, fields={"balance": from_minor(balance)}, append=[tx])
+
+        self.store.commit_stream(changes())
+        return totals["applied"], from_minor(totals["amount"])
+
+    def register(self, username, password):
+        if self.store.has_user(username):
+            raise UserExists()
+        try:
+            self.store.commit([user_change(username, fields={"auth": hash_password(password), "balance": 0}, expect=0)])
+        except ConflictError:
+            raise UserExists()
+
+    def check_password(self, username, password):
+        user_data = self.store.get_user(username)
+        return bool(user_data) and password_matches(user_data, password)
+
+    def authenticate(self, username, password):
+        user_data = self.store.get_user(username)
+        if not user_data or not password_matches(user_data, password):
+            return False
+        if "auth" not in user_data:
+            # Plain-text passwords from old data files are hashed on first login.
+            self.set_password(username, password)
+        return True
+
+    def set_password(self, username, new_password):
+        if not self.store.has_user(username):
+            raise UnknownUser()
+        self.store.commit([user_change(username, fields={"auth": hash_password(new_password)}, remove=["password"])])
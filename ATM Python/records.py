@@ -0,0 +1,173 @@
+import sys
+from array import array
+from datetime import datetime, timedelta
+from itertools import compress
+
+EPOCH = datetime(1970, 1, 1)
+DAY = 86400 * 1000000
+# Sorts before every real timestamp, like "" did for string timestamps.
+NO_TIMESTAMP = -(1 << 63)
+
+# Type codes only exist in memory, so unseen types are simply interned on
+# first use.
+TYPE_NAMES = ["deposit", "withdrawal", "transfer_in", "transfer_out"]
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+COUNTERPARTY_KEYS = {"transfer_out": "to", "transfer_in": "from"}
+CREDIT_TYPES = ("deposit", "transfer_in")
+REGULAR_KEYS = {"timestamp", "type", "amount", "to", "from", "memo"}
+# Maps a type code byte to 1 for credits, so a whole column can be turned
+# into a mask with bytes.translate.
+CREDIT_MASK = bytes(1 if code < len(TYPE_NAMES) and TYPE_NAMES[code] in CREDIT_TYPES else 0 for code in range(256))
+
+
+def to_minor(amount):
+    return round(amount * 100)
+
+
+def from_minor(minor):
+    return minor / 100
+
+
+def epoch_of(moment):
+    # Naive wall-clock microseconds since 1970-01-01, so that integer
+    # division by DAY gives the same calendar day as timestamp[:10].
+    if moment.tzinfo is not None:
+        moment = moment.replace(tzinfo=None)
+    delta = moment - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def to_epoch(timestamp):
+    return epoch_of(datetime.fromisoformat(timestamp))
+
+
+def from_epoch(microseconds):
+    return (EPOCH + timedelta(microseconds=microseconds)).isoformat()
+
+
+def day_number(day):
+    return to_epoch(day) // DAY
+
+
+def type_code(name):
+    code = TYPE_CODES.get(name)
+    if code is None:
+        code = TYPE_CODES[name] = len(TYPE_NAMES)
+        TYPE_NAMES.append(name)
+    return code
+
+
+def is_regular(tx, moment, amount):
+    # Only records that read back exactly as they were written are packed;
+    # the rest are kept verbatim.
+    if not REGULAR_KEYS.issuperset(tx) or not isinstance(tx.get("type"), str):
+        return False
+    if moment.tzinfo is not None or moment.isoformat() != tx["timestamp"] or from_minor(amount) != tx.get("amount"):
+        return False
+    counterparty_key = COUNTERPARTY_KEYS.get(tx["type"])
+    for key in ("to", "from"):
+        if key in tx and (key != counterparty_key or not isinstance(tx[key], str)):
+            return False
+    return isinstance(tx.get("memo", ""), str)
+
+
+class TransactionLog:
+    # One account's history as parallel arrays of epoch microseconds,
+    # interned type codes and amounts in minor units (tetri). Counterparties
+    # and memos sit in sparse dicts, and records that would not round-trip
+    # (legacy plain strings, odd timestamps, extra fields) are kept as-is in
+    # `irregular`. Items still read back as the usual transaction dicts.
+    __slots__ = ("timestamps", "types", "amounts", "counterparties", "memos", "irregular")
+
+    def __init__(self, transactions=()):
+        self.timestamps = array("q")
+        self.types = array("B")
+        self.amounts = array("q")
+        self.counterparties = {}
+        self.memos = {}
+        self.irregular = {}
+        self.extend(transactions)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, tx):
+        position = len(self.timestamps)
+        if not isinstance(tx, dict):
+            self.timestamps.append(NO_TIMESTAMP)
+            self.types.append(type_code(None))
+            self.amounts.append(0)
+            self.irregular[position] = tx
+            return
+        try:
+            moment = datetime.fromisoformat(tx["timestamp"])
+            timestamp = epoch_of(moment)
+        except (KeyError, TypeError, ValueError):
+            moment = None
+            timestamp = NO_TIMESTAMP
+        try:
+            amount = to_minor(tx.get("amount", 0))
+        except (TypeError, ValueError, OverflowError):
+            amount = 0
+        tx_type = tx.get("type")
+        self.timestamps.append(timestamp)
+        self.types.append(type_code(tx_type if isinstance(tx_type, str) else None))
+        self.amounts.append(amount)
+        if moment is None or not is_regular(tx, moment, amount):
+            self.irregular[position] = tx
+            return
+        counterparty = tx.get("to", tx.get("from"))
+        if counterparty is not None:
+            # Counterparties are usernames and repeat a lot.
+            self.counterparties[position] = sys.intern(counterparty)
+        if "memo" in tx:
+            self.memos[position] = tx["memo"]
+
+    def extend(self, transactions):
+        for tx in transactions:
+            self.append(tx)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self.timestamps)
+        if not 0 <= position < len(self.timestamps):
+            raise IndexError(position)
+        if position in self.irregular:
+            return self.irregular[position]
+        type_name = TYPE_NAMES[self.types[position]]
+        tx = {"timestamp": from_epoch(self.timestamps[position]), "type": type_name, "amount": from_minor(self.amounts[position])}
+        if position in self.counterparties:
+            tx[COUNTERPARTY_KEYS[type_name]] = self.counterparties[position]
+        if position in self.memos:
+            tx["memo"] = self.memos[position]
+        return tx
+
+    def net(self, positions=None):
+        # Credits minus debits over the given positions, in minor units.
+        credits = {TYPE_CODES[name] for name in CREDIT_TYPES}
+        types, amounts = self.types, self.amounts
+        if positions is None:
+            positions = range(len(types))
+        return sum(amounts[position] if types[position] in credits else -amounts[position] for position in positions)
+
+    def net_from(self, start=0):
+        # Same as net() over every position from `start`, but the loops run
+        # in C: credits are picked out with a translated mask of the types.
+        amounts = self.amounts[start:]
+        credits = sum(compress(amounts, self.types[start:].tobytes().translate(CREDIT_MASK)))
+        return 2 * credits - sum(amounts)
+
+    def transfers_from(self, start=0):
+        # Yields (type, counterparty, amount in minor units) for transfers at
+        # `start` or later, newest first.
+        for position, counterparty in reversed(self.counterparties.items()):
+            if position < start:
+                break
+            yield TYPE_NAMES[self.types[position]], counterparty, self.amounts[position]
+        for position, tx in self.irregular.items():
+            if position >= start and isinstance(tx, dict) and tx.get("type") in COUNTERPARTY_KEYS:
+                yield tx["type"], tx.get(COUNTERPARTY_KEYS[tx["type"]]), self.amounts[position]
+
+    def __iter__(self):
+        for position in range(len(self.timestamps)):
+            yield self[position]
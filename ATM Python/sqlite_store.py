@@ -0,0 +1,438 @@
+import argparse
+import json
+import sqlite3
+from contextlib import contextmanager
+
+from records import COUNTERPARTY_KEYS, CREDIT_TYPES
+from storage import SNAPSHOT_FORMAT, TRANSACTION_CATEGORIES, ConflictError, last_activity, replay_journal
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    username TEXT PRIMARY KEY,
+    salt TEXT,
+    hash TEXT,
+    password TEXT,
+    balance REAL NOT NULL DEFAULT 0,
+    profile_pic TEXT,
+    profile_thumb TEXT,
+    tx_count INTEGER NOT NULL DEFAULT 0,
+    last_activity TEXT NOT NULL DEFAULT '',
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL REFERENCES accounts(username),
+    timestamp TEXT,
+    type TEXT,
+    amount REAL,
+    counterparty TEXT,
+    memo TEXT,
+    raw TEXT
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_transactions_user_time ON transactions(username, timestamp);
+CREATE INDEX IF NOT EXISTS idx_transactions_user_type_time ON transactions(username, type, timestamp);
+CREATE INDEX IF NOT EXISTS idx_accounts_balance ON accounts(balance, username);
+CREATE INDEX IF NOT EXISTS idx_accounts_tx_count ON accounts(tx_count, username);
+CREATE INDEX IF NOT EXISTS idx_accounts_last_activity ON accounts(last_activity, username);
+"""
+
+# Columns added after the first release, with how to backfill them.
+ADDED_COLUMNS = [
+    ("accounts", "tx_count", "INTEGER NOT NULL DEFAULT 0",
+     "(SELECT COUNT(*) FROM transactions t WHERE t.username = accounts.username)"),
+    ("accounts", "last_activity", "TEXT NOT NULL DEFAULT ''",
+     "(SELECT IFNULL(MAX(timestamp), '') FROM transactions t WHERE t.username = accounts.username)"),
+    ("accounts", "profile_thumb", "TEXT", None),
+    ("accounts", "version", "INTEGER NOT NULL DEFAULT 1", None),
+    ("transactions", "memo", "TEXT", None),
+]
+
+SUMMARY_ORDERS = {"username": "username", "balance": "balance", "transactions": "tx_count", "last_activity": "last_activity"}
+
+
+def transaction_row(username, tx):
+    if isinstance(tx, str):
+        return (username, "", None, None, None, None, tx)
+    counterparty = tx.get("to", tx.get("from"))
+    return (username, tx.get("timestamp", ""), tx.get("type"), tx.get("amount", 0.0), counterparty, tx.get("memo"), None)
+
+
+def transaction_from_row(timestamp, tx_type, amount, counterparty, memo, raw):
+    if raw is not None:
+        return raw
+    tx = {"timestamp": timestamp, "type": tx_type, "amount": amount}
+    if counterparty is not None:
+        tx[COUNTERPARTY_KEYS.get(tx_type, "to")] = counterparty
+    if memo is not None:
+        tx["memo"] = memo
+    return tx
+
+
+def add_date_clauses(clauses, params, since, until):
+    if since:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        if not since:
+            # Undated legacy rows ("") only fall in unbounded ranges.
+            clauses.append("timestamp > ''")
+        clauses.append("timestamp < ?")
+        params.append(until + "\uffff")
+
+
+class SqliteStore:
+    def __init__(self, path):
+        self.path = path
+        # WAL lets other terminals keep reading while one of them writes.
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.upgrade_schema()
+        self.conn.executescript(INDEXES)
+        self.data_version = self.read_data_version()
+
+    def upgrade_schema(self):
+        with self.conn:
+            for table, name, declaration, backfill in ADDED_COLUMNS:
+                columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+                if name in columns:
+                    continue
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+                if backfill:
+                    self.conn.execute(f"UPDATE {table} SET {name} = {backfill}")
+
+    def read_data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def poll_changes(self, blocking=True):
+        # data_version only moves when another connection commits; callers
+        # then re-read the single rows they display. Under WAL this never
+        # waits for a writer, blocking or not.
+        version = self.read_data_version()
+        if version == self.data_version:
+            return set()
+        self.data_version = version
+        return None
+
+    def close(self):
+        self.conn.close()
+
+    def has_user(self, username):
+        row = self.conn.execute("SELECT 1 FROM accounts WHERE username=?", (username,)).fetchone()
+        return row is not None
+
+    def get_user(self, username):
+        row = self.conn.execute(
+            "SELECT salt, hash, password, balance, profile_pic, profile_thumb, version FROM accounts WHERE username=?", (username,)
+        ).fetchone()
+        if row is None:
+            return None
+        salt, hashed, password, balance, profile_pic, profile_thumb, version = row
+        user = {"balance": balance, "version": version}
+        if hashed is not None:
+            user["auth"] = {"salt": salt, "hash": hashed}
+        if password is not None:
+            user["password"] = password
+        if profile_pic is not None:
+            user["profile_pic"] = profile_pic
+        if profile_thumb is not None:
+            user["profile_thumb"] = profile_thumb
+        return user
+
+    def usernames(self):
+        return [row[0] for row in self.conn.execute("SELECT username FROM accounts")]
+
+    def transactions(self, username):
+        rows = self.conn.execute(
+            "SELECT timestamp, type, amount, counterparty, memo, raw FROM transactions WHERE username=? ORDER BY id",
+            (username,)
+        )
+        return [transaction_from_row(*row) for row in rows]
+
+    def transaction_count(self, username):
+        return self.conn.execute("SELECT tx_count FROM accounts WHERE username=?", (username,)).fetchone()[0]
+
+    def account_summaries(self, order="username", descending=False, prefix=""):
+        # Sorting and prefix search are served by the accounts indexes; rows
+        # are streamed from one cursor so callers can consume them in chunks.
+        column = SUMMARY_ORDERS[order]
+        direction = "DESC" if descending else "ASC"
+        query = "SELECT username, balance, tx_count, last_activity FROM accounts"
+        params = ()
+        if prefix:
+            query += " WHERE username >= ? AND username < ?"
+            params = (prefix, prefix + "\uffff")
+        cursor = self.conn.execute(f"{query} ORDER BY {column} {direction}, username {direction}", params)
+        while True:
+            rows = cursor.fetchmany(500)
+            if not rows:
+                return
+            yield from rows
+
+    def withdrawn_on(self, username, day):
+        # Range scan on (username, timestamp): only the day's rows are read.
+        row = self.conn.execute(
+            "SELECT TOTAL(amount) FROM transactions WHERE username=? AND timestamp >= ? AND timestamp < ? AND type='withdrawal'",
+            (username, day, day + "\uffff")
+        ).fetchone()
+        return row[0]
+
+    def history_page(self, username, category=None, since=None, until=None, before=None, limit=100):
+        # Keyset pagination on (timestamp, id), newest first; `before` is the
+        # cursor returned by the previous page.
+        clauses = ["username=?"]
+        params = [username]
+        if category == "other":
+            clauses.append("(type IS NULL OR type NOT IN (%s))" % ", ".join("?" * len(TRANSACTION_CATEGORIES)))
+            params.extend(TRANSACTION_CATEGORIES)
+        elif category:
+            types = [tx_type for tx_type, name in TRANSACTION_CATEGORIES.items() if name == category]
+            clauses.append("type IN (%s)" % ", ".join("?" * len(types)))
+            params.extend(types)
+        add_date_clauses(clauses, params, since, until)
+        if before is not None:
+            clauses.append("(timestamp, id) < (?, ?)")
+            params.extend(before)
+        rows = self.conn.execute(
+            "SELECT id, timestamp, type, amount, counterparty, memo, raw FROM transactions WHERE %s "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?" % " AND ".join(clauses),
+            (*params, limit)
+        ).fetchall()
+        cursor = (rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+        return [transaction_from_row(*row[1:]) for row in rows], cursor
+
+    def iter_history(self, username, since=None, until=None):
+        # Oldest first, streamed from the (username, timestamp) index.
+        clauses = ["username=?"]
+        params = [username]
+        add_date_clauses(clauses, params, since, until)
+        cursor = self.conn.execute(
+            "SELECT timestamp, type, amount, counterparty, memo, raw FROM transactions WHERE %s "
+            "ORDER BY timestamp, id" % " AND ".join(clauses),
+            params
+        )
+        while True:
+            rows = cursor.fetchmany(500)
+            if not rows:
+                return
+            for row in rows:
+                yield transaction_from_row(*row)
+
+    def net_change(self, username, since=None):
+        # Credits minus debits dated `since` or later (all when None).
+        clauses = ["username=?"]
+        params = [username]
+        add_date_clauses(clauses, params, since, None)
+        row = self.conn.execute(
+            "SELECT TOTAL(CASE WHEN type IN (%s) THEN amount ELSE -amount END) FROM transactions WHERE %s"
+            % (", ".join("?" * len(CREDIT_TYPES)), " AND ".join(clauses)),
+            (*CREDIT_TYPES, *params)
+        ).fetchone()
+        return row[0]
+
+    @contextmanager
+    def snapshot(self):
+        # One read transaction, so every read inside sees the same commit.
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            self.conn.execute("COMMIT")
+
+    def audit_tail(self, username, start=0):
+        # (end, count, net, transfers) for the rows with id > `start`; net and
+        # transfer amounts are in minor units, and identical transfers are
+        # counted rather than listed.
+        credits = ", ".join("?" * len(CREDIT_TYPES))
+        end, count, net = self.conn.execute(
+            "SELECT IFNULL(MAX(id), ?), COUNT(*), IFNULL(SUM(CASE WHEN type IN (%s) THEN 1 ELSE -1 END * CAST(ROUND(amount * 100) AS INTEGER)), 0) "
+            "FROM transactions WHERE username=? AND id > ?" % credits,
+            (start, *CREDIT_TYPES, username, start)
+        ).fetchone()
+        transfers = self.conn.execute(
+            "SELECT type, counterparty, CAST(ROUND(amount * 100) AS INTEGER), COUNT(*) FROM transactions "
+            "WHERE username=? AND id > ? AND type IN (?, ?) GROUP BY 1, 2, 3",
+            (username, start, *COUNTERPARTY_KEYS)
+        ).fetchall()
+        return end, count, net, transfers
+
+    def commit(self, changes):
+        # BEGIN IMMEDIATE takes the write lock before the version checks, so
+        # nothing can slip in between checking and updating.
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for change in changes:
+                if "expect" not in change:
+                    continue
+                row = cursor.execute("SELECT version FROM accounts WHERE username=?", (change["user"],)).fetchone()
+                if (row[0] if row else 0) != change["expect"]:
+                    raise ConflictError(change["user"])
+            for change in changes:
+                self.apply_change(cursor, change)
+
+    def commit_stream(self, changes):
+        # Same as commit() for a generator of changes: each one is checked
+        # and applied as it comes, and everything rolls back on an error.
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for change in changes:
+                if "expect" in change:
+                    row = cursor.execute("SELECT version FROM accounts WHERE username=?", (change["user"],)).fetchone()
+                    if (row[0] if row else 0) != change["expect"]:
+                        raise ConflictError(change["user"])
+                self.apply_change(cursor, change)
+
+    def apply_change(self, cursor, change):
+        username = change["user"]
+        cursor.execute("INSERT OR IGNORE INTO accounts (username, version) VALUES (?, 0)", (username,))
+        columns = {}
+        for key, value in change.get("set", {}).items():
+            if key == "auth":
+                columns["salt"] = value["salt"]
+                columns["hash"] = value["hash"]
+            elif key in ("balance", "password", "profile_pic", "profile_thumb"):
+                columns[key] = value
+        for key in change.get("unset", ()):
+            if key in ("password", "profile_pic", "profile_thumb"):
+                columns[key] = None
+        assignments = "".join(f", {column}=?" for column in columns)
+        cursor.execute(f"UPDATE accounts SET version = version + 1{assignments} WHERE username=?", (*columns.values(), username))
+        if change.get("append"):
+            cursor.execute(
+                "UPDATE accounts SET tx_count = tx_count + ?, last_activity = MAX(last_activity, ?) WHERE username=?",
+                (len(change["append"]), last_activity(change["append"]), username)
+            )
+            cursor.executemany(
+                "INSERT INTO transactions (username, timestamp, type, amount, counterparty, memo, raw) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [transaction_row(username, tx) for tx in change["append"]]
+            )
+
+
+class JsonObjectStream:
+    # Incremental reader for one large JSON object: members are decoded one
+    # value at a time, so a users.json never has to fit in memory at once.
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size):
+        chunk = self.f.read(size)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        if not chunk:
+            self.eof = True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self.fill(self.chunk_size)
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in JSON stream")
+        self.pos += 1
+
+    def value(self):
+        decoder = json.JSONDecoder()
+        size = self.chunk_size
+        while True:
+            self.peek()
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+                # A number at the very end of the buffer may still be cut off.
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill(size)
+            size *= 2
+
+    def members(self):
+        # Yields keys of the object whose "{" was just consumed; the caller
+        # must read each member's value before asking for the next key.
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return
+
+
+def iter_users(stream):
+    # Yields (username, record) from either a legacy {username: {...}} file or
+    # a journal snapshot {"format": 2, "seq": n, "users": {...}}; the snapshot
+    # sequence number is reported as a ("__seq__", n) pair.
+    snapshot = False
+    for key in stream.members():
+        if key == "format" and stream.peek() not in ("{", "["):
+            snapshot = stream.value() == SNAPSHOT_FORMAT
+        elif snapshot and key == "seq":
+            yield "__seq__", stream.value()
+        elif snapshot and key == "users":
+            for username in stream.members():
+                yield username, stream.value()
+        else:
+            yield key, stream.value()
+
+
+def migrate_json(json_path, db_path):
+    store = SqliteStore(db_path)
+    seq = 0
+    users = 0
+    transactions = 0
+    try:
+        with store.conn:
+            cursor = store.conn.cursor()
+            with open(json_path, "r", encoding="utf-8") as f:
+                for username, data in iter_users(JsonObjectStream(f)):
+                    if username == "__seq__":
+                        seq = data
+                        continue
+                    auth = data.get("auth", {})
+                    history = data.get("transactions", [])
+                    cursor.execute(
+                        "INSERT INTO accounts (username, salt, hash, password, balance, profile_pic, profile_thumb, tx_count, last_activity) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (username, auth.get("salt"), auth.get("hash"), data.get("password"), data.get("balance", 0),
+                         data.get("profile_pic"), data.get("profile_thumb"), len(history), last_activity(history))
+                    )
+                    cursor.executemany(
+                        "INSERT INTO transactions (username, timestamp, type, amount, counterparty, memo, raw) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (transaction_row(username, tx) for tx in history)
+                    )
+                    users += 1
+                    transactions += len(history)
+            seq, _ = replay_journal(f"{json_path}.journal.old", cursor, seq, apply=store.apply_change)
+            replay_journal(f"{json_path}.journal", cursor, seq, apply=store.apply_change)
+    finally:
+        store.close()
+    return users, transactions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate the ATM users.json ledger into SQLite.")
+    parser.add_argument("--json", default="users.json", help="source ledger (default: users.json)")
+    parser.add_argument("--db", default="users.db", help="target database (default: users.db)")
+    args = parser.parse_args()
+    migrated_users, migrated_transactions = migrate_json(args.json, args.db)
+    print(f"Migrated {migrated_users} users and {migrated_transactions} transactions into {args.db}.")
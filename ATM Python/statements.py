@@ -0,0 +1,212 @@
+import argparse
+import csv
+import os
+import re
+from datetime import datetime
+from multiprocessing import Pool
+
+from ledger import DB_FILE, SQLITE_FILE, LedgerError, UnknownUser, open_store
+from records import CREDIT_TYPES, from_minor, to_minor
+
+FORMATS = {"csv": ".csv", "text": ".txt"}
+SUBTOTAL_LABELS = {"deposit": "Deposits", "withdrawal": "Withdrawals", "transfer_in": "Transfers in", "transfer_out": "Transfers out"}
+PAGE_LINES = 50
+TEXT_COLUMNS = "{:<19}  {:<10}  {:<26}  {:>14}  {:>14}"
+
+
+def describe_transaction(tx):
+    # (date, type, signed amount in minor units, details); the ATM history
+    # view shows transactions the same way.
+    if isinstance(tx, str):
+        return "", "", 0, tx
+    raw_type = tx.get('type', 'unknown')
+    if raw_type in ["transfer_out", "transfer_in"]:
+        tx_type = "Transfer"
+    else:
+        tx_type = str(raw_type).capitalize()
+    amount = to_minor(tx.get('amount', 0.0))
+    if raw_type not in CREDIT_TYPES:
+        amount = -amount
+    details = ""
+    if "to" in tx:
+        details = f"To: {tx['to']}"
+    elif "from" in tx:
+        details = f"From: {tx['from']}"
+    if tx.get("memo"):
+        details = f"{details} ({tx['memo']})" if details else tx["memo"]
+    return tx.get('timestamp', '')[:19].replace('T', ' '), tx_type, amount, details
+
+
+def money(minor):
+    return f"{from_minor(minor):,.2f}"
+
+
+class Statement:
+    # One account over a period. rows() streams the transactions oldest
+    # first with a running balance; the subtotals and closing balance are
+    # complete once it is exhausted. The opening balance is worked back
+    # from the current balance, so accounts with history from before
+    # transactions were recorded still add up.
+    def __init__(self, store, username, since=None, until=None):
+        self.store = store
+        self.username = username
+        self.since = since
+        self.until = until
+        user_data = store.get_user(username)
+        if user_data is None:
+            raise UnknownUser()
+        self.opening = to_minor(user_data["balance"]) - to_minor(store.net_change(username, since))
+        self.closing = self.opening
+        self.subtotals = {}
+
+    def rows(self):
+        balance = self.opening
+        for tx in self.store.iter_history(self.username, self.since, self.until):
+            date, tx_type, amount, details = describe_transaction(tx)
+            balance += amount
+            label = SUBTOTAL_LABELS.get(tx.get("type") if isinstance(tx, dict) else None, "Other")
+            subtotal = self.subtotals.setdefault(label, [0, 0])
+            subtotal[0] += 1
+            subtotal[1] += amount
+            yield date, tx_type, details, amount, balance
+        self.closing = balance
+
+    def period(self):
+        return f"{self.since or 'first transaction'} to {self.until or datetime.now().strftime('%Y-%m-%d')}"
+
+
+def write_csv(statement, f):
+    writer = csv.writer(f)
+    writer.writerow(["date", "type", "details", "amount", "balance"])
+    writer.writerow(["", "Opening balance", statement.period(), "", money(statement.opening)])
+    for date, tx_type, details, amount, balance in statement.rows():
+        writer.writerow([date, tx_type, details, money(amount), money(balance)])
+    for label, (count, amount) in statement.subtotals.items():
+        writer.writerow(["", f"Subtotal: {label}", f"{count} transactions", money(amount), ""])
+    writer.writerow(["", "Closing balance", "", "", money(statement.closing)])
+
+
+def write_text(statement, f):
+    # Fixed-width pages separated by form feeds, each with its own header.
+    page = 0
+    lines = PAGE_LINES
+
+    def new_page():
+        nonlocal page, lines
+        if page:
+            f.write("\f")
+        page += 1
+        lines = 0
+        f.write(f"{'STATEMENT OF ACCOUNT':<70}{'Page ' + str(page):>20}\n")
+        f.write(f"Account: {statement.username}\nPeriod:  {statement.period()}\n\n")
+        f.write(TEXT_COLUMNS.format("Date", "Type", "Details", "Amount (GEL)", "Balance (GEL)") + "\n")
+        f.write("-" * 91 + "\n")
+
+    def write_line(text):
+        nonlocal lines
+        if lines >= PAGE_LINES:
+            new_page()
+        f.write(text + "\n")
+        lines += 1
+
+    write_line(TEXT_COLUMNS.format("", "", "Opening balance", "", money(statement.opening)))
+    for date, tx_type, details, amount, balance in statement.rows():
+        write_line(TEXT_COLUMNS.format(date, tx_type, details[:26], money(amount), money(balance)))
+    write_line("-" * 91)
+    for label, (count, amount) in statement.subtotals.items():
+        write_line(TEXT_COLUMNS.format("", "", f"{label} ({count})", money(amount), ""))
+    write_line(TEXT_COLUMNS.format("", "", "Closing balance", "", money(statement.closing)))
+
+
+WRITERS = {"csv": write_csv, "text": write_text}
+
+
+def statement_path(out_dir, username, since, until, fmt):
+    name = re.sub(r"[^\w.-]", "_", username)
+    return os.path.join(out_dir, f"{name}_{since or 'start'}_{until or 'today'}{FORMATS[fmt]}")
+
+
+def write_statements(store, username, out_dir, since=None, until=None, formats=("csv",)):
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for fmt in formats:
+        path = statement_path(out_dir, username, since, until, fmt)
+        with open(path, "w", newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+            WRITERS[fmt](Statement(store, username, since, until), f)
+        paths.append(path)
+    return paths
+
+
+worker_store = None
+
+
+def init_worker(json_path, db_path):
+    global worker_store
+    worker_store = open_store(json_path, db_path)
+
+
+def worker_statements(job):
+    return write_statements(worker_store, *job)
+
+
+def generate_all(usernames, out_dir, since=None, until=None, formats=("csv",), json_path=DB_FILE, db_path=SQLITE_FILE,
+                 processes=None, progress=None):
+    # On SQLite each worker opens the ledger once and streams one account
+    # at a time, so its memory does not grow with the size of the bank.
+    # The JSON ledger can only be opened by loading all of it, so a pool
+    # would hold a copy per worker; it is written by this process from a
+    # single copy instead. Migrate big ledgers to SQLite for batch runs.
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = ((username, out_dir, since, until, tuple(formats)) for username in usernames)
+    done = 0
+    if not os.path.exists(db_path):
+        store = open_store(json_path, db_path)
+        try:
+            for job in jobs:
+                write_statements(store, *job)
+                done += 1
+                if progress:
+                    progress(done)
+        finally:
+            store.close()
+        return done
+    with Pool(processes, initializer=init_worker, initargs=(json_path, db_path)) as pool:
+        for _ in pool.imap_unordered(worker_statements, jobs, chunksize=32):
+            done += 1
+            if progress:
+                progress(done)
+    return done
+
+
+def day(value):
+    datetime.strptime(value, '%Y-%m-%d')
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write ATM account statements with running balances.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--user", help="account to write a statement for")
+    target.add_argument("--all", action="store_true", help="every account, using a process pool")
+    parser.add_argument("--since", type=day, help="first day, YYYY-MM-DD (default: first transaction)")
+    parser.add_argument("--until", type=day, help="last day, YYYY-MM-DD (default: today)")
+    parser.add_argument("--format", choices=list(FORMATS), nargs="+", default=["csv"])
+    parser.add_argument("--out", default="statements", help="output directory (default: statements)")
+    parser.add_argument("--processes", type=int, help="worker processes for --all (default: one per CPU)")
+    parser.add_argument("--json", default=DB_FILE, help=f"JSON ledger (default: {DB_FILE})")
+    parser.add_argument("--db", default=SQLITE_FILE, help=f"SQLite ledger, used when it exists (default: {SQLITE_FILE})")
+    args = parser.parse_args()
+    store = open_store(args.json, args.db)
+    if args.user:
+        try:
+            paths = write_statements(store, args.user, args.out, args.since, args.until, args.format)
+        except LedgerError as e:
+            parser.error(str(e))
+        finally:
+            store.close()
+        print("\n".join(paths))
+    else:
+        usernames = store.usernames()
+        store.close()
+        count = generate_all(usernames, args.out, args.since, args.until, args.format, args.json, args.db, args.processes)
+        print(f"Wrote statements for {count} accounts to {args.out}.")
@@ -0,0 +1,531 @@
+import json
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from contextlib import contextmanager
+
+from records import DAY, NO_TIMESTAMP, TYPE_CODES, TYPE_NAMES, TransactionLog, day_number, from_minor, to_epoch
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SNAPSHOT_FORMAT = 2
+COMPACT_BYTES = 4 * 1024 * 1024
+
+TRANSACTION_CATEGORIES = {
+    "deposit": "deposit",
+    "withdrawal": "withdrawal",
+    "transfer_in": "transfer",
+    "transfer_out": "transfer",
+}
+
+
+class ConflictError(Exception):
+    pass
+
+
+def account_version(user_data):
+    # Accounts written before versioning count as version 1, so that 0
+    # always means "does not exist yet".
+    if user_data is None:
+        return 0
+    return user_data.get("version", 1)
+
+
+def user_change(username, fields=None, remove=None, append=None, expect=None):
+    # `expect` makes the change conditional on the account still being at
+    # that version when the commit lands (compare-and-swap).
+    change = {"user": username}
+    if expect is not None:
+        change["expect"] = expect
+    if fields:
+        change["set"] = fields
+    if remove:
+        change["unset"] = list(remove)
+    if append:
+        change["append"] = list(append)
+    return change
+
+
+def apply_change(users, change, history=list):
+    user = users.setdefault(change["user"], {"balance": 0, "transactions": history(), "version": 0})
+    user["version"] = account_version(user) + 1
+    for key, value in change.get("set", {}).items():
+        user[key] = value
+    for key in change.get("unset", ()):
+        user.pop(key, None)
+    if "transactions" not in user:
+        user["transactions"] = history()
+    user["transactions"].extend(change.get("append", ()))
+
+
+def record_withdrawals(daily, username, log, start=0):
+    # daily maps username -> [day number, total in minor units] for the most
+    # recent day with a withdrawal; older days can never count against
+    # today's limit.
+    withdrawal = TYPE_CODES["withdrawal"]
+    types, timestamps, amounts = log.types, log.timestamps, log.amounts
+    for position in range(start, len(types)):
+        if types[position] != withdrawal:
+            continue
+        day = timestamps[position] // DAY
+        entry = daily.get(username)
+        if entry is None or day > entry[0]:
+            daily[username] = [day, amounts[position]]
+        elif day == entry[0]:
+            entry[1] += amounts[position]
+
+
+def type_category(code):
+    return TRANSACTION_CATEGORIES.get(TYPE_NAMES[code], "other")
+
+
+SUMMARY_COLUMNS = ("balance", "transactions", "last_activity")
+
+
+def last_activity(transactions):
+    for tx in reversed(transactions):
+        if isinstance(tx, dict) and tx.get("timestamp"):
+            return tx["timestamp"]
+    return ""
+
+
+def summarize(data):
+    history = data.get("transactions", [])
+    return [data.get("balance", 0), len(history), last_activity(history)]
+
+
+def index_transactions(index, log, start):
+    # index maps category (and None for "everything") to parallel arrays of
+    # epoch timestamps and positions sorted by (timestamp, position), so
+    # date ranges resolve with bisect; the SQLite store orders the same
+    # way. History is nearly always in date order, so this appends; an
+    # older timestamp is slotted in after its equals.
+    for position in range(start, len(log)):
+        timestamp = log.timestamps[position]
+        for key in (None, type_category(log.types[position])):
+            if key not in index:
+                index[key] = (array("q"), array("q"))
+            timestamps, positions = index[key]
+            if timestamps and timestamp < timestamps[-1]:
+                at = bisect_right(timestamps, timestamp)
+                timestamps.insert(at, timestamp)
+                positions.insert(at, position)
+            else:
+                timestamps.append(timestamp)
+                positions.append(position)
+
+
+def fsync_dir(path):
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(path)
+
+
+def read_snapshot(path):
+    # Returns (seq, users). Plain {username: {...}} files written by older
+    # versions are accepted as a snapshot at sequence 0.
+    if not os.path.exists(path):
+        return 0, {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, FileNotFoundError):
+        return 0, {}
+    if data.get("format") == SNAPSHOT_FORMAT and isinstance(data.get("users"), dict):
+        return data.get("seq", 0), data["users"]
+    return 0, data
+
+
+def replay_journal(path, target, seq, truncate_torn=False, apply=apply_change):
+    # Applies every complete record newer than `seq` to `target` and returns
+    # (seq, end_offset). A torn final line left by a crash is ignored, and
+    # cut off when `truncate_torn` is set so later appends start cleanly.
+    if not os.path.exists(path):
+        return seq, 0
+    good_offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            good_offset += len(line)
+            if record["seq"] <= seq:
+                continue
+            for change in record["changes"]:
+                apply(target, change)
+            seq = record["seq"]
+    if truncate_torn and good_offset < os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(good_offset)
+    return seq, good_offset
+
+
+def read_state(path):
+    seq, users = read_snapshot(path)
+    seq, _ = replay_journal(f"{path}.journal.old", users, seq)
+    seq, _ = replay_journal(f"{path}.journal", users, seq)
+    return seq, users
+
+
+class FileLock:
+    # Advisory fcntl lock shared by every process using the same ledger.
+    # Nested acquisitions are counted so only the outermost one unlocks;
+    # callers serialize threads themselves. Without fcntl it is a no-op.
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.depth = 0
+
+    def acquire(self, blocking=True):
+        if self.depth == 0 and fcntl:
+            if self.fd is None:
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return False
+        self.depth += 1
+        return True
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0 and fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class JournalStore:
+    def __init__(self, path, compact_bytes=COMPACT_BYTES):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.old_journal_path = f"{path}.journal.old"
+        self.compact_bytes = compact_bytes
+        self.lock = threading.RLock()
+        self.file_lock = FileLock(f"{path}.lock")
+        self.compact_lock = FileLock(f"{path}.compact.lock")
+        self.journal = None
+        self.compactor = None
+        self.load()
+
+    @contextmanager
+    def locked(self):
+        with self.lock, self.file_lock:
+            yield
+
+    def load(self):
+        with self.locked():
+            seq, users = read_snapshot(self.path)
+            seq, _ = replay_journal(self.old_journal_path, users, seq)
+            seq, self.journal_size = replay_journal(self.journal_path, users, seq, truncate_torn=True)
+            self.seq = seq
+            self.users = users
+            self.daily_withdrawals = {}
+            self.history_indexes = {}
+            self.summaries = {}
+            for username, data in users.items():
+                # History is kept packed in memory; the files stay plain JSON.
+                data["transactions"] = TransactionLog(data.get("transactions", ()))
+                record_withdrawals(self.daily_withdrawals, username, data["transactions"])
+                self.summaries[username] = summarize(data)
+            self.sorted_usernames = sorted(users)
+            self.summary_orders = {}
+            # Reopen so appends follow a journal another process rotated.
+            if self.journal:
+                self.journal.close()
+            self.journal = open(self.journal_path, "ab")
+            self.journal_inode = os.fstat(self.journal.fileno()).st_ino
+
+    def close(self):
+        if self.compactor:
+            self.compactor.join()
+        with self.lock:
+            if self.journal:
+                self.journal.close()
+                self.journal = None
+            self.file_lock.close()
+            self.compact_lock.close()
+
+    def has_user(self, username):
+        return username in self.users
+
+    def get_user(self, username):
+        return self.users.get(username)
+
+    def usernames(self):
+        return list(self.users)
+
+    def transactions(self, username):
+        return self.users[username].get("transactions", [])
+
+    def transaction_count(self, username):
+        return self.summaries[username][1]
+
+    def account_summaries(self, order="username", descending=False, prefix=""):
+        # Yields (username, balance, transactions, last_activity). Usernames
+        # are kept sorted for prefix search; orderings by the other columns
+        # are built on first use and dropped when a summary changes.
+        names = self.sorted_usernames
+        if prefix:
+            names = names[bisect_left(names, prefix):bisect_left(names, prefix + "\uffff")]
+        if order != "username":
+            column = SUMMARY_COLUMNS.index(order)
+            if prefix:
+                names = sorted(names, key=lambda name: self.summaries[name][column])
+            else:
+                if order not in self.summary_orders:
+                    self.summary_orders[order] = sorted(names, key=lambda name: self.summaries[name][column])
+                names = self.summary_orders[order]
+        for name in (reversed(names) if descending else names):
+            yield (name, *self.summaries[name])
+
+    def withdrawn_on(self, username, day):
+        entry = self.daily_withdrawals.get(username)
+        return from_minor(entry[1]) if entry and entry[0] == day_number(day) else 0.0
+
+    def history_index(self, username):
+        index = self.history_indexes.get(username)
+        if index is None:
+            index = self.history_indexes[username] = {}
+            index_transactions(index, self.transactions(username), 0)
+        return index
+
+    def history_range(self, username, category=None, since=None, until=None):
+        # Returns (lo, hi, positions) for the indexed transactions dated from
+        # `since` through the whole day of `until`. Undated legacy entries
+        # sort first and only fall in ranges without either bound.
+        timestamps, positions = self.history_index(username).get(category, ((), ()))
+        if since:
+            lo = bisect_left(timestamps, to_epoch(since))
+        elif until:
+            lo = bisect_right(timestamps, NO_TIMESTAMP)
+        else:
+            lo = 0
+        hi = bisect_left(timestamps, (day_number(until) + 1) * DAY) if until else len(timestamps)
+        return lo, hi, positions
+
+    def history_page(self, username, category=None, since=None, until=None, before=None, limit=100):
+        # Newest first. `before` is the cursor returned by the previous page;
+        # the returned cursor is None once the range is exhausted.
+        lo, hi, positions = self.history_range(username, category, since, until)
+        end = hi if before is None else min(before, hi)
+        start = max(lo, end - limit)
+        history = self.transactions(username)
+        rows = [history[position] for position in reversed(positions[start:end])]
+        return rows, (start if start > lo else None)
+
+    def iter_history(self, username, since=None, until=None):
+        # Oldest first; only the positions in range are copied up front.
+        lo, hi, positions = self.history_range(username, since=since, until=until)
+        history = self.transactions(username)
+        for position in positions[lo:hi]:
+            yield history[position]
+
+    def net_change(self, username, since=None):
+        # Credits minus debits dated `since` or later (all when None).
+        lo, hi, positions = self.history_range(username, since=since)
+        return from_minor(self.transactions(username).net(positions[lo:]))
+
+    @contextmanager
+    def snapshot(self):
+        # Reads inside see no commits from this process; other processes'
+        # commits only arrive through poll_changes() anyway.
+        with self.lock:
+            yield
+
+    def audit_tail(self, username, start=0):
+        # (end, count, net, transfers) for the history from position `start`;
+        # net and transfer amounts are in minor units, and identical
+        # transfers are counted rather than listed.
+        history = self.transactions(username)
+        transfers = [(*transfer, count) for transfer, count in Counter(history.transfers_from(start)).items()]
+        return len(history), len(history) - start, history.net_from(start), transfers
+
+    def apply_changes(self, changes):
+        for change in changes:
+            username = change["user"]
+            apply_change(self.users, change, TransactionLog)
+            log = self.users[username]["transactions"]
+            start = len(log) - len(change.get("append", ()))
+            record_withdrawals(self.daily_withdrawals, username, log, start)
+            if username not in self.summaries:
+                insort(self.sorted_usernames, username)
+            self.summaries[username] = summarize(self.users[username])
+            self.summary_orders.clear()
+            index = self.history_indexes.get(username)
+            if index is not None:
+                index_transactions(index, log, start)
+
+    def read_tail(self):
+        # Picks up records appended by other writers since our last look and
+        # returns the usernames they touched, or None if another process
+        # compacted the journal and the whole state had to be reloaded.
+        if os.stat(self.journal_path).st_ino != self.journal_inode:
+            self.load()
+            return None
+        changed = set()
+        with open(self.journal_path, "rb") as f:
+            f.seek(self.journal_size)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self.journal_size += len(line)
+                record = json.loads(line)
+                if record["seq"] <= self.seq:
+                    continue
+                self.apply_changes(record["changes"])
+                changed.update(change["user"] for change in record["changes"])
+                self.seq = record["seq"]
+        return changed
+
+    def poll_changes(self, blocking=True):
+        # A stat() per call while nothing changes. Returns the set of changed
+        # usernames, or None when the journal was compacted under us and
+        # everything had to be reloaded. Without `blocking`, a poll that
+        # finds another writer holding the ledger (a long import, say)
+        # reports nothing and catches up on a later call.
+        with self.lock:
+            try:
+                stat = os.stat(self.journal_path)
+            except FileNotFoundError:
+                return set()
+            if stat.st_size == self.journal_size and stat.st_ino == self.journal_inode:
+                return set()
+            if not self.file_lock.acquire(blocking):
+                return set()
+            try:
+                return self.read_tail()
+            finally:
+                self.file_lock.release()
+
+    def commit(self, changes):
+        # The file lock only covers catching up, the version checks and the
+        # append itself; the fsync happens after it is released, so other
+        # terminals can append while this one waits on the disk.
+        with self.locked():
+            self.read_tail()
+            for change in changes:
+                if "expect" in change and account_version(self.users.get(change["user"])) != change["expect"]:
+                    raise ConflictError(change["user"])
+            record = {"seq": self.seq + 1, "changes": changes}
+            line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+            self.journal.write(line)
+            self.journal.flush()
+            self.journal_size += len(line)
+            self.seq = record["seq"]
+            self.apply_changes(changes)
+            needs_compaction = self.journal_size >= self.compact_bytes
+            journal_fd = os.dup(self.journal.fileno())
+        self.sync(journal_fd, needs_compaction)
+
+    def commit_stream(self, changes):
+        # For batches too big to build as a list: each change is written and
+        # applied as it is produced, so a generator of changes can read the
+        # store and see the ones before it. They all go into one record, so
+        # the batch still lands as a whole; if anything fails half-way the
+        # record is left torn, which load() cuts off before rebuilding state.
+        with self.locked():
+            self.read_tail()
+            size = 0
+            try:
+                header = f'{{"seq":{self.seq + 1},"changes":['.encode("utf-8")
+                self.journal.write(header)
+                size += len(header)
+                for count, change in enumerate(changes):
+                    if "expect" in change and account_version(self.users.get(change["user"])) != change["expect"]:
+                        raise ConflictError(change["user"])
+                    data = ("," if count else "") + json.dumps(change, ensure_ascii=False, separators=(",", ":"))
+                    data = data.encode("utf-8")
+                    self.journal.write(data)
+                    size += len(data)
+                    self.apply_changes([change])
+                self.journal.write(b"]}\n")
+                self.journal.flush()
+            except BaseException:
+                try:
+                    self.journal.close()
+                except OSError:
+                    pass
+                self.journal = None
+                self.load()
+                raise
+            self.journal_size += size + 3
+            self.seq += 1
+            needs_compaction = self.journal_size >= self.compact_bytes
+            journal_fd = os.dup(self.journal.fileno())
+        self.sync(journal_fd, needs_compaction)
+
+    def sync(self, journal_fd, needs_compaction):
+        try:
+            os.fsync(journal_fd)
+        finally:
+            os.close(journal_fd)
+        if needs_compaction:
+            self.compact_async()
+
+    def compact_async(self):
+        with self.lock:
+            if self.compactor and self.compactor.is_alive():
+                return
+            self.compactor = threading.Thread(target=self.compact, daemon=True)
+            self.compactor.start()
+
+    def compact(self):
+        # Rotate the live journal out of the way, then fold it into a new
+        # snapshot built from disk so commits can keep appending meanwhile.
+        # If a previous compaction died half-way, finish that one first.
+        # Only one process compacts at a time; the others just skip it.
+        if not self.compact_lock.acquire(blocking=False):
+            return
+        try:
+            with self.locked():
+                if not os.path.exists(self.old_journal_path):
+                    self.read_tail()
+                    self.journal.close()
+                    os.replace(self.journal_path, self.old_journal_path)
+                    fsync_dir(self.journal_path)
+                    self.journal = open(self.journal_path, "ab")
+                    self.journal_inode = os.fstat(self.journal.fileno()).st_ino
+                    self.journal_size = 0
+            seq, users = read_snapshot(self.path)
+            seq, _ = replay_journal(self.old_journal_path, users, seq)
+            atomic_write_json(self.path, {"format": SNAPSHOT_FORMAT, "seq": seq, "users": users})
+            # Readers hold the file lock across snapshot + journals, so they
+            # never see the new snapshot without also seeing the old journal.
+            with self.locked():
+                os.remove(self.old_journal_path)
+                fsync_dir(self.old_journal_path)
+        finally:
+            self.compact_lock.release()
@@ -0,0 +1,45 @@
+import os
+from collections import OrderedDict
+
+try:
+    from PIL import Image, ImageTk
+except ImportError:
+    Image = None
+    ImageTk = None
+
+THUMB_SIZE = (100, 100)
+
+
+def make_thumbnail(src_path, dest_path, size=THUMB_SIZE):
+    with Image.open(src_path) as img:
+        # For JPEGs this lets the decoder scale down by up to 8x while
+        # decoding; other formats ignore it.
+        img.draft("RGB", (size[0] * 2, size[1] * 2))
+        thumb = img.convert("RGB").resize(size, Image.Resampling.LANCZOS)
+    thumb.save(dest_path, "PNG")
+    return dest_path
+
+
+class PhotoCache:
+    # LRU of ready ImageTk.PhotoImage objects. Keys include the thumbnail's
+    # mtime, so a replaced file is never served from a stale entry.
+    def __init__(self, capacity=32):
+        self.capacity = capacity
+        self.photos = OrderedDict()
+
+    def get(self, key, build):
+        photo = self.photos.get(key)
+        if photo is None:
+            photo = self.photos[key] = build()
+            if len(self.photos) > self.capacity:
+                self.photos.popitem(last=False)
+        else:
+            self.photos.move_to_end(key)
+        return photo
+
+    def thumbnail(self, username, thumb_path):
+        key = (username, thumb_path, os.path.getmtime(thumb_path))
+        return self.get(key, lambda: ImageTk.PhotoImage(Image.open(thumb_path)))
+
+    def placeholder(self, color, size=THUMB_SIZE):
+        return self.get(("placeholder", color), lambda: ImageTk.PhotoImage(Image.new("RGB", size, color=color)))
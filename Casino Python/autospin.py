@@ -0,0 +1,118 @@
+import argparse
+import time
+
+from casino_db import DB_FILE, BalanceWriter, CasinoDB
+from casino_rng import RNGStream, new_seed
+from paytables import SLOT_COMBINATIONS, SLOT_REELS, slot_matches, slot_multiplier, slot_spin
+
+BATCH = 250
+# The multiplier of each reel combination and whether it is the jackpot.
+MULTIPLIERS = [slot_multiplier(reels) for reels in SLOT_COMBINATIONS]
+JACKPOTS = [slot_matches(reels) == SLOT_REELS for reels in SLOT_COMBINATIONS]
+
+
+class AutoSpin:
+    # Up to `spins` slot spins of `bet` each, played in batches from an RNG
+    # stream; each spin is scored with a table lookup. `stop_reason` is set
+    # once a stop condition is met: losing `stop_loss` or winning `stop_win`
+    # overall, a jackpot when `stop_on_jackpot`, running out of spins or of
+    # money for the bet.
+    def __init__(self, balance, bet, spins, stop_loss=None, stop_win=None, stop_on_jackpot=False, rng=None):
+        self.start_balance = balance
+        self.balance = balance
+        self.bet = bet
+        self.remaining = spins
+        self.stop_loss = stop_loss
+        self.stop_win = stop_win
+        self.stop_on_jackpot = stop_on_jackpot
+        self.rng = rng or RNGStream()
+        self.played = 0
+        self.jackpots = 0
+        self.stop_reason = None
+        self.check_stop(False)
+
+    def check_stop(self, jackpot):
+        net = self.balance - self.start_balance
+        if jackpot and self.stop_on_jackpot:
+            self.stop_reason = "Jackpot!"
+        elif self.stop_loss is not None and -net >= self.stop_loss:
+            self.stop_reason = "Stop-loss reached."
+        elif self.stop_win is not None and net >= self.stop_win:
+            self.stop_reason = "Win target reached."
+        elif self.remaining <= 0:
+            self.stop_reason = "All spins played."
+        elif self.balance < self.bet:
+            self.stop_reason = "Not enough money for another spin."
+
+    def adjust(self, change):
+        # Money won or spent outside the run (another game in the same
+        # window) moves the balance without counting towards its net.
+        if change:
+            self.start_balance += change
+            self.balance += change
+            self.check_stop(False)
+
+    def play(self, limit=BATCH):
+        # Plays up to `limit` spins and returns them as (combination index,
+        # payout, stream position) triples; fewer if a stop condition is met
+        # on the way.
+        if self.stop_reason:
+            return []
+        spins = []
+        rng = self.rng
+        for _ in range(min(limit, self.remaining)):
+            position = rng.position
+            index = slot_spin(rng)
+            payout = self.bet * MULTIPLIERS[index]
+            self.balance += payout - self.bet
+            self.remaining -= 1
+            self.played += 1
+            self.jackpots += JACKPOTS[index]
+            spins.append((index, payout, position))
+            self.check_stop(JACKPOTS[index])
+            if self.stop_reason:
+                break
+        return spins
+
+    def bets(self, spins):
+        # Bet records for BalanceWriter.settle_many().
+        return [("slots", self.bet, payout, "".join(SLOT_COMBINATIONS[index]), position, None) for index, payout, position in spins]
+
+
+def run(db, username, bet, spins, stop_loss=None, stop_win=None, stop_on_jackpot=False, seed=None):
+    # Headless auto-spin for QA bots: one commit per batch.
+    writer = BalanceWriter(db.conn)
+    rng = RNGStream(new_seed() if seed is None else seed)
+    session = db.start_session(username, rng.seed_value)
+    auto = AutoSpin(db.balance(username), bet, spins, stop_loss, stop_win, stop_on_jackpot, rng)
+    writer.track(username, auto.balance)
+    while not auto.stop_reason:
+        spins = auto.play()
+        writer.settle_many(username, auto.balance, auto.bets(spins), session)
+    return auto
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play the slot machine without animation.")
+    parser.add_argument("username")
+    parser.add_argument("--bet", type=int, default=100)
+    parser.add_argument("--spins", type=int, default=1000)
+    parser.add_argument("--stop-loss", type=int, help="stop after losing this much overall")
+    parser.add_argument("--stop-win", type=int, help="stop after winning this much overall")
+    parser.add_argument("--stop-on-jackpot", action="store_true")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--db", default=DB_FILE)
+    args = parser.parse_args()
+    db = CasinoDB(args.db)
+    try:
+        if db.password(args.username) is None:
+            parser.error(f"No player named {args.username}.")
+        if args.bet <= 0:
+            parser.error("The bet must be greater than 0.")
+        start = time.perf_counter()
+        auto = run(db, args.username, args.bet, args.spins, args.stop_loss, args.stop_win, args.stop_on_jackpot, args.seed)
+        elapsed = time.perf_counter() - start
+    finally:
+        db.close()
+    print(f"{auto.stop_reason} {auto.played:,} spins in {elapsed:.2f}s ({auto.played / max(elapsed, 1e-9):,.0f} spins/s), "
+          f"{auto.jackpots} jackpots; balance {auto.start_balance} -> {auto.balance}; seed {auto.rng.seed_value}")
@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from casino_db import BalanceWriter, CasinoDB, connect, migrate
+from casino_server import HOST, SEATS, CasinoServer
+from paytables import SLOT_REELS, SLOT_SYMBOLS, slot_multiplier
+
+USERS_TABLE = "CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, balance INTEGER)"
+
+
+def random_bet(rng, balance):
+    bet = min(balance, 100)
+    return bet, bet * slot_multiplier([rng.choice(SLOT_SYMBOLS) for _ in range(SLOT_REELS)])
+
+
+def per_update(conn, bets, rng):
+    # What update_balance() used to do: a commit for the stake and another
+    # for the payout.
+    balance = 1000
+    for _ in range(bets):
+        bet, payout = random_bet(rng, balance)
+        for balance in (balance - bet, balance - bet + payout):
+            conn.execute("UPDATE users SET balance=? WHERE username=?", (balance, "player"))
+            conn.commit()
+
+
+def write_behind(conn, bets, rng):
+    writer = BalanceWriter(conn)
+    balance = 1000
+    writer.track("player", balance)
+    for _ in range(bets):
+        bet, payout = random_bet(rng, balance)
+        balance -= bet
+        writer.stake("player", balance)
+        balance += payout
+        writer.settle("player", balance, "slots", bet, payout)
+
+
+def bench_persist(bets, seed):
+    print(f"{'persistence':>35} | {'bets/s':>9}")
+    print("-" * 49)
+    with tempfile.TemporaryDirectory() as tmp:
+        for number, (name, open_db, play) in enumerate((
+            ("rollback journal, commit per update", sqlite3.connect, per_update),
+            ("WAL, commit per update", connect, per_update),
+            ("WAL, write-behind, bet recorded", connect, write_behind),
+        )):
+            path = os.path.join(tmp, f"casino{number}.db")
+            conn = open_db(path)
+            migrate(conn)
+            conn.execute("INSERT INTO users VALUES ('player', 'secret', 1000)")
+            conn.commit()
+            start = time.perf_counter()
+            play(conn, bets, random.Random(seed))
+            elapsed = time.perf_counter() - start
+            conn.close()
+            print(f"{name:>35} | {bets / elapsed:>9,.0f}")
+
+
+def legacy_login(path, username):
+    # LoginWindow.get_db() and login() as they were: connect and run the DDL
+    # on every click.
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute(USERS_TABLE)
+    conn.commit()
+    cursor.execute("SELECT password FROM users WHERE username=?", (username,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+
+def bench_login(logins, threads):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "casino.db")
+        db = CasinoDB(path)
+        for i in range(1000):
+            db.add_user(f"user{i}", "secret")
+
+        start = time.perf_counter()
+        for i in range(logins):
+            legacy_login(path, f"user{i % 1000}")
+        legacy_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(logins):
+            db.password(f"user{i % 1000}")
+        shared_s = time.perf_counter() - start
+
+        def worker(count):
+            for i in range(count):
+                with db.pooled() as conn:
+                    conn.execute("SELECT balance FROM users WHERE username=?", (f"user{i % 1000}",)).fetchone()
+
+        workers = [threading.Thread(target=worker, args=(logins // threads,)) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        pooled_s = time.perf_counter() - start
+        db.close()
+    print(f"connect + DDL per login: {legacy_s / logins * 1e6:8.1f} us/login")
+    print(f"shared connection:       {shared_s / logins * 1e6:8.1f} us/login")
+    print(f"pool, {threads} threads:         {pooled_s / (logins // threads * threads) * 1e6:8.1f} us/lookup")
+
+
+def bench_leaderboard(bets, players, seed):
+    # Bets go in through BalanceWriter in batches, as auto-play would, so
+    # the insert rate includes the player_stats trigger.
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = CasinoDB(os.path.join(tmp, "casino.db"))
+        writer = BalanceWriter(db.conn)
+        start = time.perf_counter()
+        for i in range(bets):
+            username = f"user{rng.randrange(players)}"
+            bet, payout = random_bet(rng, 100)
+            writer.pending_bets.append((username, "slots", f"2024-01-01T00:00:{i % 60:02}", bet, payout, None, None, None, None))
+            if len(writer.pending_bets) == 1000:
+                writer.pending["player"] = 0
+                writer.flush()
+        writer.pending["player"] = 0
+        writer.flush()
+        insert_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        top = db.leaderboard("net", 10)
+        stats_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        scanned = db.conn.execute(
+            "SELECT username, SUM(payout - stake) AS net FROM bets GROUP BY username ORDER BY net DESC LIMIT 10"
+        ).fetchall()
+        scan_ms = (time.perf_counter() - start) * 1000
+        db.close()
+    assert [row["net"] for row in top] == [net for _, net in scanned]
+    print(f"{bets:,} bets over {players:,} players recorded at {bets / insert_s:,.0f} bets/s (stats trigger included)")
+    print(f"top 10 by net profit: {stats_ms:.2f} ms from player_stats, {scan_ms:.1f} ms scanning bets")
+
+
+async def table_bot(port, username, table, rounds, rng, stats):
+    # Logs in, joins `table` and bets every round until `rounds` bets are
+    # settled; at blackjack it hits below 17.
+    loop = asyncio.get_running_loop()
+    reader, writer = await asyncio.open_connection(HOST, port)
+
+    def send(op, **fields):
+        writer.write(json.dumps({"op": op, **fields}).encode() + b"\n")
+
+    send("login", username=username, password="secret")
+    send("join", table=table)
+    settled = 0
+    closes_at = None
+    try:
+        while settled < rounds:
+            line = await reader.readline()
+            if not line:
+                stats["dropped"] += 1
+                break
+            message = json.loads(line)
+            op = message["op"]
+            if op == "joined":
+                stats["joined"] = loop.time()
+            elif op == "betting":
+                closes_at = loop.time() + message["seconds"]
+                if table.startswith("roulette"):
+                    if rng.random() < 0.5:
+                        send("bet", amount=10, bet_type="color", choice=rng.choice(["Red", "Black"]))
+                    else:
+                        send("bet", amount=10, bet_type="number", choice=rng.randrange(37))
+                else:
+                    send("bet", amount=10)
+            elif op == "turn" and message["username"] == username:
+                send("hit" if message["score"] < 17 else "stand")
+            elif op == "settled":
+                settled += 1
+                if table.startswith("roulette"):
+                    stats["latencies"].append(loop.time() - closes_at)
+            elif op == "error":
+                stats["errors"] += 1
+    finally:
+        writer.close()
+
+
+async def load_test(clients, rounds, betting, per_table, blackjack_share, seed):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = CasinoDB(os.path.join(tmp, "casino.db"))
+        with db.conn:
+            db.conn.executemany("INSERT INTO users VALUES (?, 'secret', 1000)", [(f"bot{i}",) for i in range(clients)])
+        blackjack_bots = int(clients * blackjack_share)
+        roulette_bots = clients - blackjack_bots
+        roulette_tables = max(1, math.ceil(roulette_bots / per_table))
+        blackjack_tables = math.ceil(blackjack_bots / SEATS)
+        server = CasinoServer(db, roulette_tables, blackjack_tables, betting, turn_seconds=5)
+        listener = await server.start(HOST, 0)
+        port = listener.sockets[0].getsockname()[1]
+        rng = random.Random(seed)
+        stats = {"joined": None, "dropped": 0, "errors": 0, "latencies": []}
+        tables = [f"roulette-{i % roulette_tables + 1}" for i in range(roulette_bots)]
+        tables += [f"blackjack-{i // SEATS + 1}" for i in range(blackjack_bots)]
+        start = asyncio.get_running_loop().time()
+        await asyncio.gather(*(
+            table_bot(port, f"bot{i}", table, rounds, random.Random(rng.getrandbits(64)), stats) for i, table in enumerate(tables)
+        ))
+        elapsed = asyncio.get_running_loop().time() - start
+        listener.close()
+        for task in server.tasks:
+            task.cancel()
+        await asyncio.gather(*server.tasks, return_exceptions=True)
+        bets, rounds_settled, net = db.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT session || ':' || position || ':' || IFNULL(dealt, '')), SUM(payout - stake) FROM bets"
+        ).fetchone()
+        balances = db.conn.execute("SELECT SUM(balance) FROM users").fetchone()[0]
+        db.close()
+    latencies = sorted(stats["latencies"])
+    print(f"{clients:,} clients on {roulette_tables} roulette and {blackjack_tables} blackjack tables "
+          f"(server and clients share this process), all joined in {stats['joined'] - start:.2f}s")
+    print(f"{bets:,} bets settled in {rounds_settled:,} rounds, one transaction each, over {elapsed:.1f}s; "
+          f"{stats['dropped']} dropped, {stats['errors']} errors")
+    if latencies:
+        print(f"roulette, bets closing to result: p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+              f"p99 {latencies[len(latencies) * 99 // 100] * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+    print(f"balances add up: {balances == clients * 1000 + (net or 0)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Casino micro-benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    persist_parser = commands.add_parser("persist", help="settled bets per second for each way of saving balances")
+    persist_parser.add_argument("--bets", type=int, default=2000)
+    persist_parser.add_argument("--seed", type=int, default=1)
+    login_parser = commands.add_parser("login", help="login lookup cost, connection per click vs. shared connection")
+    login_parser.add_argument("--logins", type=int, default=5000)
+    login_parser.add_argument("--threads", type=int, default=4)
+    leaderboard_parser = commands.add_parser("leaderboard", help="bet recording rate and top-N query time")
+    leaderboard_parser.add_argument("--bets", type=int, default=1000000)
+    leaderboard_parser.add_argument("--players", type=int, default=10000)
+    leaderboard_parser.add_argument("--seed", type=int, default=1)
+    server_parser = commands.add_parser("server", help="simulated clients at the shared tables of casino_server.py")
+    server_parser.add_argument("--clients", type=int, default=2000)
+    server_parser.add_argument("--rounds", type=int, default=3)
+    server_parser.add_argument("--betting-seconds", type=float, default=2.0)
+    server_parser.add_argument("--per-table", type=int, default=500, help="clients per roulette table")
+    server_parser.add_argument("--blackjack-share", type=float, default=0.1, help="share of clients at blackjack tables")
+    server_parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.command == "persist":
+        bench_persist(args.bets, args.seed)
+    elif args.command == "login":
+        bench_login(args.logins, args.threads)
+    elif args.command == "leaderboard":
+        bench_leaderboard(args.bets, args.players, args.seed)
+    elif args.command == "server":
+        asyncio.run(load_test(args.clients, args.rounds, args.betting_seconds, args.per_table, args.blackjack_share, args.seed))
@@ -0,0 +1,244 @@
+import argparse
+import math
+import time
+from array import array
+from functools import lru_cache
+from multiprocessing import Pool
+
+from casino_rng import RNGStream, new_seed
+from paytables import BLACKJACK_DECKS, BLACKJACK_PAYS, BLACKJACK_PENETRATION, DEALER_STANDS
+
+RANKS = ["2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A"]
+SUITS = ["♠", "♥", "♦", "♣"]
+DECK_SIZE = 52
+MAX_DECKS = 8
+# No hand can hold more: four aces, four twos and three threes make 21.
+MAX_HAND_CARDS = 11
+# Card n is RANKS[n % 13] of SUITS[n // 13]; VALUES[n] is its points with
+# an ace counted as 11.
+VALUES = bytes(11 if rank == 12 else min(rank + 2, 10) for suit in SUITS for rank in range(len(RANKS)))
+NEW_DECK = array("B", range(DECK_SIZE))
+CARD_VALUES = (2, 3, 4, 5, 6, 7, 8, 9, 10, 11)
+# Chance of each card value on a fresh draw, for the strategy tables.
+VALUE_ODDS = {value: (4 if value == 10 else 1) / 13 for value in CARD_VALUES}
+
+# A hand is one small int: its best total times two, plus one while an ace
+# still counts as 11. STEP[state * 12 + value] is the state after drawing a
+# card of that value, so scoring a card is a single table lookup.
+START = 0
+STATES = 64
+STEP = bytearray(STATES * 12)
+for state in range(STATES):
+    for value in CARD_VALUES:
+        total, soft = (state >> 1) + value, (state & 1) + (value == 11)
+        while total > 21 and soft:
+            total -= 10
+            soft -= 1
+        STEP[state * 12 + value] = state if state >> 1 > 21 else min(total, 31) * 2 + soft
+STEP = bytes(STEP)
+
+
+def card_text(card):
+    return f"{RANKS[card % 13]}{SUITS[card // 13]}"
+
+
+def outcome(player_state, dealer_state):
+    player, dealer = player_state >> 1, dealer_state >> 1
+    if player > 21:
+        return "lose"
+    if dealer > 21 or player > dealer:
+        return "win"
+    return "lose" if player < dealer else "push"
+
+
+class Hand:
+    __slots__ = ("cards", "state")
+
+    def __init__(self, cards=()):
+        self.cards = array("B")
+        self.state = START
+        for card in cards:
+            self.add(card)
+
+    def add(self, card):
+        self.cards.append(card)
+        self.state = STEP[self.state * 12 + VALUES[card]]
+
+    def score(self):
+        return self.state >> 1
+
+    def __str__(self):
+        return " ".join(card_text(card) for card in self.cards)
+
+
+class Deck:
+    # A shoe of 1 to MAX_DECKS decks, as card numbers in a byte array that
+    # lives as long as the table. shuffle() puts the cards in order and
+    # Fisher-Yates shuffles them from the RNG stream in one go, so the
+    # whole shoe follows from the stream position it started at
+    # (`shuffled_at`); draw() just reads the next card. start_round()
+    # reshuffles once the cut card has come out.
+    def __init__(self, rng=None, decks=1, penetration=BLACKJACK_PENETRATION):
+        if not 1 <= decks <= MAX_DECKS:
+            raise ValueError(f"A shoe holds 1 to {MAX_DECKS} decks.")
+        if not 0 < penetration <= 1:
+            raise ValueError("The cut card must go between the start and the end of the shoe.")
+        self.rng = rng or RNGStream()
+        self.decks = decks
+        self.new_shoe = NEW_DECK * decks
+        self.cards = array("B", self.new_shoe)
+        self.cut = int(len(self.cards) * penetration)
+        self.shuffle()
+
+    def shuffle(self):
+        self.cards[:] = self.new_shoe
+        self.shuffled_at = self.rng.position
+        self.rng.shuffle(self.cards)
+        self.dealt = 0
+
+    def start_round(self, hands=2):
+        # Reshuffles once the cut card is out, or sooner if the rest of the
+        # shoe might not last a round of `hands` hands, the dealer's
+        # included. Returns True if it did.
+        if hands * MAX_HAND_CARDS > len(self.cards):
+            raise ValueError(f"A {self.decks}-deck shoe cannot always deal a round of {hands} hands.")
+        if self.dealt >= self.cut or len(self.cards) - self.dealt < hands * MAX_HAND_CARDS:
+            self.shuffle()
+            return True
+        return False
+
+    def remaining(self):
+        return len(self.cards) - self.dealt
+
+    def draw(self):
+        card = self.cards[self.dealt]
+        self.dealt += 1
+        return card
+
+
+def dealer_plays(hand, draw):
+    while hand.score() < DEALER_STANDS:
+        hand.add(draw())
+
+
+@lru_cache(maxsize=None)
+def dealer_finals(state):
+    # {final total: chance} for a dealer hand, 22 standing for a bust.
+    if state >> 1 > 21:
+        return {22: 1.0}
+    if state >> 1 >= DEALER_STANDS:
+        return {state >> 1: 1.0}
+    finals = {}
+    for value, odds in VALUE_ODDS.items():
+        for total, chance in dealer_finals(STEP[state * 12 + value]).items():
+            finals[total] = finals.get(total, 0) + odds * chance
+    return finals
+
+
+def stand_value(total, up):
+    finals = dealer_finals(STEP[START * 12 + up])
+    return sum(chance * (1 if dealer == 22 or total > dealer else -1 if total < dealer else 0) for dealer, chance in finals.items())
+
+
+@lru_cache(maxsize=None)
+def hand_value(state, up):
+    # (expected net per stake, hit?) when playing the best of hit and stand
+    # from here on, against an infinite deck.
+    if state >> 1 > 21:
+        return -1.0, False
+    stand = stand_value(state >> 1, up)
+    if state >> 1 == 21:
+        return stand, False
+    hit = sum(odds * hand_value(STEP[state * 12 + value], up)[0] for value, odds in VALUE_ODDS.items())
+    return max(stand, hit), hit > stand
+
+
+def strategy_table(hits):
+    # Same layout as STEP: table[state * 12 + dealer up card value] is 1 to hit.
+    table = bytearray(STATES * 12)
+    for state in range(STATES):
+        for up in CARD_VALUES:
+            table[state * 12 + up] = bool(state >> 1 <= 21 and hits(state, up))
+    return bytes(table)
+
+
+STRATEGIES = {
+    "basic": lambda state, up: hand_value(state, up)[1],
+    "dealer": lambda state, up: state >> 1 < DEALER_STANDS,
+    "never-bust": lambda state, up: state >> 1 < 12,
+}
+
+
+def play_hands(job):
+    # Plays `hands` rounds from one shoe, like the table does, and returns
+    # (wins, pushes, losses).
+    strategy, hands, seed, decks, penetration = job
+    hits = strategy_table(STRATEGIES[strategy])
+    deck = Deck(RNGStream(seed), decks, penetration)
+    draw, start_round, step, values = deck.draw, deck.start_round, STEP, VALUES
+    counts = {"win": 0, "push": 0, "lose": 0}
+    for _ in range(hands):
+        start_round()
+        player = step[step[values[draw()]] * 12 + values[draw()]]
+        up = values[draw()]
+        dealer = step[step[up] * 12 + values[draw()]]
+        while hits[player * 12 + up]:
+            player = step[player * 12 + values[draw()]]
+        if player >> 1 <= 21:
+            while dealer >> 1 < DEALER_STANDS:
+                dealer = step[dealer * 12 + values[draw()]]
+        counts[outcome(player, dealer)] += 1
+    return counts["win"], counts["push"], counts["lose"]
+
+
+def simulate(strategy, hands, seed=None, processes=None, chunk=100000, decks=BLACKJACK_DECKS, penetration=BLACKJACK_PENETRATION):
+    # Chunks are seeded from `seed` in order, so a run repeats exactly no
+    # matter how many processes share the work. Each chunk starts a new shoe.
+    seeds = RNGStream(seed)
+    jobs = []
+    while hands > 0:
+        jobs.append((strategy, min(chunk, hands), seeds.getrandbits(64), decks, penetration))
+        hands -= chunk
+    with Pool(processes) as pool:
+        results = pool.map(play_hands, jobs)
+    return tuple(sum(counts) for counts in zip(*results))
+
+
+def print_chart():
+    rows = [(f"hard {total}", total * 2) for total in range(12, 18)] + [(f"soft {total}", total * 2 + 1) for total in range(13, 20)]
+    print("basic strategy (H hit, S stand), dealer shows:")
+    print(f"{'':>8} " + " ".join(f"{'A' if up == 11 else up:>2}" for up in CARD_VALUES))
+    for label, state in rows:
+        print(f"{label:>8} " + " ".join(f"{'H' if hand_value(state, up)[1] else 'S':>2}" for up in CARD_VALUES))
+    print("hard 11 or less: always hit; hard 18 or more and soft 20 or more: always stand")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Blackjack house edge under the casino's rules.")
+    parser.add_argument("--hands", type=int, default=2000000)
+    parser.add_argument("--strategy", choices=list(STRATEGIES), nargs="+", default=list(STRATEGIES))
+    parser.add_argument("--seed", type=int, help="repeat a run exactly")
+    parser.add_argument("--processes", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--decks", type=int, default=BLACKJACK_DECKS, help=f"decks in the shoe, 1 to {MAX_DECKS}")
+    parser.add_argument("--penetration", type=float, default=BLACKJACK_PENETRATION, help="share of the shoe dealt before a reshuffle")
+    parser.add_argument("--chart", action="store_true", help="print the basic strategy chart")
+    args = parser.parse_args()
+    try:
+        Deck(decks=args.decks, penetration=args.penetration)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.chart:
+        print_chart()
+    pays = BLACKJACK_PAYS
+    seed = new_seed() if args.seed is None else args.seed
+    print(f"seed {seed}, {args.decks}-deck shoe reshuffled after {args.penetration:.0%}")
+    for strategy in args.strategy:
+        start = time.perf_counter()
+        wins, pushes, losses = simulate(strategy, args.hands, seed, args.processes, decks=args.decks, penetration=args.penetration)
+        elapsed = time.perf_counter() - start
+        results = ((wins, pays["win"] - 1), (pushes, pays["push"] - 1), (losses, pays["lose"] - 1))
+        net = sum(count * value for count, value in results) / args.hands
+        error = math.sqrt(sum(count * value * value for count, value in results) / args.hands - net * net) / math.sqrt(args.hands)
+        print(f"{strategy:>10}: house edge {-net:.3%} ± {error:.3%} "
+              f"(win {wins / args.hands:.1%}, push {pushes / args.hands:.1%}, lose {losses / args.hands:.1%}) "
+              f"over {args.hands:,} hands in {elapsed:.1f}s")
@@ -0,0 +1,256 @@
+import argparse
+import json
+import queue
+import socket
+import threading
+import tkinter as tk
+from tkinter import messagebox
+
+from casino_server import HOST, PORT
+
+POLL_MS = 50
+
+
+class ServerLink:
+    # The socket is read on a thread and messages are handed to Tk through
+    # a queue, as Tk may only be touched from its own thread.
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self.inbox = queue.Queue()
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def read(self):
+        try:
+            for line in self.sock.makefile("r", encoding="utf-8"):
+                self.inbox.put(json.loads(line))
+        except (OSError, ValueError):
+            pass
+        self.inbox.put({"op": "disconnected"})
+
+    def send(self, op, **fields):
+        try:
+            self.sock.sendall(json.dumps({"op": op, **fields}).encode() + b"\n")
+        except OSError:
+            self.inbox.put({"op": "disconnected"})
+
+    def close(self):
+        self.sock.close()
+
+
+class ClientApp:
+    def __init__(self, root, link):
+        self.root = root
+        self.link = link
+        self.root.title("Python Casino Royale - Tables")
+        self.root.geometry("520x560")
+        self.root.resizable(False, False)
+
+        self.bg_color = "#2c3e50"
+        self.accent_color = "#f1c40f"
+        self.win_color = "#2ecc71"
+        self.text_color = "#ecf0f1"
+        self.root.configure(bg=self.bg_color)
+
+        self.username = None
+        self.table = None
+        self.game = None
+        self.closes_in = 0
+        self.countdown_job = None
+        self.dealer_up = ""
+        self.hands = {}
+
+        self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.poll()
+
+    def create_widgets(self):
+        self.login_frame = tk.Frame(self.root, bg=self.bg_color)
+        self.login_frame.pack(pady=60)
+        tk.Label(self.login_frame, text="Welcome", font=("Helvetica", 16), bg=self.bg_color, fg="white").pack(pady=10)
+        tk.Label(self.login_frame, text="Username:", bg=self.bg_color, fg="white").pack()
+        self.user_entry = tk.Entry(self.login_frame)
+        self.user_entry.pack(pady=5)
+        tk.Label(self.login_frame, text="Password:", bg=self.bg_color, fg="white").pack()
+        self.pass_entry = tk.Entry(self.login_frame, show="*")
+        self.pass_entry.pack(pady=5)
+        tk.Button(self.login_frame, text="LOGIN", command=lambda: self.send_login("login"), bg="#2ecc71", fg="white", width=15).pack(pady=10)
+        tk.Button(self.login_frame, text="REGISTER", command=lambda: self.send_login("register"), bg="#3498db", fg="white", width=15).pack()
+
+        self.lobby_frame = tk.Frame(self.root, bg=self.bg_color)
+        self.balance_label = tk.Label(self.lobby_frame, text="", font=("Helvetica", 16), bg=self.bg_color, fg=self.accent_color)
+        self.balance_label.pack(pady=10)
+        self.tables_frame = tk.Frame(self.lobby_frame, bg=self.bg_color)
+        self.tables_frame.pack(pady=5)
+
+        self.table_label = tk.Label(self.lobby_frame, text="Pick a table.", font=("Helvetica", 14, "bold"), bg=self.bg_color, fg="white")
+        self.table_label.pack(pady=10)
+        self.round_label = tk.Label(self.lobby_frame, text="", bg=self.bg_color, fg=self.text_color)
+        self.round_label.pack()
+
+        self.cards_label = tk.Label(self.lobby_frame, text="", font=("Courier", 12), bg=self.bg_color, fg="white", justify="left")
+        self.cards_label.pack(pady=10)
+
+        controls = tk.Frame(self.lobby_frame, bg=self.bg_color)
+        controls.pack(pady=5)
+        tk.Label(controls, text="Bet:", bg=self.bg_color, fg="white").grid(row=0, column=0)
+        self.bet_entry = tk.Entry(controls, width=8, justify="center")
+        self.bet_entry.insert(0, "100")
+        self.bet_entry.grid(row=0, column=1, padx=5)
+        self.bet_type = tk.StringVar(value="color")
+        self.color_var = tk.StringVar(value="Red")
+        self.roulette_frame = tk.Frame(controls, bg=self.bg_color)
+        tk.Radiobutton(self.roulette_frame, text="RED", variable=self.color_var, value="Red", bg="red", fg="white", indicatoron=0, width=6,
+                       command=lambda: self.bet_type.set("color")).pack(side=tk.LEFT, padx=2)
+        tk.Radiobutton(self.roulette_frame, text="BLACK", variable=self.color_var, value="Black", bg="black", fg="white", indicatoron=0, width=6,
+                       command=lambda: self.bet_type.set("color")).pack(side=tk.LEFT, padx=2)
+        tk.Radiobutton(self.roulette_frame, text="Number:", variable=self.bet_type, value="number", bg=self.bg_color, fg="white",
+                       selectcolor="#34495e").pack(side=tk.LEFT, padx=2)
+        self.num_entry = tk.Entry(self.roulette_frame, width=4)
+        self.num_entry.pack(side=tk.LEFT)
+        self.roulette_frame.grid(row=1, column=0, columnspan=4, pady=5)
+        self.bet_btn = tk.Button(controls, text="PLACE BET", command=self.place_bet, bg="#e67e22", fg="white")
+        self.bet_btn.grid(row=0, column=2, padx=5)
+
+        self.play_frame = tk.Frame(self.lobby_frame, bg=self.bg_color)
+        self.hit_btn = tk.Button(self.play_frame, text="HIT", command=lambda: self.link.send("hit"), state="disabled", bg="#3498db", fg="white", width=8)
+        self.hit_btn.pack(side=tk.LEFT, padx=5)
+        self.stand_btn = tk.Button(self.play_frame, text="STAND", command=lambda: self.link.send("stand"), state="disabled", bg="#e74c3c", fg="white", width=8)
+        self.stand_btn.pack(side=tk.LEFT, padx=5)
+
+        self.status_label = tk.Label(self.lobby_frame, text="", font=("Helvetica", 12), bg=self.bg_color, fg=self.accent_color, wraplength=480)
+        self.status_label.pack(pady=10)
+
+    def close(self):
+        self.link.close()
+        self.root.destroy()
+
+    def poll(self):
+        while True:
+            try:
+                message = self.link.inbox.get_nowait()
+            except queue.Empty:
+                break
+            handler = getattr(self, "on_" + message.get("op", ""), None)
+            if handler:
+                handler(message)
+        self.root.after(POLL_MS, self.poll)
+
+    def send_login(self, op):
+        self.link.send(op, username=self.user_entry.get(), password=self.pass_entry.get())
+
+    def place_bet(self):
+        try:
+            amount = int(self.bet_entry.get())
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid number!")
+            return
+        if self.game == "roulette":
+            choice = self.color_var.get() if self.bet_type.get() == "color" else self.num_entry.get()
+            self.link.send("bet", amount=amount, bet_type=self.bet_type.get(), choice=choice)
+        else:
+            self.link.send("bet", amount=amount)
+
+    def show_balance(self, balance):
+        self.balance_label.config(text=f"{self.username}: ${balance}")
+
+    def countdown(self):
+        if self.closes_in > 0:
+            self.round_label.config(text=f"Bets close in {self.closes_in} s")
+            self.closes_in -= 1
+            self.countdown_job = self.root.after(1000, self.countdown)
+        else:
+            self.round_label.config(text="Bets are closed.")
+
+    def on_registered(self, message):
+        messagebox.showinfo("Success", "Registered! Please Login.")
+
+    def on_welcome(self, message):
+        self.username = message["username"]
+        self.login_frame.pack_forget()
+        self.lobby_frame.pack(fill="both", expand=True)
+        self.show_balance(message["balance"])
+        for column, table in enumerate(message["tables"]):
+            tk.Button(self.tables_frame, text=table["name"], width=11, bg="#9b59b6", fg="white",
+                      command=lambda name=table["name"]: self.link.send("join", table=name)).grid(row=column // 4, column=column % 4, padx=3, pady=3)
+
+    def on_joined(self, message):
+        self.table, self.game = message["table"], message["game"]
+        self.table_label.config(text=f"{self.table} ({self.game})")
+        self.cards_label.config(text="")
+        self.status_label.config(text="Waiting for the next round...")
+        if self.game == "roulette":
+            self.roulette_frame.grid()
+            self.play_frame.pack_forget()
+        else:
+            self.roulette_frame.grid_remove()
+            self.play_frame.pack(before=self.status_label)
+
+    def on_betting(self, message):
+        if self.countdown_job:
+            self.root.after_cancel(self.countdown_job)
+        self.closes_in = int(message["seconds"])
+        self.status_label.config(text=f"Round {message['round']}: place your bets!", fg=self.accent_color)
+        self.countdown()
+
+    def on_bet_placed(self, message):
+        self.show_balance(message["balance"])
+        self.status_label.config(text=f"Bet of ${message['amount']} placed.", fg=self.text_color)
+
+    def on_dealt(self, message):
+        self.dealer_up = message["dealer"]
+        self.hands = dict(message["hands"])
+        self.show_cards(f"{self.dealer_up} 🂠")
+        if message["shuffled"]:
+            self.status_label.config(text="The dealer shuffled a new shoe.", fg=self.text_color)
+
+    def on_hand(self, message):
+        self.hands[message["username"]] = f"{message['cards']} ({message['score']})"
+        self.show_cards(f"{self.dealer_up} 🂠")
+
+    def show_cards(self, dealer):
+        lines = [f"{'Dealer':<12} {dealer}"] + [f"{name[:12]:<12} {cards}" for name, cards in self.hands.items()]
+        self.cards_label.config(text="\n".join(lines), font=("Courier", 12), fg="white")
+
+    def on_turn(self, message):
+        mine = message["username"] == self.username
+        for button in (self.hit_btn, self.stand_btn):
+            button.config(state="normal" if mine else "disabled")
+        self.status_label.config(text=f"Your turn ({message['score']})!" if mine else f"{message['username']} is playing...",
+                                 fg=self.accent_color)
+
+    def on_dealer(self, message):
+        self.hit_btn.config(state="disabled")
+        self.stand_btn.config(state="disabled")
+        self.show_cards(f"{message['cards']} ({message['score']})")
+
+    def on_result(self, message):
+        self.cards_label.config(text=f"{message['color']} {message['number']}", font=("Helvetica", 28, "bold"),
+                                fg={"Red": "red", "Black": "black"}.get(message["color"], "green"))
+
+    def on_settled(self, message):
+        self.show_balance(message["balance"])
+        if message["payout"]:
+            self.status_label.config(text=f"WIN! {message['detail']} (+${message['payout']})", fg=self.win_color)
+        else:
+            self.status_label.config(text=f"LOST. {message['detail']}", fg="#e74c3c")
+
+    def on_error(self, message):
+        messagebox.showerror("Error", message["message"])
+
+    def on_disconnected(self, message):
+        messagebox.showerror("Disconnected", "Lost the connection to the casino server.")
+        self.root.destroy()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play at the shared casino tables.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    try:
+        link = ServerLink(args.host, args.port)
+    except OSError as e:
+        parser.exit(1, f"Cannot reach the casino server at {args.host}:{args.port}: {e}\n")
+    root = tk.Tk()
+    ClientApp(root, link)
+    root.mainloop()
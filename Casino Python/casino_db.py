@@ -0,0 +1,275 @@
+import os
+import queue
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "casino_data.db")
+FLUSH_SECONDS = 2.0
+POOL_SIZE = 4
+STARTING_BALANCE = 1000
+
+# Schema changes in order; PRAGMA user_version records how many have run,
+# so each one runs once per database. Append, never edit.
+MIGRATIONS = [
+    ["CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, balance INTEGER)"],
+    [
+        """CREATE TABLE bets (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL,
+            game TEXT NOT NULL,
+            time TEXT NOT NULL,
+            stake INTEGER NOT NULL,
+            payout INTEGER NOT NULL,
+            detail TEXT
+        )""",
+        "CREATE INDEX idx_bets_user_time ON bets(username, time)",
+        "CREATE INDEX idx_bets_game_time ON bets(game, time)",
+        # Per-player totals, kept up to date by the trigger below so the
+        # leaderboard never has to scan the bets.
+        """CREATE TABLE player_stats (
+            username TEXT PRIMARY KEY,
+            bets INTEGER NOT NULL,
+            staked INTEGER NOT NULL,
+            returned INTEGER NOT NULL,
+            net INTEGER NOT NULL,
+            biggest_win INTEGER NOT NULL,
+            last_bet TEXT
+        )""",
+        "CREATE INDEX idx_player_stats_net ON player_stats(net)",
+        "CREATE INDEX idx_player_stats_biggest_win ON player_stats(biggest_win)",
+        """CREATE TRIGGER bets_player_stats AFTER INSERT ON bets BEGIN
+            INSERT INTO player_stats (username, bets, staked, returned, net, biggest_win, last_bet)
+            VALUES (NEW.username, 1, NEW.stake, NEW.payout, NEW.payout - NEW.stake, MAX(NEW.payout - NEW.stake, 0), NEW.time)
+            ON CONFLICT(username) DO UPDATE SET
+                bets = bets + 1,
+                staked = staked + excluded.staked,
+                returned = returned + excluded.returned,
+                net = net + excluded.net,
+                biggest_win = MAX(biggest_win, excluded.biggest_win),
+                last_bet = excluded.last_bet;
+        END""",
+    ],
+    ["CREATE INDEX IF NOT EXISTS idx_users_balance ON users(balance, username)"],
+    [
+        # Each login draws from its own seeded RNG stream (casino_rng.py). A
+        # bet records its session and the stream position of its first
+        # draw, which is enough to replay it exactly (replay.py).
+        """CREATE TABLE rng_sessions (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL,
+            seed INTEGER NOT NULL,
+            started TEXT NOT NULL
+        )""",
+        "ALTER TABLE bets ADD COLUMN session INTEGER REFERENCES rng_sessions(id)",
+        "ALTER TABLE bets ADD COLUMN position INTEGER",
+    ],
+    [
+        # Blackjack deals from a shoe that lasts many rounds. For its bets
+        # `position` is where the shoe was shuffled, `dealt` how many cards
+        # had come out of it before the round, and the session's `decks`
+        # how big it is.
+        "ALTER TABLE bets ADD COLUMN dealt INTEGER",
+        "ALTER TABLE rng_sessions ADD COLUMN decks INTEGER",
+    ],
+]
+REPLAY_COLUMNS = ["id", "username", "game", "time", "stake", "payout", "detail", "session", "seed", "position", "dealt", "decks"]
+STATS_COLUMNS = ["username", "bets", "staked", "returned", "net", "biggest_win", "last_bet"]
+LEADERBOARD_ORDERS = {"net": "net", "biggest_win": "biggest_win", "bets": "bets"}
+
+
+def connect(path=DB_FILE, check_same_thread=True):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=check_same_thread, cached_statements=256)
+    # In WAL mode a commit appends to casino_data.db-wal, and with
+    # synchronous=NORMAL that is a plain write: it survives the process
+    # dying, and only checkpoints wait for an fsync.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-8000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def migrate(conn):
+    # BEGIN IMMEDIATE so two processes starting at once do not both migrate.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+            for statement in migration:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version={number}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+class CasinoDB:
+    # Opened once at startup. `conn` belongs to the Tk thread; worker
+    # threads borrow one of a few extra connections with pooled().
+    def __init__(self, path=DB_FILE, pool_size=POOL_SIZE):
+        self.path = path
+        self.conn = connect(path)
+        migrate(self.conn)
+        self.idle = queue.Queue(pool_size)
+
+    @contextmanager
+    def pooled(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = connect(self.path, check_same_thread=False)
+        try:
+            yield conn
+        finally:
+            try:
+                self.idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def password(self, username):
+        row = self.conn.execute("SELECT password FROM users WHERE username=?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def balance(self, username):
+        row = self.conn.execute("SELECT balance FROM users WHERE username=?", (username,)).fetchone()
+        return row[0] if row else 0
+
+    def add_user(self, username, password, balance=STARTING_BALANCE):
+        # Raises sqlite3.IntegrityError if the username is taken.
+        with self.conn:
+            self.conn.execute("INSERT INTO users (username, password, balance) VALUES (?, ?, ?)", (username, password, balance))
+
+    def start_session(self, username, seed, decks=None):
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO rng_sessions (username, seed, started, decks) VALUES (?, ?, ?, ?)",
+                (username, seed, datetime.now().isoformat(), decks)
+            )
+        return cursor.lastrowid
+
+    def replayable_bets(self, username=None, bet_id=None, limit=20):
+        # Newest first, with the seed of the stream each bet drew from.
+        # Bets from before streams were recorded are left out.
+        conditions, params = ["b.position IS NOT NULL"], []
+        if username is not None:
+            conditions.append("b.username=?")
+            params.append(username)
+        if bet_id is not None:
+            conditions.append("b.id=?")
+            params.append(bet_id)
+        rows = self.conn.execute(
+            f"""SELECT b.id, b.username, b.game, b.time, b.stake, b.payout, b.detail, b.session, s.seed, b.position, b.dealt, s.decks
+                FROM bets b JOIN rng_sessions s ON s.id = b.session
+                WHERE {' AND '.join(conditions)} ORDER BY b.id DESC LIMIT ?""",
+            params + [limit]
+        )
+        return [dict(zip(REPLAY_COLUMNS, row)) for row in rows]
+
+    def round_bets(self, session, position, dealt):
+        # (id, stake, detail) of every blackjack bet of one round, in the
+        # order they were placed: the seats of a shared table.
+        return self.conn.execute(
+            "SELECT id, stake, detail FROM bets WHERE session=? AND position=? AND dealt IS ? ORDER BY id", (session, position, dealt)
+        ).fetchall()
+
+    def player_stats(self, username):
+        row = self.conn.execute(f"SELECT {', '.join(STATS_COLUMNS)} FROM player_stats WHERE username=?", (username,)).fetchone()
+        return dict(zip(STATS_COLUMNS, row)) if row else None
+
+    def leaderboard(self, order="net", limit=10):
+        # Walks the index on the chosen column from the top.
+        column = LEADERBOARD_ORDERS[order]
+        rows = self.conn.execute(
+            f"SELECT {', '.join(STATS_COLUMNS)} FROM player_stats ORDER BY {column} DESC LIMIT ?", (limit,)
+        )
+        return [dict(zip(STATS_COLUMNS, row)) for row in rows]
+
+    def recent_bets(self, username, limit=10):
+        return self.conn.execute(
+            "SELECT game, time, stake, payout, detail FROM bets WHERE username=? ORDER BY time DESC LIMIT ?", (username, limit)
+        ).fetchall()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self.conn.close()
+
+
+class BalanceWriter:
+    # Write-behind balances. A stake only updates the pending change;
+    # settling a bet commits its record and the balance together with
+    # everything still pending, so a bet costs one commit and is on disk
+    # before its result is shown. Stakes of bets that are still open are
+    # written once they are FLUSH_SECONDS old or the window closes.
+    # Balances are written as changes, never overwritten, so the window
+    # and the table server can play the same account side by side.
+    # Callers pass the balance as they see it, starting from the one they
+    # hand to track().
+    def __init__(self, conn, flush_seconds=FLUSH_SECONDS):
+        self.conn = conn
+        self.flush_seconds = flush_seconds
+        self.balances = {}
+        self.pending = {}
+        self.pending_bets = []
+        self.pending_since = None
+
+    def track(self, username, balance):
+        self.balances[username] = balance
+
+    def change(self, username, balance):
+        change = balance - self.balances[username]
+        self.balances[username] = balance
+        return change
+
+    def stake(self, username, balance):
+        if not self.pending:
+            self.pending_since = time.monotonic()
+        self.pending[username] = self.pending.get(username, 0) + self.change(username, balance)
+
+    def settle(self, username, balance, game, stake, payout, detail=None, session=None, position=None, dealt=None):
+        self.settle_many(username, balance, [(game, stake, payout, detail, position, dealt)], session)
+
+    def settle_many(self, username, balance, bets, session=None):
+        # Several settled bets of one player, e.g. an auto-spin batch, as
+        # (game, stake, payout, detail, stream position, cards dealt); the
+        # balance is the one after the last of them.
+        self.settle_round({username: self.change(username, balance)}, [(username,) + bet for bet in bets], session)
+
+    def settle_round(self, changes, bets, session=None):
+        # Settled bets of any number of players, e.g. a round at a shared
+        # table, as (username, game, stake, payout, detail, stream
+        # position, cards dealt), with how much each player's balance
+        # changed. One commit.
+        now = datetime.now().isoformat()
+        for username, change in changes.items():
+            self.pending[username] = self.pending.get(username, 0) + change
+        self.pending_bets.extend(
+            (username, game, now, stake, payout, detail, session, position, dealt)
+            for username, game, stake, payout, detail, position, dealt in bets
+        )
+        self.flush()
+
+    def flush_if_due(self):
+        if self.pending and time.monotonic() - self.pending_since >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO bets (username, game, time, stake, payout, detail, session, position, dealt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self.pending_bets
+            )
+            self.conn.executemany(
+                "UPDATE users SET balance=balance+? WHERE username=?",
+                [(change, username) for username, change in self.pending.items()]
+            )
+        self.pending.clear()
+        self.pending_bets.clear()
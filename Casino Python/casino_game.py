@@ -3,14 +3,22 @@ from tkinter import messagebox
 import random
 import time
 import sqlite3
-import os
+from autospin import AutoSpin
+from blackjack import Deck, Hand, card_text, dealer_plays, outcome
+from casino_db import BalanceWriter, CasinoDB
+from casino_rng import RNGStream, new_seed
+from paytables import (BLACKJACK_DECKS, BLACKJACK_PAYS, BLACKJACK_PENETRATION, SLOT_COMBINATIONS, SLOT_PAYS, SLOT_REELS, SLOT_SYMBOLS, roulette_color,
+                       roulette_multiplier, roulette_spin, slot_matches, slot_spin)
+
+FRAME_MS = 16
 
 class CasinoApp:
-    def __init__(self, root, username):
+    def __init__(self, root, username, db):
         self.root = root
         self.username = username
+        self.db = db
         self.root.title("Python Casino Royale")
-        self.root.geometry("500x600")
+        self.root.geometry("500x720")
         self.root.resizable(False, False)
 
         self.bg_color = "#2c3e50"
@@ -22,27 +30,35 @@ class CasinoApp:
         self.root.configure(bg=self.bg_color)
 
         self.init_db()
-        self.symbols = ["🍒", "🍋", "🔔", "💎", "7️⃣", "🍇"]
+        self.symbols = SLOT_SYMBOLS
         self.is_spinning = False
+        self.auto = None
+        self.blackjack = None
 
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.flush_balances()
 
     def init_db(self):
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        db_path = os.path.join(base_dir, "casino_data.db")
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
-
-        self.cursor.execute("SELECT balance FROM users WHERE username=?", (self.username,))
-        result = self.cursor.fetchone()
-        if result:
-            self.balance = result[0]
-        else:
-            self.balance = 0
+        self.balance_writer = BalanceWriter(self.db.conn)
+        self.balance = self.db.balance(self.username)
+        self.balance_writer.track(self.username, self.balance)
+        # Every game in this window draws from one stream; see replay.py.
+        # The blackjack shoe lasts the session, like a table's.
+        self.rng = RNGStream(new_seed())
+        self.session = self.db.start_session(self.username, self.rng.seed_value, BLACKJACK_DECKS)
+        self.shoe = Deck(self.rng, BLACKJACK_DECKS, BLACKJACK_PENETRATION)
 
     def save_balance(self):
-        self.cursor.execute("UPDATE users SET balance=? WHERE username=?", (self.balance, self.username))
-        self.conn.commit()
+        self.balance_writer.stake(self.username, self.balance)
+
+    def flush_balances(self):
+        self.balance_writer.flush_if_due()
+        self.root.after(250, self.flush_balances)
+
+    def close(self):
+        self.balance_writer.flush()
+        self.root.destroy()
 
     def create_widgets(self):
         title_label = tk.Label(
@@ -67,7 +83,7 @@ class CasinoApp:
         self.slots_frame.pack(pady=20, padx=20)
 
         self.reel_labels = []
-        for i in range(3):
+        for i in range(SLOT_REELS):
             lbl = tk.Label(
                 self.slots_frame,
                 text="❓",
@@ -103,6 +119,32 @@ class CasinoApp:
         )
         self.spin_btn.pack(pady=20, ipadx=20, ipady=5)
 
+        auto_frame = tk.Frame(self.root, bg=self.bg_color)
+        auto_frame.pack(pady=5)
+        self.auto_entries = {}
+        for column, (label, default) in enumerate((("Spins:", "100"), ("Stop-loss:", ""), ("Stop-win:", ""))):
+            tk.Label(auto_frame, text=label, bg=self.bg_color, fg=self.text_color).grid(row=0, column=column * 2)
+            entry = tk.Entry(auto_frame, width=6, justify="center")
+            entry.insert(0, default)
+            entry.grid(row=0, column=column * 2 + 1, padx=(0, 8))
+            self.auto_entries[label] = entry
+        self.jackpot_stop_var = tk.BooleanVar(value=True)
+        self.turbo_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(auto_frame, text="Stop on jackpot", variable=self.jackpot_stop_var, bg=self.bg_color, fg=self.text_color, selectcolor="#34495e").grid(row=1, column=0, columnspan=3)
+        tk.Checkbutton(auto_frame, text="Turbo (no animation)", variable=self.turbo_var, bg=self.bg_color, fg=self.text_color, selectcolor="#34495e").grid(row=1, column=3, columnspan=3)
+
+        self.auto_btn = tk.Button(
+            self.root,
+            text="AUTO SPIN",
+            font=("Helvetica", 12, "bold"),
+            bg="#d35400",
+            fg="white",
+            activebackground="#e67e22",
+            activeforeground="white",
+            command=self.toggle_auto
+        )
+        self.auto_btn.pack(pady=5, ipadx=10)
+
         self.bj_btn = tk.Button(
             self.root,
             text="Play BLACKJACK",
@@ -127,6 +169,18 @@ class CasinoApp:
         )
         self.rl_btn.pack(pady=5, ipadx=10)
 
+        self.lb_btn = tk.Button(
+            self.root,
+            text="LEADERBOARD",
+            font=("Helvetica", 12, "bold"),
+            bg="#2980b9",
+            fg="white",
+            activebackground="#3498db",
+            activeforeground="white",
+            command=self.open_leaderboard
+        )
+        self.lb_btn.pack(pady=5, ipadx=10)
+
         self.status_label = tk.Label(
             self.root,
             text="Good Luck!",
@@ -137,27 +191,42 @@ class CasinoApp:
         self.status_label.pack(pady=10)
 
     def open_blackjack(self):
-        BlackjackGame(self.root, self)
+        # One blackjack window at a time: two would deal interleaved hands
+        # from the one shoe, which replay.py cannot tell apart.
+        if self.blackjack and self.blackjack.window.winfo_exists():
+            self.blackjack.window.deiconify()
+            self.blackjack.window.lift()
+            return
+        self.blackjack = BlackjackGame(self.root, self)
 
     def open_roulette(self):
         RouletteGame(self.root, self)
 
-    def start_spin(self):
-        if self.is_spinning:
-            return
+    def open_leaderboard(self):
+        LeaderboardWindow(self.root, self)
 
+    def read_bet(self):
         try:
             bet_amount = int(self.bet_entry.get())
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid number!")
-            return
+            return None
 
         if bet_amount <= 0:
             messagebox.showwarning("Warning", "Bet must be greater than 0!")
-            return
+            return None
         
         if bet_amount > self.balance:
             messagebox.showerror("Insufficient Funds", "You don't have enough money for this bet.")
+            return None
+        return bet_amount
+
+    def start_spin(self):
+        if self.is_spinning:
+            return
+
+        bet_amount = self.read_bet()
+        if bet_amount is None:
             return
 
         self.balance -= bet_amount
@@ -168,35 +237,107 @@ class CasinoApp:
         self.spin_btn.config(state="disabled")
         self.animate_reels(0, bet_amount)
 
-    def animate_reels(self, count, bet_amount):
+    def animate_reels(self, count, bet_amount, finish=None):
+        # Only for show, so it uses `random` and leaves the stream alone.
         if count < 15:
-            temp_results = [random.choice(self.symbols) for _ in range(3)]
+            temp_results = [random.choice(self.symbols) for _ in range(SLOT_REELS)]
             for i, symbol in enumerate(temp_results):
                 self.reel_labels[i].config(text=symbol)
 
-            self.root.after(100, lambda: self.animate_reels(count + 1, bet_amount))
+            self.root.after(100, lambda: self.animate_reels(count + 1, bet_amount, finish))
         else:
-            self.finalize_spin(bet_amount)
+            (finish or self.finalize_spin)(bet_amount)
 
-    def finalize_spin(self, bet_amount):
-        final_results = [random.choice(self.symbols) for _ in range(3)]
-        
-        for i, symbol in enumerate(final_results):
-            self.reel_labels[i].config(text=symbol)
+    def toggle_auto(self):
+        if self.auto:
+            # Stops after the spin in progress.
+            self.auto.stop_reason = "Stopped."
+            return
+        if self.is_spinning:
+            return
 
-        if final_results[0] == final_results[1] == final_results[2]:
-            win_amount = bet_amount * 10
-            self.balance += win_amount
+        bet_amount = self.read_bet()
+        if bet_amount is None:
+            return
+        try:
+            spins = int(self.auto_entries["Spins:"].get())
+            stop_loss, stop_win = (int(self.auto_entries[label].get()) if self.auto_entries[label].get().strip() else None
+                                   for label in ("Stop-loss:", "Stop-win:"))
+        except ValueError:
+            messagebox.showerror("Error", "Spins and stop limits must be whole numbers!")
+            return
+        if spins <= 0:
+            messagebox.showwarning("Warning", "Spins must be greater than 0!")
+            return
+
+        self.auto = AutoSpin(self.balance, bet_amount, spins, stop_loss, stop_win, self.jackpot_stop_var.get(), self.rng)
+        self.is_spinning = True
+        self.spin_btn.config(state="disabled")
+        self.auto_btn.config(text="STOP")
+        self.auto_step()
+
+    def auto_step(self):
+        auto = self.auto
+        # The blackjack and roulette windows stay open during a run, so
+        # the app balance is the one to go by.
+        auto.adjust(self.balance - auto.balance)
+        if auto.stop_reason:
+            self.finish_auto()
+        elif self.turbo_var.get():
+            # A batch per frame: one commit and one redraw of the reels,
+            # however many spins it held.
+            spins = auto.play()
+            self.balance += sum(payout for _, payout, _ in spins) - auto.bet * len(spins)
+            self.settle_bets(auto.bets(spins))
+            self.show_reels(SLOT_COMBINATIONS[spins[-1][0]])
+            self.status_label.config(text=f"Auto: {auto.played} spins, net ${auto.balance - auto.start_balance}", fg=self.accent_color)
+            self.root.after(FRAME_MS, self.auto_step)
+        else:
+            spins = auto.play(1)
+            self.balance -= auto.bet
+            self.update_balance()
+            self.status_label.config(text=f"Auto: spin {auto.played}...", fg=self.accent_color)
+            self.animate_reels(0, auto.bet, lambda bet_amount: self.finish_auto_spin(spins))
+
+    def finish_auto_spin(self, spins):
+        index, payout, position = spins[0]
+        self.show_reels(SLOT_COMBINATIONS[index])
+        self.balance += payout
+        self.settle_bets(self.auto.bets(spins))
+        self.root.after(300, self.auto_step)
+
+    def finish_auto(self):
+        auto = self.auto
+        self.auto = None
+        self.is_spinning = False
+        self.spin_btn.config(state="normal")
+        self.auto_btn.config(text="AUTO SPIN")
+        net = auto.balance - auto.start_balance
+        self.status_label.config(text=f"{auto.stop_reason} {auto.played} spins, net ${net}", fg=self.win_color if net > 0 else self.text_color)
+        if auto.stop_reason == "Jackpot!":
+            messagebox.showinfo("JACKPOT!", f"Auto spin hit the jackpot after {auto.played} spins!")
+
+    def show_reels(self, reels):
+        for label, symbol in zip(self.reel_labels, reels):
+            label.config(text=symbol)
+
+    def finalize_spin(self, bet_amount):
+        position = self.rng.position
+        final_results = SLOT_COMBINATIONS[slot_spin(self.rng)]
+        self.show_reels(final_results)
+
+        matches = slot_matches(final_results)
+        win_amount = bet_amount * SLOT_PAYS.get(matches, 0)
+        self.balance += win_amount
+        self.settle_bet("slots", bet_amount, win_amount, "".join(final_results), position)
+        if win_amount and matches == SLOT_REELS:
             self.status_label.config(text=f"🎉 JACKPOT! You won ${win_amount}!", fg=self.win_color)
             messagebox.showinfo("JACKPOT!", f"Congratulations! You won ${win_amount}")
-        elif final_results[0] == final_results[1] or final_results[1] == final_results[2] or final_results[0] == final_results[2]:
-            win_amount = bet_amount * 2
-            self.balance += win_amount
+        elif win_amount:
             self.status_label.config(text=f"✨ Small Win! You won ${win_amount}!", fg=self.accent_color)
         else:
             self.status_label.config(text="You lost. Try again!", fg="#e74c3c")
 
-        self.update_balance()
         self.is_spinning = False
         self.spin_btn.config(state="normal")
 
@@ -204,6 +345,14 @@ class CasinoApp:
         self.balance_label.config(text=f"Balance: ${self.balance}")
         self.save_balance()
 
+    def settle_bet(self, game, stake, payout, detail, position, dealt=None):
+        self.settle_bets([(game, stake, payout, detail, position, dealt)])
+
+    def settle_bets(self, bets):
+        # The balance already includes the payouts.
+        self.balance_label.config(text=f"Balance: ${self.balance}")
+        self.balance_writer.settle_many(self.username, self.balance, bets, self.session)
+
 class BlackjackGame:
     def __init__(self, master, app):
         self.window = tk.Toplevel(master)
@@ -213,10 +362,13 @@ class BlackjackGame:
         self.app = app
         self.bg_color = "#20523e"
         self.window.configure(bg=self.bg_color)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
         
-        self.deck = []
-        self.player_hand = []
-        self.dealer_hand = []
+        self.deck = app.shoe
+        self.position = None
+        self.dealt = None
+        self.player_hand = Hand()
+        self.dealer_hand = Hand()
         self.bet = 0
         
         self.create_widgets()
@@ -256,34 +408,25 @@ class BlackjackGame:
         self.status_lbl = tk.Label(self.window, text="", font=("Helvetica", 12), bg=self.bg_color, fg="#f1c40f")
         self.status_lbl.pack(pady=10)
 
-    def get_deck(self):
-        suits = ["♠", "♥", "♦", "♣"]
-        ranks = ["2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A"]
-        deck = [(r, s) for s in suits for r in ranks]
-        random.shuffle(deck)
-        return deck
-
-    def calculate_score(self, hand):
-        score = 0
-        aces = 0
-        for r, s in hand:
-            if r in ["J", "Q", "K"]: score += 10
-            elif r == "A": aces += 1; score += 11
-            else: score += int(r)
-        while score > 21 and aces:
-            score -= 10
-            aces -= 1
-        return score
+        self.shoe_lbl = tk.Label(self.window, text="", font=("Helvetica", 10), bg=self.bg_color, fg="white")
+        self.shoe_lbl.pack()
+        self.show_shoe()
+
+    def close(self):
+        # A hand left open keeps its stake.
+        self.app.balance_writer.flush()
+        self.window.destroy()
+
+    def show_shoe(self):
+        self.shoe_lbl.config(text=f"{self.deck.decks}-deck shoe: {self.deck.remaining()} cards left, reshuffled at the cut card")
 
     def display_hands(self, hide_dealer=True):
-        p_text = " ".join([f"{r}{s}" for r, s in self.player_hand])
-        self.player_lbl.config(text=f"{p_text} ({self.calculate_score(self.player_hand)})")
+        self.player_lbl.config(text=f"{self.player_hand} ({self.player_hand.score()})")
         
         if hide_dealer:
-            d_text = f"{self.dealer_hand[0][0]}{self.dealer_hand[0][1]} 🂠"
+            d_text = f"{card_text(self.dealer_hand.cards[0])} 🂠"
         else:
-            d_text = " ".join([f"{r}{s}" for r, s in self.dealer_hand])
-            d_text += f" ({self.calculate_score(self.dealer_hand)})"
+            d_text = f"{self.dealer_hand} ({self.dealer_hand.score()})"
         self.dealer_lbl.config(text=d_text)
 
     def deal(self):
@@ -295,40 +438,37 @@ class BlackjackGame:
         
         self.app.balance -= self.bet
         self.app.update_balance()
-        self.deck = self.get_deck()
-        self.player_hand = [self.deck.pop(), self.deck.pop()]
-        self.dealer_hand = [self.deck.pop(), self.deck.pop()]
+        shuffled = self.deck.start_round()
+        self.position, self.dealt = self.deck.shuffled_at, self.deck.dealt
+        self.player_hand = Hand([self.deck.draw(), self.deck.draw()])
+        self.dealer_hand = Hand([self.deck.draw(), self.deck.draw()])
         self.hit_btn.config(state="normal"); self.stand_btn.config(state="normal"); self.deal_btn.config(state="disabled")
         self.display_hands()
-        self.status_lbl.config(text="Game Started!")
+        self.status_lbl.config(text="New shoe shuffled. Game Started!" if shuffled else "Game Started!")
 
     def hit(self):
-        self.player_hand.append(self.deck.pop())
+        self.player_hand.add(self.deck.draw())
         self.display_hands()
-        if self.calculate_score(self.player_hand) > 21:
-            self.end_game(False)
+        if self.player_hand.score() > 21:
+            self.end_game("lose")
 
     def stand(self):
-        while self.calculate_score(self.dealer_hand) < 17:
-            self.dealer_hand.append(self.deck.pop())
-        p_score = self.calculate_score(self.player_hand)
-        d_score = self.calculate_score(self.dealer_hand)
-        if d_score > 21 or p_score > d_score: self.end_game(True)
-        elif p_score < d_score: self.end_game(False)
-        else: self.end_game("Push")
-
-    def end_game(self, win):
+        dealer_plays(self.dealer_hand, self.deck.draw)
+        self.end_game(outcome(self.player_hand.state, self.dealer_hand.state))
+
+    def end_game(self, result):
         self.display_hands(hide_dealer=False)
+        self.show_shoe()
         self.hit_btn.config(state="disabled"); self.stand_btn.config(state="disabled"); self.deal_btn.config(state="normal")
-        if win == True:
-            self.app.balance += self.bet * 2
-            self.status_lbl.config(text=f"You Win! (+${self.bet * 2})")
-        elif win == "Push":
-            self.app.balance += self.bet
+        payout = self.bet * BLACKJACK_PAYS[result]
+        self.app.balance += payout
+        self.app.settle_bet("blackjack", self.bet, payout, f"{self.player_hand} v {self.dealer_hand}: {result}", self.position, self.dealt)
+        if result == "win":
+            self.status_lbl.config(text=f"You Win! (+${payout})")
+        elif result == "push":
             self.status_lbl.config(text="Push! Bet returned.")
         else:
             self.status_lbl.config(text="Dealer Wins!")
-        self.app.update_balance()
 
 class RouletteGame:
     def __init__(self, master, app):
@@ -340,8 +480,6 @@ class RouletteGame:
         self.bg_color = "#006400"
         self.window.configure(bg=self.bg_color)
         
-        self.red_numbers = {1, 3, 5, 7, 9, 12, 14, 16, 18, 19, 21, 23, 25, 27, 30, 32, 34, 36}
-        
         self.create_widgets()
 
     def create_widgets(self):
@@ -399,41 +537,79 @@ class RouletteGame:
         if bet > self.app.balance or bet <= 0:
             messagebox.showerror("Error", "Invalid Bet", parent=self.window)
             return
+
+        # Read the pick before taking the stake, so a bad number is not a
+        # lost bet.
+        if self.bet_type.get() == "color":
+            chosen = self.color_var.get()
+        else:
+            try: chosen = int(self.num_entry.get())
+            except: return
             
-        winning_num = random.randint(0, 36)
-        winning_color = "Red" if winning_num in self.red_numbers else ("Black" if winning_num != 0 else "Green")
+        position = self.app.rng.position
+        winning_num = roulette_spin(self.app.rng)
+        winning_color = roulette_color(winning_num)
         
         self.app.balance -= bet
         self.app.update_balance()
         
         self.result_lbl.config(text=str(winning_num), fg="white", bg="red" if winning_color == "Red" else ("black" if winning_color == "Black" else "green"))
         
-        win = False
-        payout = 0
-        
-        if self.bet_type.get() == "color":
-            chosen = self.color_var.get()
-            if chosen == winning_color:
-                win = True
-                payout = bet * 2
-        else:
-            try: chosen_num = int(self.num_entry.get())
-            except: return
-            if chosen_num == winning_num:
-                win = True
-                payout = bet * 36
+        payout = bet * roulette_multiplier(self.bet_type.get(), chosen, winning_num)
+        self.app.balance += payout
+        self.app.settle_bet("roulette", bet, payout, f"{self.bet_type.get()} {chosen}, {winning_color} {winning_num}", position)
                 
-        if win:
-            self.app.balance += payout
+        if payout:
             self.status_lbl.config(text=f"WIN! {winning_color} {winning_num} (+${payout})", fg="gold")
         else:
             self.status_lbl.config(text=f"LOST. Result: {winning_color} {winning_num}", fg="white")
-        
-        self.app.update_balance()
+
+class LeaderboardWindow:
+    def __init__(self, master, app):
+        self.window = tk.Toplevel(master)
+        self.window.title("Leaderboard")
+        self.window.geometry("520x520")
+        self.window.resizable(False, False)
+        self.app = app
+        self.bg_color = "#2c3e50"
+        self.window.configure(bg=self.bg_color)
+
+        tk.Label(self.window, text="🏆 LEADERBOARD 🏆", font=("Helvetica", 24, "bold"), bg=self.bg_color, fg="#f1c40f").pack(pady=10)
+
+        self.order = tk.StringVar(value="net")
+        order_frame = tk.Frame(self.window, bg=self.bg_color)
+        order_frame.pack(pady=5)
+        for text, value in (("Net Profit", "net"), ("Biggest Win", "biggest_win"), ("Most Bets", "bets")):
+            tk.Radiobutton(order_frame, text=text, variable=self.order, value=value, bg=self.bg_color, fg="white", selectcolor="#34495e", command=self.refresh).pack(side=tk.LEFT, padx=10)
+
+        self.table_lbl = tk.Label(self.window, text="", font=("Courier", 11), bg="#34495e", fg="white", justify=tk.LEFT, anchor="nw", padx=10, pady=10)
+        self.table_lbl.pack(pady=10, padx=20, fill=tk.X)
+
+        self.player_lbl = tk.Label(self.window, text="", font=("Helvetica", 11), bg=self.bg_color, fg="#2ecc71", justify=tk.LEFT)
+        self.player_lbl.pack(pady=10)
+
+        self.refresh()
+
+    def refresh(self):
+        self.app.balance_writer.flush()
+        lines = [f"{'#':>2}  {'Player':<14} {'Bets':>6} {'Net':>9} {'Best Win':>9}"]
+        for rank, row in enumerate(self.app.db.leaderboard(self.order.get()), 1):
+            lines.append(f"{rank:>2}  {row['username'][:14]:<14} {row['bets']:>6} {row['net']:>9} {row['biggest_win']:>9}")
+        if len(lines) == 1:
+            lines.append("No bets yet.")
+        self.table_lbl.config(text="\n".join(lines))
+
+        stats = self.app.db.player_stats(self.app.username)
+        if stats:
+            self.player_lbl.config(text=f"You: {stats['bets']} bets, ${stats['staked']} staked, ${stats['returned']} returned\n"
+                                        f"Net ${stats['net']}, biggest win ${stats['biggest_win']}")
+        else:
+            self.player_lbl.config(text="You have not placed a bet yet.")
 
 class LoginWindow:
-    def __init__(self, root):
+    def __init__(self, root, db):
         self.root = root
+        self.db = db
         self.win = tk.Toplevel(root)
         self.win.title("Casino Login")
         self.win.geometry("300x250")
@@ -453,27 +629,15 @@ class LoginWindow:
         tk.Button(self.win, text="LOGIN", command=self.login, bg="#2ecc71", fg="white", width=15).pack(pady=10)
         tk.Button(self.win, text="REGISTER", command=self.register, bg="#3498db", fg="white", width=15).pack()
 
-    def get_db(self):
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        db_path = os.path.join(base_dir, "casino_data.db")
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, balance INTEGER)")
-        conn.commit()
-        return conn, cursor
-
     def login(self):
         user = self.user_entry.get()
         pwd = self.pass_entry.get()
-        conn, cursor = self.get_db()
-        cursor.execute("SELECT password FROM users WHERE username=?", (user,))
-        res = cursor.fetchone()
-        conn.close()
+        password = self.db.password(user)
         
-        if res and res[0] == pwd:
+        if password is not None and password == pwd:
             self.win.destroy()
             self.root.deiconify()
-            CasinoApp(self.root, user)
+            CasinoApp(self.root, user, self.db)
         else:
             messagebox.showerror("Error", "Invalid credentials", parent=self.win)
 
@@ -484,18 +648,16 @@ class LoginWindow:
             messagebox.showerror("Error", "Fields cannot be empty", parent=self.win)
             return
             
-        conn, cursor = self.get_db()
         try:
-            cursor.execute("INSERT INTO users (username, password, balance) VALUES (?, ?, 1000)", (user, pwd))
-            conn.commit()
+            self.db.add_user(user, pwd)
             messagebox.showinfo("Success", "Registered! Please Login.", parent=self.win)
         except sqlite3.IntegrityError:
             messagebox.showerror("Error", "Username already exists", parent=self.win)
-        finally:
-            conn.close()
 
 if __name__ == "__main__":
+    db = CasinoDB()
     root = tk.Tk()
     root.withdraw()
-    LoginWindow(root)
-    root.mainloop()
\ No newline at end of file
+    LoginWindow(root, db)
+    root.mainloop()
+    db.close()
\ No newline at end of file
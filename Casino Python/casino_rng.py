@@ -0,0 +1,125 @@
+import random
+import secrets
+import sys
+from array import array
+
+BLOCK = 16384
+WORD_RANGE = 1 << 32
+
+
+def new_seed():
+    # Fits an SQLite INTEGER.
+    return secrets.randbits(63)
+
+
+class RNGStream(random.Random):
+    # A seeded stream of 32-bit words, generated BLOCK words at a time.
+    # Block n comes from its own generator seeded with the stream seed and
+    # n, so `position` (words used so far) is all it takes to pick a stream
+    # up again: seek(position) repeats everything drawn from there on
+    # without regenerating the words before it. Every random.Random method
+    # draws from the stream, so it can stand in wherever `random` is used.
+    def __init__(self, seed=None):
+        self.block_number = None
+        super().__init__(seed)
+
+    def seed(self, seed=None):
+        if seed is None:
+            seed = new_seed()
+        if not isinstance(seed, int) or seed < 0:
+            raise ValueError("A stream seed must be a non-negative integer.")
+        self.seed_value = seed
+        self.block_number = None
+        self.seek(0)
+
+    def load(self, number):
+        self.raw = random.Random(self.seed_value << 64 | number).randbytes(BLOCK * 4)
+        self.words = array("I", self.raw)
+        if sys.byteorder == "big":
+            self.words.byteswap()
+        self.block_number = number
+
+    def seek(self, position):
+        number, self.offset = divmod(position, BLOCK)
+        if number != self.block_number:
+            self.load(number)
+
+    @property
+    def position(self):
+        return self.block_number * BLOCK + self.offset
+
+    def word(self):
+        if self.offset == BLOCK:
+            self.load(self.block_number + 1)
+            self.offset = 0
+        word = self.words[self.offset]
+        self.offset += 1
+        return word
+
+    def below(self, n):
+        # One word per draw, rejecting the top of the word range that would
+        # favour small results.
+        limit = WORD_RANGE - WORD_RANGE % n
+        while True:
+            word = self.word()
+            if word < limit:
+                return word % n
+
+    def shuffle(self, x):
+        # Fisher-Yates with the same draws as below(), kept inline since a
+        # new blackjack shoe takes hundreds of them.
+        words, offset = self.words, self.offset
+        for last in range(len(x) - 1, 0, -1):
+            n = last + 1
+            limit = WORD_RANGE - WORD_RANGE % n
+            while True:
+                if offset == BLOCK:
+                    self.load(self.block_number + 1)
+                    words, offset = self.words, 0
+                word = words[offset]
+                offset += 1
+                if word < limit:
+                    break
+            other = word % n
+            x[last], x[other] = x[other], x[last]
+        self.offset = offset
+
+    def randrange(self, start, stop=None, step=1):
+        if stop is None and step == 1 and 0 < start <= WORD_RANGE:
+            return self.below(start)
+        return super().randrange(start, stop, step)
+
+    def getrandbits(self, k):
+        if k <= 32:
+            return self.word() >> (32 - k)
+        words = (k + 31) // 32
+        value = 0
+        for _ in range(words):
+            value = value << 32 | self.word()
+        return value >> (words * 32 - k)
+
+    def random(self):
+        # 53 bits from two words, the way random.Random builds a float.
+        return ((self.word() >> 5) * 67108864 + (self.word() >> 6)) / 9007199254740992
+
+    def randbytes(self, n):
+        # Straight from the generated blocks, a word per four bytes.
+        chunks = []
+        words = (n + 3) // 4
+        while words:
+            if self.offset == BLOCK:
+                self.load(self.block_number + 1)
+                self.offset = 0
+            take = min(words, BLOCK - self.offset)
+            chunks.append(self.raw[self.offset * 4:(self.offset + take) * 4])
+            self.offset += take
+            words -= take
+        return b"".join(chunks)[:n]
+
+    def getstate(self):
+        return self.seed_value, self.position
+
+    def setstate(self, state):
+        seed, position = state
+        self.seed(seed)
+        self.seek(position)
@@ -0,0 +1,431 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+
+from blackjack import Deck, Hand, card_text, dealer_plays, outcome
+from casino_db import DB_FILE, BalanceWriter, CasinoDB
+from casino_rng import RNGStream
+from paytables import (BLACKJACK_DECKS, BLACKJACK_PAYS, BLACKJACK_PENETRATION, roulette_choice, roulette_color, roulette_multiplier,
+                       roulette_spin)
+
+HOST = "127.0.0.1"
+PORT = 8765
+BETTING_SECONDS = 10.0
+TURN_SECONDS = 15.0
+SEATS = 7
+BACKLOG = 4096
+# A client further behind than this on its messages is disconnected
+# rather than slowing the table down.
+MAX_BUFFER = 1 << 20
+OPS = ("register", "login", "join", "leave", "bet", "hit", "stand")
+
+
+# The protocol is one JSON object per line each way, with an "op" naming
+# the message. Clients send the OPS above; the server answers with
+# welcome, joined, betting, bet_placed, dealt, turn, hand, dealer, result,
+# settled and error messages.
+def encode(message):
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode()
+
+
+class Account:
+    # A player's balance is held here while they are logged in or have
+    # bets in rounds not yet written. Stakes come off at once, and a
+    # round's settlement writes what everyone who bet in it won or lost.
+    __slots__ = ("username", "balance", "connection", "open_bets")
+
+    def __init__(self, username, balance):
+        self.username = username
+        self.balance = balance
+        self.connection = None
+        self.open_bets = 0
+
+    def send(self, message):
+        if self.connection:
+            self.connection.send_line(encode(message))
+
+
+class Table:
+    # Rounds run back to back: bets are taken for betting_seconds, then
+    # the round is played, settled in one transaction and announced.
+    game = None
+    decks = None
+
+    def __init__(self, server, name):
+        self.server = server
+        self.name = name
+        self.players = set()
+        self.rng = RNGStream()
+        self.session = None
+        self.round = 0
+        self.bets = []
+        self.betting = False
+        self.closes_at = 0
+
+    def describe(self):
+        return {"name": self.name, "game": self.game, "players": len(self.players)}
+
+    def broadcast(self, message):
+        # Encoded once however many players are watching.
+        line = encode(message)
+        for connection in list(self.players):
+            connection.send_line(line)
+
+    def join(self, connection):
+        self.players.add(connection)
+        return True
+
+    def send_state(self, connection):
+        # Lets a player who joins mid-round bet on it.
+        if self.betting:
+            connection.send({"op": "betting", "table": self.name, "round": self.round,
+                             "seconds": max(self.closes_at - asyncio.get_running_loop().time(), 0)})
+
+    def leave(self, connection):
+        self.players.discard(connection)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.round += 1
+            self.bets = []
+            self.betting = True
+            self.closes_at = loop.time() + self.server.betting_seconds
+            self.broadcast({"op": "betting", "table": self.name, "round": self.round, "seconds": self.server.betting_seconds})
+            await asyncio.sleep(self.server.betting_seconds)
+            self.betting = False
+            if self.bets:
+                try:
+                    await self.play_round()
+                except sqlite3.Error as e:
+                    self.broadcast({"op": "error", "message": f"Round {self.round} was called off: {e}"})
+
+    def take_stake(self, connection, message):
+        # The stake, or None after telling the player why not.
+        amount = message.get("amount")
+        if not self.betting:
+            connection.send({"op": "error", "message": "Bets are closed for this round."})
+        elif type(amount) is not int or amount <= 0:
+            connection.send({"op": "error", "message": "Bet must be a whole number greater than 0."})
+        elif amount > connection.account.balance:
+            connection.send({"op": "error", "message": "You don't have enough money for this bet."})
+        else:
+            return amount
+        return None
+
+    def stake_taken(self, account, amount):
+        account.balance -= amount
+        account.open_bets += 1
+        account.send({"op": "bet_placed", "table": self.name, "round": self.round, "amount": amount, "balance": account.balance})
+
+    async def settle(self, settled):
+        # settled: (account, stake, payout, detail, stream position, cards
+        # dealt) per bet. If the round cannot be written it is called off:
+        # the stakes go back. Stakes were only taken in memory, so a round
+        # writes each player's payouts less stakes.
+        changes = {}
+        for account, stake, payout, *_ in settled:
+            account.balance += payout
+            changes[account.username] = changes.get(account.username, 0) + payout - stake
+        try:
+            await self.server.settle_round(
+                changes,
+                [(account.username, self.game) + tuple(bet) for account, *bet in settled],
+                self.session,
+            )
+        except sqlite3.Error:
+            for account, stake, payout, *_ in settled:
+                account.balance += stake - payout
+            raise
+        finally:
+            for account, *_ in settled:
+                account.open_bets -= 1
+
+    def notify(self, settled):
+        for account, stake, payout, detail, *_ in settled:
+            account.send({"op": "settled", "table": self.name, "round": self.round, "stake": stake, "payout": payout,
+                          "detail": detail, "balance": account.balance})
+
+
+class RouletteTable(Table):
+    # Any number of players, each with any number of bets on one spin.
+    game = "roulette"
+
+    def bet(self, connection, message):
+        amount = self.take_stake(connection, message)
+        if amount is None:
+            return
+        bet_type = message.get("bet_type")
+        try:
+            choice = roulette_choice(bet_type, str(message.get("choice")))
+        except ValueError as e:
+            connection.send({"op": "error", "message": str(e)})
+            return
+        self.bets.append((connection.account, amount, bet_type, choice))
+        self.stake_taken(connection.account, amount)
+
+    async def play_round(self):
+        position = self.rng.position
+        number = roulette_spin(self.rng)
+        color = roulette_color(number)
+        settled = [
+            (account, stake, stake * roulette_multiplier(bet_type, choice, number), f"{bet_type} {choice}, {color} {number}", position, None)
+            for account, stake, bet_type, choice in self.bets
+        ]
+        # The result is only announced once it is on disk.
+        await self.settle(settled)
+        self.broadcast({"op": "result", "table": self.name, "round": self.round, "number": number, "color": color})
+        self.notify(settled)
+
+
+class BlackjackTable(Table):
+    # Up to SEATS players, one bet each a round, against one dealer hand.
+    # Seats are dealt and take their turns in the order the bets came in,
+    # the order replay.py deals them in.
+    game = "blackjack"
+    decks = BLACKJACK_DECKS
+
+    def __init__(self, server, name):
+        super().__init__(server, name)
+        self.deck = Deck(self.rng, self.decks, BLACKJACK_PENETRATION)
+        self.turn = None
+        self.decision = None
+
+    def join(self, connection):
+        if len(self.players) >= SEATS:
+            connection.send({"op": "error", "message": "This table is full."})
+            return False
+        return super().join(connection)
+
+    def leave(self, connection):
+        super().leave(connection)
+        if self.turn is connection.account:
+            self.decide(connection, "stand")
+
+    def bet(self, connection, message):
+        amount = self.take_stake(connection, message)
+        if amount is None:
+            return
+        if any(account is connection.account for account, _ in self.bets):
+            connection.send({"op": "error", "message": "You already have a bet on this hand."})
+            return
+        if len(self.bets) >= SEATS:
+            connection.send({"op": "error", "message": "Every seat has a bet on this hand."})
+            return
+        self.bets.append((connection.account, amount))
+        self.stake_taken(connection.account, amount)
+
+    def decide(self, connection, op):
+        if self.turn is not connection.account or self.decision is None or self.decision.done():
+            connection.send({"op": "error", "message": "It is not your turn."})
+            return
+        self.decision.set_result(op)
+
+    def show(self, account, hand):
+        self.broadcast({"op": "hand", "table": self.name, "username": account.username, "cards": str(hand), "score": hand.score()})
+
+    async def play_round(self):
+        deck = self.deck
+        shuffled = deck.start_round(len(self.bets) + 1)
+        position, dealt = deck.shuffled_at, deck.dealt
+        hands = [Hand([deck.draw(), deck.draw()]) for _ in self.bets]
+        dealer = Hand([deck.draw(), deck.draw()])
+        self.broadcast({"op": "dealt", "table": self.name, "round": self.round, "shuffled": shuffled, "dealer": card_text(dealer.cards[0]),
+                        "hands": {account.username: str(hand) for (account, _), hand in zip(self.bets, hands)}})
+        loop = asyncio.get_running_loop()
+        for (account, _), hand in zip(self.bets, hands):
+            self.turn = account
+            # A player who has left the table stands.
+            while hand.score() < 21 and account.connection and account.connection.table is self:
+                self.decision = loop.create_future()
+                self.broadcast({"op": "turn", "table": self.name, "username": account.username, "score": hand.score(),
+                                "seconds": self.server.turn_seconds})
+                try:
+                    op = await asyncio.wait_for(self.decision, self.server.turn_seconds)
+                except asyncio.TimeoutError:
+                    op = "stand"
+                if op != "hit":
+                    break
+                hand.add(deck.draw())
+                self.show(account, hand)
+        self.turn = self.decision = None
+        if any(hand.score() <= 21 for hand in hands):
+            dealer_plays(dealer, deck.draw)
+        settled = []
+        for (account, stake), hand in zip(self.bets, hands):
+            result = outcome(hand.state, dealer.state)
+            settled.append((account, stake, stake * BLACKJACK_PAYS[result], f"{hand} v {dealer}: {result}", position, dealt))
+        await self.settle(settled)
+        self.broadcast({"op": "dealer", "table": self.name, "cards": str(dealer), "score": dealer.score()})
+        self.notify(settled)
+
+
+class Connection:
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.account = None
+        self.table = None
+
+    def send(self, message):
+        self.send_line(encode(message))
+
+    def send_line(self, line):
+        if self.writer.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            self.writer.close()
+            return
+        self.writer.write(line)
+
+    async def serve(self):
+        try:
+            while line := await self.reader.readline():
+                try:
+                    message = json.loads(line)
+                    op = message["op"]
+                except (ValueError, TypeError, KeyError):
+                    self.send({"op": "error", "message": "Send one JSON object with an op per line."})
+                    continue
+                if op not in OPS:
+                    self.send({"op": "error", "message": f"Unknown op {op!r}."})
+                elif op not in ("register", "login") and self.account is None:
+                    self.send({"op": "error", "message": "Log in first."})
+                else:
+                    getattr(self, "on_" + op)(message)
+        except (ConnectionError, ValueError):
+            # ValueError: a line longer than the reader's limit.
+            pass
+        finally:
+            self.on_leave({})
+            if self.account:
+                self.account.connection = None
+            self.writer.close()
+
+    def on_register(self, message):
+        username, password = message.get("username"), message.get("password")
+        if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
+            self.send({"op": "error", "message": "Fields cannot be empty"})
+            return
+        try:
+            self.server.db.add_user(username, password)
+        except sqlite3.IntegrityError:
+            self.send({"op": "error", "message": "Username already exists"})
+            return
+        self.send({"op": "registered", "username": username})
+
+    def on_login(self, message):
+        username = message.get("username")
+        password = self.server.db.password(username) if isinstance(username, str) else None
+        if self.account or password is None or password != message.get("password"):
+            self.send({"op": "error", "message": "Invalid credentials"})
+            return
+        account = self.server.accounts.get(username)
+        if account and account.connection:
+            self.send({"op": "error", "message": "Already logged in elsewhere."})
+            return
+        if account is None or not account.open_bets:
+            # The player may have played in casino_game.py since, so the
+            # balance is read again unless a round still owes it a write.
+            account = self.server.accounts[username] = Account(username, self.server.db.balance(username))
+        account.connection = self
+        self.account = account
+        self.send({"op": "welcome", "username": username, "balance": account.balance,
+                   "tables": [table.describe() for table in self.server.tables.values()]})
+
+    def on_join(self, message):
+        table = self.server.tables.get(message.get("table"))
+        if table is None:
+            self.send({"op": "error", "message": "No such table."})
+            return
+        self.on_leave({})
+        if table.join(self):
+            self.table = table
+            self.send({"op": "joined", "table": table.name, "game": table.game})
+            table.send_state(self)
+
+    def on_leave(self, message):
+        if self.table:
+            self.table.leave(self)
+            self.table = None
+
+    def on_bet(self, message):
+        if self.table is None:
+            self.send({"op": "error", "message": "Join a table first."})
+        else:
+            self.table.bet(self, message)
+
+    def on_hit(self, message):
+        if isinstance(self.table, BlackjackTable):
+            self.table.decide(self, "hit")
+
+    def on_stand(self, message):
+        if isinstance(self.table, BlackjackTable):
+            self.table.decide(self, "stand")
+
+
+class CasinoServer:
+    def __init__(self, db, roulette_tables=2, blackjack_tables=2, betting_seconds=BETTING_SECONDS, turn_seconds=TURN_SECONDS):
+        self.db = db
+        self.betting_seconds = betting_seconds
+        self.turn_seconds = turn_seconds
+        self.accounts = {}
+        self.tables = {}
+        for number in range(1, roulette_tables + 1):
+            self.tables[f"roulette-{number}"] = RouletteTable(self, f"roulette-{number}")
+        for number in range(1, blackjack_tables + 1):
+            self.tables[f"blackjack-{number}"] = BlackjackTable(self, f"blackjack-{number}")
+        self.tasks = []
+        self.write_lock = asyncio.Lock()
+
+    async def start(self, host=HOST, port=PORT):
+        for table in self.tables.values():
+            # A table's stream session is recorded under the table's name.
+            table.session = self.db.start_session(table.name, table.rng.seed_value, table.decks)
+            self.tasks.append(asyncio.create_task(table.run()))
+        return await asyncio.start_server(self.connect, host, port, backlog=BACKLOG)
+
+    async def connect(self, reader, writer):
+        await Connection(self, reader, writer).serve()
+
+    async def settle_round(self, changes, bets, session):
+        # One transaction per round, written from a worker thread so the
+        # tables keep running. Rounds from different tables take turns.
+        async with self.write_lock:
+            await asyncio.get_running_loop().run_in_executor(None, self.write_round, changes, bets, session)
+
+    def write_round(self, changes, bets, session):
+        with self.db.pooled() as conn:
+            BalanceWriter(conn).settle_round(changes, bets, session)
+
+
+async def serve(args):
+    db = CasinoDB(args.db)
+    try:
+        server = CasinoServer(db, args.roulette_tables, args.blackjack_tables, args.betting_seconds, args.turn_seconds)
+        listener = await server.start(args.host, args.port)
+        print(f"Serving {len(server.tables)} tables on {args.host}:{args.port}: {', '.join(server.tables)}")
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        # Stakes of rounds still open were never written, so nobody loses
+        # them when the server stops.
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared casino tables over TCP, one JSON message per line.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--roulette-tables", type=int, default=2)
+    parser.add_argument("--blackjack-tables", type=int, default=2)
+    parser.add_argument("--betting-seconds", type=float, default=BETTING_SECONDS)
+    parser.add_argument("--turn-seconds", type=float, default=TURN_SECONDS)
+    parser.add_argument("--db", default=DB_FILE)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,72 @@
+from collections import Counter
+from itertools import product
+
+# The rules of every game live here, so the GUI and the RTP simulator
+# always pay out the same. Multipliers are what comes back for a stake of
+# 1, the stake itself included.
+SLOT_SYMBOLS = ["🍒", "🍋", "🔔", "💎", "7️⃣", "🍇"]
+SLOT_REELS = 3
+# Most reels showing the same symbol -> multiplier.
+SLOT_PAYS = {3: 10, 2: 2}
+# Every reel combination, all equally likely; a spin draws one.
+SLOT_COMBINATIONS = list(product(SLOT_SYMBOLS, repeat=SLOT_REELS))
+
+ROULETTE_POCKETS = 37
+RED_NUMBERS = {1, 3, 5, 7, 9, 12, 14, 16, 18, 19, 21, 23, 25, 27, 30, 32, 34, 36}
+ROULETTE_PAYS = {"color": 2, "number": 36}
+
+# Blackjack pays even money with no bonus for a natural; the dealer draws
+# to DEALER_STANDS and stands on soft totals too.
+BLACKJACK_PAYS = {"win": 2, "push": 1, "lose": 0}
+DEALER_STANDS = 17
+# Dealt from a six-deck shoe with the cut card three quarters of the way in.
+BLACKJACK_DECKS = 6
+BLACKJACK_PENETRATION = 0.75
+
+
+def slot_matches(reels):
+    return max(Counter(reels).values())
+
+
+def slot_multiplier(reels):
+    return SLOT_PAYS.get(slot_matches(reels), 0)
+
+
+def slot_spin(rng):
+    # Each game draws from the RNG stream only through these, so a bet can
+    # be replayed from the stream position it started at. A slot spin is an
+    # index into SLOT_COMBINATIONS.
+    return rng.randrange(len(SLOT_COMBINATIONS))
+
+
+def roulette_spin(rng):
+    return rng.randrange(ROULETTE_POCKETS)
+
+
+def roulette_color(number):
+    if number in RED_NUMBERS:
+        return "Red"
+    return "Black" if number != 0 else "Green"
+
+
+def roulette_choice(bet_type, text):
+    # Raises ValueError for a pick the wheel cannot land on.
+    if bet_type == "color":
+        choice = text.capitalize()
+        if choice not in ("Red", "Black"):
+            raise ValueError("Pick Red or Black.")
+        return choice
+    if bet_type != "number":
+        raise ValueError("Bet on a color or a number.")
+    choice = int(text) if text.strip().isdigit() else -1
+    if not 0 <= choice < ROULETTE_POCKETS:
+        raise ValueError(f"Pick a number from 0 to {ROULETTE_POCKETS - 1}.")
+    return choice
+
+
+def roulette_multiplier(bet_type, choice, number):
+    if bet_type == "color":
+        won = roulette_color(number) == choice
+    else:
+        won = choice == number
+    return ROULETTE_PAYS[bet_type] if won else 0
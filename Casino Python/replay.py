@@ -0,0 +1,105 @@
+import argparse
+import sys
+
+from blackjack import DECK_SIZE, Deck, Hand, dealer_plays, outcome
+from casino_db import DB_FILE, CasinoDB
+from casino_rng import RNGStream
+from paytables import (BLACKJACK_PAYS, SLOT_COMBINATIONS, roulette_color, roulette_multiplier, roulette_spin,
+                       slot_multiplier, slot_spin)
+
+
+# Each game replays a bet the way the table played it, from the stream
+# position where the bet started, and returns (detail, payout) to compare
+# with what was recorded. The detail only supplies the player's choices.
+def replay_slots(rng, stake, detail):
+    reels = SLOT_COMBINATIONS[slot_spin(rng)]
+    return "".join(reels), stake * slot_multiplier(reels)
+
+
+def replay_roulette(rng, stake, detail):
+    bet_type, chosen = detail.split(", ")[0].split(" ", 1)
+    if bet_type == "number":
+        chosen = int(chosen)
+    number = roulette_spin(rng)
+    return f"{bet_type} {chosen}, {roulette_color(number)} {number}", stake * roulette_multiplier(bet_type, chosen, number)
+
+
+def fresh_deck(rng):
+    # Bets from before the shoe (no `dealt`) had a fresh deck each hand,
+    # dealt by partial Fisher-Yates: one draw per card.
+    cards = list(range(DECK_SIZE))
+
+    def draw():
+        position = rng.below(len(cards))
+        cards[position], cards[-1] = cards[-1], cards[position]
+        return cards.pop()
+    return draw
+
+
+def replay_blackjack(draw, seats):
+    # A whole round, as a list of (stake, detail) in seat order; the window
+    # is a table with one seat. Each seat is dealt two cards in turn, then
+    # the dealer two. Each seat then hits until it holds as many cards as
+    # its record shows, and the dealer plays unless every seat has bust.
+    hands = [Hand([draw(), draw()]) for _ in seats]
+    dealer = Hand([draw(), draw()])
+    for hand, (stake, detail) in zip(hands, seats):
+        while len(hand.cards) < len(detail.split(" v ")[0].split()):
+            hand.add(draw())
+    if any(hand.score() <= 21 for hand in hands):
+        dealer_plays(dealer, draw)
+    results = []
+    for hand, (stake, detail) in zip(hands, seats):
+        result = outcome(hand.state, dealer.state)
+        results.append((f"{hand} v {dealer}: {result}", stake * BLACKJACK_PAYS[result]))
+    return results
+
+
+REPLAYS = {"slots": replay_slots, "roulette": replay_roulette}
+
+
+def replay(db, bets):
+    # Yields (bet, replayed detail, replayed payout); one stream per seed.
+    streams = {}
+    for bet in bets:
+        rng = streams.get(bet["seed"])
+        if rng is None:
+            rng = streams[bet["seed"]] = RNGStream(bet["seed"])
+        rng.seek(bet["position"])
+        if bet["game"] == "blackjack":
+            if bet["dealt"] is None:
+                draw = fresh_deck(rng)
+            else:
+                # Re-shuffles the shoe at its position, then skips the cards
+                # dealt before the round.
+                shoe = Deck(rng, bet["decks"])
+                shoe.dealt = bet["dealt"]
+                draw = shoe.draw
+            seats = db.round_bets(bet["session"], bet["position"], bet["dealt"])
+            results = replay_blackjack(draw, [(stake, detail) for _, stake, detail in seats])
+            yield (bet,) + results[[bet_id for bet_id, _, _ in seats].index(bet["id"])]
+        else:
+            yield (bet,) + REPLAYS[bet["game"]](rng, bet["stake"], bet["detail"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded bets from their RNG streams and check the results.")
+    parser.add_argument("username", nargs="?", help="replay this player's bets (default: everyone's)")
+    parser.add_argument("--bet", type=int, help="replay only the bet with this id")
+    parser.add_argument("--last", type=int, default=20, help="how many of the newest bets to replay")
+    parser.add_argument("--db", default=DB_FILE)
+    args = parser.parse_args()
+    db = CasinoDB(args.db)
+    mismatches = 0
+    try:
+        bets = db.replayable_bets(args.username, args.bet, args.last)
+        for bet, detail, payout in replay(db, reversed(bets)):
+            matched = (detail, payout) == (bet["detail"], bet["payout"])
+            mismatches += not matched
+            print(f"#{bet['id']:<8} {bet['time'][:19]}  {bet['username']:<12} {bet['game']:<9} "
+                  f"stake {bet['stake']:>6} payout {bet['payout']:>7}  {bet['detail']}  "
+                  + ("ok" if matched else f"MISMATCH: replayed {detail}, payout {payout}"))
+    finally:
+        db.close()
+    print(f"{len(bets) - mismatches} of {len(bets)} bets replayed exactly.")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,122 @@
+import argparse
+import math
+import time
+from itertools import accumulate
+
+from casino_rng import RNGStream, new_seed
+from paytables import ROULETTE_POCKETS, SLOT_COMBINATIONS, roulette_choice, roulette_multiplier, slot_multiplier
+
+BLOCK = 10000000
+RUIN_MARKS = (10, 100, 1000, 10000)
+
+
+def slot_outcomes():
+    # The multiplier of each equally likely reel combination.
+    return [slot_multiplier(reels) for reels in SLOT_COMBINATIONS]
+
+
+def roulette_outcomes(bet_type, choice):
+    return [roulette_multiplier(bet_type, choice, number) for number in range(ROULETTE_POCKETS)]
+
+
+def exact_stats(outcomes):
+    # (RTP, variance, hit frequency) per stake of 1, straight from the table.
+    mean = sum(outcomes) / len(outcomes)
+    variance = sum(m * m for m in outcomes) / len(outcomes) - mean * mean
+    hits = sum(1 for m in outcomes if m) / len(outcomes)
+    return mean, variance, hits
+
+
+class OutcomeDraw:
+    # Draws spins as one byte each, so a whole batch is drawn and scored by
+    # bytes methods that run in C: random bytes past the last full multiple
+    # of the outcome count are dropped, and the rest are translated straight
+    # to their multiplier.
+    def __init__(self, outcomes, rng):
+        if len(outcomes) > 256 or max(outcomes) > 255:
+            raise ValueError("Each spin's outcome and multiplier must fit in a byte.")
+        usable = 256 // len(outcomes) * len(outcomes)
+        self.rng = rng
+        self.acceptance = usable / 256
+        self.rejects = bytes(range(usable, 256))
+        self.table = bytes(outcomes[value % len(outcomes)] if value < usable else 0 for value in range(256))
+
+    def draw(self, count):
+        spins = b""
+        while len(spins) < count:
+            wanted = int((count - len(spins)) / self.acceptance) + 64
+            spins += self.rng.randbytes(wanted).translate(None, self.rejects)
+        return spins[:count].translate(self.table)
+
+
+def simulate(outcomes, spins, seed=None, block=BLOCK):
+    draw = OutcomeDraw(outcomes, RNGStream(seed))
+    counts = dict.fromkeys(sorted(set(outcomes) - {0}), 0)
+    done = 0
+    while done < spins:
+        size = min(block, spins - done)
+        batch = draw.draw(size)
+        for multiplier in counts:
+            counts[multiplier] += batch.count(multiplier)
+        done += size
+    mean = sum(m * count for m, count in counts.items()) / spins
+    variance = sum(m * m * count for m, count in counts.items()) / spins - mean * mean
+    return mean, variance, sum(counts.values()) / spins
+
+
+def ruin_curve(outcomes, bankroll, horizon, players, seed=None):
+    # Each player starts with `bankroll` stakes and bets one a spin. Item t
+    # is the share of players who could no longer cover a stake after t + 1
+    # spins.
+    draw = OutcomeDraw(outcomes, RNGStream(seed))
+    first_ruin = [0] * horizon
+    for _ in range(players):
+        balance = bankroll
+        for spin, multiplier in enumerate(draw.draw(horizon)):
+            balance += multiplier - 1
+            if balance < 1:
+                first_ruin[spin] += 1
+                break
+    return [ruined / players for ruined in accumulate(first_ruin)]
+
+
+def print_report(name, outcomes, spins, seed, bankroll, horizon, players):
+    start = time.perf_counter()
+    simulated = simulate(outcomes, spins, seed)
+    elapsed = time.perf_counter() - start
+    exact = exact_stats(outcomes)
+    error = math.sqrt(exact[1] / spins)
+    print(f"{name}: {spins:,} spins in {elapsed:.1f}s ({spins / elapsed / 1e6:,.1f}M spins/s), seed {seed}")
+    print(f"{'':>15} {'simulated':>12} {'exact':>12}")
+    print(f"{'RTP':>15} {simulated[0]:>12.4%} {exact[0]:>12.4%}   standard error {error:.4%}, "
+          f"off by {abs(simulated[0] - exact[0]) / error:.1f} errors")
+    print(f"{'house edge':>15} {1 - simulated[0]:>12.4%} {1 - exact[0]:>12.4%}")
+    print(f"{'variance':>15} {simulated[1]:>12.4f} {exact[1]:>12.4f}")
+    print(f"{'hit frequency':>15} {simulated[2]:>12.4%} {exact[2]:>12.4%}")
+    curve = ruin_curve(outcomes, bankroll, horizon, players, seed)
+    marks = [mark for mark in RUIN_MARKS if mark < horizon] + [horizon]
+    print(f"ruined with a bankroll of {bankroll} stakes ({players:,} players): "
+          + ", ".join(f"{curve[mark - 1]:.1%} after {mark:,}" for mark in marks))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo return-to-player for the casino games.")
+    parser.add_argument("game", choices=["slots", "roulette"])
+    parser.add_argument("--bet", choices=["color", "number"], default="color", help="roulette bet type (default: color)")
+    parser.add_argument("--choice", help="roulette color or number bet on (default: Red / 17)")
+    parser.add_argument("--spins", type=int, default=100000000)
+    parser.add_argument("--seed", type=int, help="repeat a run exactly")
+    parser.add_argument("--bankroll", type=int, default=20, help="starting stakes for the ruin curve")
+    parser.add_argument("--horizon", type=int, default=1000, help="spins per player for the ruin curve")
+    parser.add_argument("--players", type=int, default=2000, help="players for the ruin curve")
+    args = parser.parse_args()
+    if args.game == "slots":
+        name, outcomes = "slots", slot_outcomes()
+    else:
+        try:
+            choice = roulette_choice(args.bet, args.choice or ("Red" if args.bet == "color" else "17"))
+        except ValueError as e:
+            parser.error(str(e))
+        name, outcomes = f"roulette, {args.bet} bet on {choice}", roulette_outcomes(args.bet, choice)
+    seed = new_seed() if args.seed is None else args.seed
+    print_report(name, outcomes, args.spins, seed, args.bankroll, args.horizon, args.players)
@@ -1,26 +1,159 @@
-import sqlite3
-import os
+import argparse
+import csv
+import gzip
+import json
+import sys
 
-def view_data():
-    try:
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        db_path = os.path.join(base_dir, "casino_data.db")
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        print("\n=== USER DATABASE ===")
+from casino_db import DB_FILE, CasinoDB
+
+PAGE_SIZE = 20
+BATCH_SIZE = 1000
+EXPORT_COLUMNS = ["username", "balance"]
+
+
+def user_query(columns, min_balance=None, max_balance=None, after=None, limit=None):
+    # Filtering on balance walks idx_users_balance in (balance, username)
+    # order; otherwise the primary key gives username order. `after` is the
+    # last row's key, so each page starts with an index seek instead of
+    # skipping rows like OFFSET would.
+    clauses, params = [], []
+    if min_balance is not None:
+        clauses.append("balance >= ?")
+        params.append(min_balance)
+    if max_balance is not None:
+        clauses.append("balance <= ?")
+        params.append(max_balance)
+    by_balance = min_balance is not None or max_balance is not None
+    if after is not None:
+        clauses.append("(balance, username) > (?, ?)" if by_balance else "username > ?")
+        params.extend(after)
+    sql = f"SELECT {', '.join(columns)} FROM users"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY balance, username" if by_balance else " ORDER BY username"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params, by_balance
+
+
+def page(conn, min_balance=None, max_balance=None, after=None, size=PAGE_SIZE):
+    # Returns (rows, key of the last row) for rows of (username, password, balance).
+    sql, params, by_balance = user_query(["username", "password", "balance"], min_balance, max_balance, after, size)
+    rows = conn.execute(sql, params).fetchall()
+    if not rows:
+        return rows, None
+    last = rows[-1]
+    return rows, (last[2], last[0]) if by_balance else (last[0],)
+
+
+def browse(db, min_balance=None, max_balance=None):
+    # Enter for the next page, b to go back, q to quit. Earlier pages are
+    # found again from the keys they started after.
+    starts = [None]
+    while True:
+        rows, last = page(db.conn, min_balance, max_balance, starts[-1])
+        print(f"\n=== USER DATABASE (page {len(starts)}) ===")
         print(f"{'Username':<15} | {'Password':<15} | {'Balance'}")
         print("-" * 50)
-        
-        cursor.execute("SELECT * FROM users")
-        for row in cursor.fetchall():
+        for row in rows:
             print(f"{row[0]:<15} | {row[1]:<15} | {row[2]}")
-            
-        conn.close()
-        input("\nPress Enter to exit...")
-        
-    except Exception as e:
-        print(f"Failed to read database: {e}")
+        if not rows:
+            print("(no more users)")
+        choice = input("\n[Enter] next  [b] back  [q] quit: ").strip().lower()
+        if choice == "q":
+            return
+        if choice == "b":
+            if len(starts) > 1:
+                starts.pop()
+        elif len(rows) == PAGE_SIZE:
+            starts.append(last)
+
+
+def open_output(path, compress):
+    if path == "-":
+        return sys.stdout
+    if compress or path.endswith(".gz"):
+        return gzip.open(path, "wt", newline="", encoding="utf-8")
+    return open(path, "w", newline="", encoding="utf-8")
+
+
+def export(db, out, fmt, compress=False, min_balance=None, max_balance=None):
+    # Streams users BATCH_SIZE rows at a time, so memory stays flat however
+    # many players there are. Passwords are never exported.
+    sql, params, _ = user_query(EXPORT_COLUMNS, min_balance, max_balance)
+    cursor = db.conn.execute(sql, params)
+    count = 0
+    f = open_output(out, compress)
+    try:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_COLUMNS)
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            if fmt == "csv":
+                writer.writerows(rows)
+            else:
+                f.writelines(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows)
+            count += len(rows)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return count
+
+
+def show_stats(db, player=None, top=10):
+    print(f"\n=== TOP {top} BY NET PROFIT ===")
+    print(f"{'Username':<15} | {'Bets':>7} | {'Staked':>10} | {'Returned':>10} | {'Net':>9} | {'Best Win':>9}")
+    print("-" * 76)
+    for row in db.leaderboard("net", top):
+        print(f"{row['username']:<15} | {row['bets']:>7} | {row['staked']:>10} | {row['returned']:>10} | {row['net']:>9} | {row['biggest_win']:>9}")
+
+    if player:
+        stats = db.player_stats(player)
+        print(f"\n=== {player} ===")
+        if stats:
+            print(f"{stats['bets']} bets, {stats['staked']} staked, {stats['returned']} returned, net {stats['net']}, "
+                  f"biggest win {stats['biggest_win']}, last bet {stats['last_bet']}")
+            for game, time, stake, payout, detail in db.recent_bets(player):
+                print(f"  {time[:19]}  {game:<9} {stake:>7} -> {payout:>7}  {detail or ''}")
+        else:
+            print("No bets recorded.")
+
 
 if __name__ == "__main__":
-    view_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Browse, export and summarise the casino database.")
+    parser.add_argument("--db", default=DB_FILE, help="database file (default: casino_data.db next to this script)")
+    commands = parser.add_subparsers(dest="command")
+    browse_parser = commands.add_parser("browse", help="page through players (the default)")
+    export_parser = commands.add_parser("export", help="stream players to CSV or JSON lines")
+    export_parser.add_argument("out", help="output file, or - for stdout; a .gz name is compressed")
+    export_parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    export_parser.add_argument("--gzip", action="store_true", help="compress the output")
+    for command_parser in (browse_parser, export_parser):
+        command_parser.add_argument("--min-balance", type=int)
+        command_parser.add_argument("--max-balance", type=int)
+    stats_parser = commands.add_parser("stats", help="leaderboard and per-player stats")
+    stats_parser.add_argument("--player", help="also show this player's stats and recent bets")
+    stats_parser.add_argument("--top", type=int, default=10, help="leaderboard size (default: 10)")
+    args = parser.parse_args()
+
+    try:
+        db = CasinoDB(args.db)
+    except Exception as e:
+        print(f"Failed to read database: {e}")
+        sys.exit(1)
+    try:
+        if args.command == "export":
+            count = export(db, args.out, args.format, args.gzip, args.min_balance, args.max_balance)
+            print(f"Exported {count} players.", file=sys.stderr)
+        elif args.command == "stats":
+            show_stats(db, args.player, args.top)
+        else:
+            browse(db, getattr(args, "min_balance", None), getattr(args, "max_balance", None))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        db.close()